@@ -0,0 +1,275 @@
+# Benchmarks for Custom Data's decoding throughput, pattern compilation time and startup time.
+# Run `python benchmark.py --help` for usage. Results are written as JSON, so they can be tracked
+# over time; a readable summary goes to standard error.
+
+import argparse
+import gc
+import importlib
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from lib.replay import ReplayFrame, install_saleae_stand_in, create_analyzer
+
+install_saleae_stand_in()
+from custom_data_analyzer import CustomDataAnalyzer
+
+# These must be imported after the analyzer, which reloads them if they've changed
+from lib.pattern_tokenizer import Tokenizer
+from lib.pattern_parser import Parser
+from lib.pattern_cache import forget_loaded_files
+from lib.pattern_matcher import DEFAULT_MAX_CANDIDATES
+
+### Pattern corpora
+
+def protocol_patterns(count: int) -> str:
+    """Command patterns sharing a sync header, like a typical packet-based protocol."""
+
+    return "\n".join(
+        f"\"Cmd {i}: {{payload:s}}\" = xAA x55 x{i % 256:02X} x{i // 256:02X} len:. payload:(d4*.) crc:. ;"
+        for i in range(count)
+    )
+
+def nested_repeat_patterns() -> str:
+    """Deeply nested repeats."""
+
+    return "\n".join([
+        "\"Nested A\" = xAA d4*(d4*(d4*(x01 .))) ;",
+        "\"Nested B\" = x55 d3*(d3*(d3*(d3*(.)))) x02 ;",
+    ])
+
+def many_capture_patterns() -> str:
+    """Patterns with lots of captures."""
+
+    names = [f"c{i}" for i in range(20)]
+    text = " ".join(f"{{{n}}}" for n in names)
+    body = " ".join(f"{n}:." for n in names)
+    return f"\"Caps {text}\" = xAA {body} ;\n\"Caps short {{c0}}\" = x55 c0:(d8*.) ;"
+
+def wildcard_patterns(count: int) -> str:
+    """Patterns which start with wildcards, so could start on any datum."""
+
+    return "\n".join(f"\"Wild {i}\" = . . x{i:02X} . ;" for i in range(count))
+
+CORPORA: Dict[str, Callable[[], str]] = {
+    "protocol_10": lambda: protocol_patterns(10),
+    "protocol_100": lambda: protocol_patterns(100),
+    "protocol_1000": lambda: protocol_patterns(1000),
+    "nested_repeats": nested_repeat_patterns,
+    "many_captures": many_capture_patterns,
+    "wildcard_10": lambda: wildcard_patterns(10),
+}
+
+### Data streams
+
+def random_stream(rng: random.Random, length: int) -> List[int]:
+    """Uniformly random bytes."""
+    return [rng.randrange(256) for _ in range(length)]
+
+def protocol_stream(rng: random.Random, length: int) -> List[int]:
+    """Packets with sync headers, separated by occasional noise."""
+
+    data: List[int] = []
+    while len(data) < length:
+        command = rng.randrange(100)
+        data += [0xAA, 0x55, command % 256, command // 256, 4]
+        data += [rng.randrange(256) for _ in range(5)]
+        data += [rng.randrange(256) for _ in range(rng.randrange(3))]
+    return data[:length]
+
+def wildcard_heavy_stream(rng: random.Random, length: int) -> List[int]:
+    """Data from a tiny alphabet, so that many partial matches are always in flight."""
+    return [rng.choice([0xAA, 0x55, 0x01, 0x02]) for _ in range(length)]
+
+STREAMS: Dict[str, Callable[[random.Random, int], List[int]]] = {
+    "random": random_stream,
+    "protocol": protocol_stream,
+    "wildcard_heavy": wildcard_heavy_stream,
+}
+
+### Measurements
+
+def make_frames(data: List[int]) -> List[ReplayFrame]:
+    return [ReplayFrame("data", i * 1e-5, i * 1e-5 + 8e-6, { "data": bytes([d]) }) for i, d in enumerate(data)]
+
+def make_analyzer(source: str) -> Any:
+    return create_analyzer(CustomDataAnalyzer, input_analyzer_type="Async Serial", source_setting="Text", pattern_setting=source, word_width_setting="8", overlap_setting="First to finish", max_candidates_setting=DEFAULT_MAX_CANDIDATES, record_setting="")
+
+def in_flight(analyzer: Any) -> int:
+    """The number of partial matches currently being tracked by an analyzer."""
+
+    matcher = analyzer.matcher
+    return len(matcher.automaton.current_state.threads) + len(matcher.interpreter.candidates)
+
+def benchmark_decode(source: str, frames: List[ReplayFrame]) -> Dict[str, Any]:
+    """Measure decoding throughput, peak partial matches and memory use for one corpus and stream."""
+
+    # Throughput
+    analyzer = make_analyzer(source)
+    matches = 0
+    start = time.perf_counter()
+    for frame in frames:
+        if analyzer.decode(frame) is not None:
+            matches += 1
+    elapsed = time.perf_counter() - start
+
+    # Peak partial matches, measured separately so that it doesn't slow the above down
+    analyzer = make_analyzer(source)
+    peak_in_flight = 0
+    for frame in frames:
+        analyzer.decode(frame)
+        peak_in_flight = max(peak_in_flight, in_flight(analyzer))
+    pruned = analyzer.matcher.interpreter.pruned
+    evictions = analyzer.matcher.interpreter.evictions
+
+    # Memory. CPython doesn't count allocations as they happen, so report the net number of blocks
+    # left allocated by decoding, and the peak traced memory while doing so.
+    analyzer = make_analyzer(source)
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    for frame in frames:
+        analyzer.decode(frame)
+    _, peak_traced_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.collect()
+    blocks_after = sys.getallocatedblocks()
+
+    return {
+        "frames": len(frames),
+        "matches": matches,
+        "seconds": elapsed,
+        "frames_per_second": len(frames) / elapsed,
+        "peak_in_flight": peak_in_flight,
+        "pruned": pruned,
+        "evictions": evictions,
+        "peak_traced_bytes": peak_traced_bytes,
+        "retained_blocks_per_frame": (blocks_after - blocks_before) / len(frames),
+    }
+
+def benchmark_compile(source: str) -> Dict[str, Any]:
+    """Measure how long each stage of loading a pattern source takes."""
+
+    start = time.perf_counter()
+    tokens = Tokenizer(source).tokenize()
+    tokenized = time.perf_counter()
+    Parser(tokens).parse()
+    parsed = time.perf_counter()
+    forget_loaded_files()
+    make_analyzer(source)
+    constructed = time.perf_counter()
+
+    return {
+        "source_bytes": len(source),
+        "tokenize_seconds": tokenized - start,
+        "parse_seconds": parsed - tokenized,
+        "analyzer_init_seconds": constructed - parsed,
+    }
+
+def time_import(forget: Callable[[str], bool], repeats: int) -> float:
+    """
+    Measure the fastest of several imports of the analyzer, each after removing the modules chosen
+    by `forget` from those already imported. Imported modules are put back as they were afterwards.
+    """
+
+    original_modules = dict(sys.modules)
+    fastest = float("inf")
+    try:
+        for _ in range(repeats):
+            for name in [name for name in sys.modules if forget(name)]:
+                del sys.modules[name]
+            start = time.perf_counter()
+            importlib.import_module("custom_data_analyzer")
+            fastest = min(fastest, time.perf_counter() - start)
+    finally:
+        sys.modules.clear()
+        sys.modules.update(original_modules)
+    return fastest
+
+def benchmark_startup(source: str, repeats: int = 5) -> Dict[str, Any]:
+    """
+    Measure how long it takes to import the analyzer and construct it for one pattern source, both
+    for the first time and again, as Logic2 does whenever an analyzer is added or its settings change.
+    """
+
+    forget_loaded_files()
+    start = time.perf_counter()
+    make_analyzer(source)
+    first_init = time.perf_counter() - start
+
+    repeat_init = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        make_analyzer(source)
+        repeat_init = min(repeat_init, time.perf_counter() - start)
+
+    return {
+        "source_bytes": len(source),
+        "first_init_seconds": first_init,
+        "repeat_init_seconds": repeat_init,
+    }
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark Custom Data.")
+    parser.add_argument("-n", "--frames", type=int, default=20000, help="frames per decode benchmark (default: %(default)s)")
+    parser.add_argument("-c", "--corpus", action="append", choices=list(CORPORA), help="only run these corpora (repeatable)")
+    parser.add_argument("-s", "--stream", action="append", choices=list(STREAMS), help="only run these streams (repeatable)")
+    parser.add_argument("--compile-sizes", default="1000,10000", help="pattern counts for compilation benchmarks (default: %(default)s)")
+    parser.add_argument("--startup-sizes", default="0,10,1000", help="pattern counts for startup benchmarks (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for generated data (default: %(default)s)")
+    parser.add_argument("-o", "--output", default="-", help="file to write JSON results to (default: standard output)")
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.time(),
+            "frames": args.frames,
+            "seed": args.seed,
+        },
+        "decode": [],
+        "compile": [],
+        "startup": {},
+    }
+
+    for corpus_name in args.corpus or list(CORPORA):
+        source = CORPORA[corpus_name]()
+        for stream_name in args.stream or list(STREAMS):
+            frames = make_frames(STREAMS[stream_name](random.Random(args.seed), args.frames))
+            result = { "corpus": corpus_name, "stream": stream_name, **benchmark_decode(source, frames) }
+            results["decode"].append(result)
+            print(f"decode  {corpus_name:>16} {stream_name:>16}: {result['frames_per_second']:>10.0f} frames/s, peak in flight {result['peak_in_flight']}", file=sys.stderr)
+
+    for size in [int(s) for s in args.compile_sizes.split(",") if s]:
+        result = { "patterns": size, **benchmark_compile(protocol_patterns(size)) }
+        results["compile"].append(result)
+        print(f"compile {size:>16} patterns: tokenize {result['tokenize_seconds']:.3f}s, parse {result['parse_seconds']:.3f}s, init {result['analyzer_init_seconds']:.3f}s", file=sys.stderr)
+
+    # Importing for the first time runs all of the library, while importing again (as the "Reload
+    # Extension" button does) only needs to run the analyzer's own module if nothing has changed
+    results["startup"]["first_import_seconds"] = time_import(lambda name: name == "custom_data_analyzer" or name.startswith("lib."), 5)
+    results["startup"]["repeat_import_seconds"] = time_import(lambda name: name == "custom_data_analyzer", 5)
+    results["startup"]["init"] = []
+    print(f"startup import: first {results['startup']['first_import_seconds'] * 1000:.1f}ms, repeat {results['startup']['repeat_import_seconds'] * 1000:.1f}ms", file=sys.stderr)
+
+    for size in [int(s) for s in args.startup_sizes.split(",") if s]:
+        result = { "patterns": size, **benchmark_startup(protocol_patterns(size)) }
+        results["startup"]["init"].append(result)
+        print(f"startup {size:>16} patterns: first init {result['first_init_seconds'] * 1000:.1f}ms, repeat init {result['repeat_init_seconds'] * 1000:.1f}ms", file=sys.stderr)
+
+    if args.output == "-":
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
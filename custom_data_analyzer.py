@@ -1,44 +1,116 @@
-# Logic2 doesn't re-import libraries when using the "Reload Extension" button.
-# Force that to happen manually.
-import lib.pattern_tokens 
-import lib.errors
-import lib.pattern_element
-import lib.pattern_tokenizer
-import lib.pattern_parser
-import lib.byte_formatter
-import lib.data_extractor
+# Logic2 doesn't re-import libraries when using the "Reload Extension" button, so reload any which
+# have changed since they were loaded. Re-importing the extension without any changes, which Logic2
+# does often, then costs almost nothing.
 import importlib
-importlib.reload(lib.pattern_tokens)
-importlib.reload(lib.errors)
-importlib.reload(lib.pattern_element)
-importlib.reload(lib.pattern_tokenizer)
-importlib.reload(lib.pattern_parser)
-importlib.reload(lib.byte_formatter)
-importlib.reload(lib.data_extractor)
+import os
+import sys
+from types import ModuleType
+from typing import Dict, List, Optional
+
+# Each module comes after every module which it imports
+LIB_MODULES = [
+    "lib.pattern_tokens",
+    "lib.errors",
+    "lib.byte_formatter",
+    "lib.data_history",
+    "lib.name_template",
+    "lib.pattern_element",
+    "lib.pattern_tokenizer",
+    "lib.pattern_parser",
+    "lib.data_extractor",
+    "lib.datum_log",
+    "lib.prefix_index",
+    "lib.pattern_trie",
+    "lib.pattern_automaton",
+    "lib.pattern_matcher",
+    "lib.pattern_profiler",
+    "lib.pattern_source",
+    "lib.pattern_compiler",
+    "lib.pattern_cache",
+    "lib.annotation",
+]
+
+# Modules which are only needed for some settings, so are imported when they are first used
+LAZY_LIB_MODULES = ["lib.datum_log"]
+
+def source_modification_time(module: ModuleType) -> Optional[int]:
+    """Get the modification time (in nanoseconds) of a module's source file, or `None` if it has none."""
+
+    try:
+        return os.stat(module.__file__).st_mtime_ns if module.__file__ is not None else None
+    except OSError:
+        return None
 
-from typing import cast, Dict, List, Optional, Union
-from dataclasses import dataclass
+def import_lib_module(name: str) -> ModuleType:
+    """
+    Import a library module, remembering the modification time of its source if it hasn't been
+    imported before so that `reload_changed_lib_modules` can tell when it changes.
+    """
+
+    module = importlib.import_module(name)
+    if not hasattr(module, "__source_modification_time__"):
+        setattr(module, "__source_modification_time__", source_modification_time(module))
+    return module
+
+def reload_changed_lib_modules(names: List[str]) -> List[str]:
+    """
+    Reload each of the library modules which have already been imported and whose source has changed
+    since, along with every module after it, which might hold onto names from the old version.
+    Modules which haven't been imported yet are left to `import_lib_module`. Returns the names of
+    the modules which were reloaded.
+    """
+
+    reloaded: List[str] = []
+    for name in names:
+        module = sys.modules.get(name)
+        if module is None:
+            continue
+
+        modification_time = source_modification_time(module)
+        if reloaded or getattr(module, "__source_modification_time__", modification_time) != modification_time:
+            module = importlib.reload(module)
+            reloaded.append(name)
+        setattr(module, "__source_modification_time__", modification_time)
+    return reloaded
+
+reload_changed_lib_modules(LIB_MODULES)
+for name in LIB_MODULES:
+    if name not in LAZY_LIB_MODULES:
+        import_lib_module(name)
+
+from typing import cast, TYPE_CHECKING, Union
 
 from saleae.analyzers import HighLevelAnalyzer, AnalyzerFrame, StringSetting, NumberSetting, ChoicesSetting
 from saleae.data import SaleaeTime
 
-from lib.pattern_element import *
-from lib.pattern_tokenizer import Tokenizer
-from lib.pattern_parser import Parser
-from lib.byte_formatter import ByteFormatter
-from lib.errors import SourceError, CustomException
-from lib.data_extractor import InputAnalyzerType, extract_datum_from_frame
-
-@dataclass
-class PatternMatchCandidate:
-    pattern: PatternElement
-    env: PatternMatchEnvironment
-    start_time: SaleaeTime
+from lib.data_extractor import InputAnalyzerType, DATA_BOUNDARY, DatumExtractor, datum_extractor
+from lib.pattern_matcher import PatternMatcher, DEFAULT_MAX_CANDIDATES
+from lib.pattern_profiler import ProfilingPatternMatcher, ProfileWriter, profile_path_from_environment
+from lib.pattern_source import load_patterns
+from lib.pattern_cache import load_matcher
+from lib.annotation import annotate_match
+
+if TYPE_CHECKING:
+    from lib.datum_log import DatumLogWriter
+
+# How overlapping matches are chosen between, for each choice of the "Overlapping Matches" setting:
+# the most data a completed match can be held back for while waiting to see if a longer one
+# completes, or `None` to emit the first to complete straight away
+OVERLAP_CHOICES: Dict[str, Optional[int]] = {
+    "First to finish": None,
+    "Longest, within 16 data": 16,
+    "Longest, within 256 data": 256,
+    "Longest, within 4096 data": 4096,
+}
 
 class CustomDataAnalyzer(HighLevelAnalyzer):
     input_analyzer_type = ChoicesSetting(label="Input Analyzer Type", choices=[t.value for t in InputAnalyzerType])
     source_setting = ChoicesSetting(label="Pattern Source", choices=["Text", "File"])
     pattern_setting = StringSetting(label="Pattern or File Path")
+    word_width_setting = ChoicesSetting(label="Word Width (bits)", choices=["8", "16", "24", "32"])
+    overlap_setting = ChoicesSetting(label="Overlapping Matches", choices=list(OVERLAP_CHOICES))
+    max_candidates_setting = NumberSetting(label="Max Partial Matches (0 for default of 4096)", min_value=0)
+    record_setting = StringSetting(label="Record Data to File (optional)")
 
     # An optional list of types this analyzer produces, providing a way to customize the way frames are displayed in Logic 2.
     result_types = {
@@ -54,46 +126,46 @@ class CustomDataAnalyzer(HighLevelAnalyzer):
     def __init__(self) -> None:
         source_setting = cast(str, self.source_setting)
         pattern_setting = cast(str, self.pattern_setting)
+        word_width = int(cast(str, self.word_width_setting))
+        max_latency = OVERLAP_CHOICES[cast(str, self.overlap_setting)]
+
+        # Number settings have no default, so one which is unset or too small uses the matcher's
+        max_candidates_setting = self.max_candidates_setting
+        if isinstance(max_candidates_setting, (int, float)) and max_candidates_setting >= 1:
+            max_candidates = int(max_candidates_setting)
+        else:
+            max_candidates = DEFAULT_MAX_CANDIDATES
+
+        # Choose how to read data once, rather than on every frame
+        self.extract_datum = datum_extractor(cast(str, self.input_analyzer_type))
 
-        if source_setting == "Text":
-            source_name = "<text>"
-            pattern = pattern_setting
-        elif source_setting == "File":
-            source_name = pattern_setting
-            with open(pattern_setting, "r") as f:
-                pattern = f.read()
+        # Compile patterns, with profiling counters only if they've been asked for
+        profile_path = profile_path_from_environment()
+        if profile_path is None:
+            self.matcher = load_matcher(source_setting, pattern_setting, word_width, max_latency, max_candidates)
+            self.profile_writer = None
         else:
-            raise ValueError(f"unknown source: {source_setting}")
-
-        # Parse input patterns
-        try:
-            tokens = Tokenizer(pattern).tokenize()
-            patterns = Parser(tokens).parse()
-        except SourceError as e:
-            # Throw another exception with the info presented nicely
-            raise CustomException.from_syntax_error(e, source_name, pattern)
-
-        # Set up state
-        self.candidates = []
-
-        # Set up lookup tables for creating patterns
-        self.pattern_templates_by_start_hint = {}
-        self.pattern_templates_without_start_hint = []
-        for pat in patterns:
-            hints = pat.start_hint()
-            if hints is None:
-                self.pattern_templates_without_start_hint.append(pat)
-            else:
-                for hint in hints:
-                    if hint not in self.pattern_templates_by_start_hint:
-                        self.pattern_templates_by_start_hint[hint] = []
-                    self.pattern_templates_by_start_hint[hint].append(pat)
-
-    pattern_templates: List[PatternElement]
-    candidates: List[PatternMatchCandidate]
-
-    pattern_templates_by_start_hint: Dict[bytes, List[PatternElement]]
-    pattern_templates_without_start_hint: List[PatternElement]
+            patterns = load_patterns(source_setting, pattern_setting, word_width)
+            profiling_matcher: ProfilingPatternMatcher[SaleaeTime] = ProfilingPatternMatcher(patterns, max_candidates=max_candidates, word_width=word_width, max_latency=max_latency)
+            self.matcher = profiling_matcher
+            self.profile_writer = ProfileWriter(profiling_matcher.profiles, profile_path)
+
+        # Record extracted data if asked to, so that patterns can be re-matched later with
+        # `replay.py`. Logic2 doesn't say when a capture has finished, so the log is only
+        # completed when the analyzer is next re-created for the same path, or on exit.
+        record_path = cast(str, self.record_setting).strip()
+        self.recorder = None
+        self.record_origin = None
+        if record_path:
+            self.recorder = import_lib_module("lib.datum_log").DatumLogWriter(record_path, word_width)
+
+    extract_datum: DatumExtractor
+    matcher: PatternMatcher[SaleaeTime]
+    profile_writer: Optional[ProfileWriter]
+    recorder: Optional["DatumLogWriter"]
+
+    # The start time of the first datum recorded, which recorded times are relative to
+    record_origin: Optional[SaleaeTime]
 
     def decode(self, frame: AnalyzerFrame) -> Optional[Union[AnalyzerFrame, List[AnalyzerFrame]]]:
         '''
@@ -103,63 +175,31 @@ class CustomDataAnalyzer(HighLevelAnalyzer):
         '''
 
         # Find datum
-        datum = extract_datum_from_frame(cast(str, self.input_analyzer_type), frame)
+        datum = self.extract_datum(frame)
         if datum is None:
             return None
-        
-        # Create a new candidate for each pattern template
-        self.candidates.extend(
-            PatternMatchCandidate(pattern=p.copy_element(), env=PatternMatchEnvironment(), start_time=frame.start_time)
-            for p in self.pattern_templates_by_start_hint.get(datum, []) + self.pattern_templates_without_start_hint
-        )
-
-        # Pipe datum into each candidate
-        matches = []
-        for candidate in [*self.candidates]:
-            match_result = candidate.pattern.match(datum, candidate.env)
-            if match_result == PatternMatchResult.SUCCESS:
-                # This matched - store it in the list of matches so we can possibly make it into
-                # a frame later
-                matches.append(candidate)
-                self.candidates.remove(candidate)
-            elif match_result == PatternMatchResult.FAILURE:
-                # No match - remove it
-                self.candidates.remove(candidate)
-            elif match_result == PatternMatchResult.NEED_MORE:
-                # Could still match, we don't know yet. Keep it around
-                pass
-
-        if any(matches):
-            # Find the "longest" match
-            # TODO: more control over what to do?
-            matching_candidate = min(matches, key=lambda match: match.start_time)
-
-            # Discard other candidates.
-            # The one we just matched is marked with ~, others with -.
-            # None of these are allowed:
-            #  
-            #      |~~~~|           |~~~~|          |~~~~|
-            #        |---         |-------               |
-            #
-            # This isn't possible (because the match just ended, so we'd have to time-travel)
-            #
-            #      |~~~~|
-            #   |-----|
-            #
-            # That covers all possibilities, so empty the candidate list.
-            self.candidates.clear()
-
-            # Create our frame with a formatted message
-            if isinstance(matching_candidate.pattern, NamePatternElement):
-                format_captures = { k: ByteFormatter(data=v) for k, v in matching_candidate.env.captures.items() }
-                text = matching_candidate.pattern.name.format(**format_captures)
-                ty, data = "named", { "text": text }
-            else:
-                ty, data = "unnamed", {}
-
-            return AnalyzerFrame(ty, matching_candidate.start_time, frame.end_time, data)
-        
-        return None
 
+        if datum == DATA_BOUNDARY:
+            if self.recorder is not None:
+                self.recorder.append_boundary()
+
+            # Nothing in flight can match any more, so nothing held back can be beaten
+            matches = self.matcher.boundary()
+        else:
+            if self.recorder is not None:
+                if self.record_origin is None:
+                    self.record_origin = frame.start_time
+                self.recorder.append(datum, float(frame.start_time - self.record_origin), float(frame.end_time - self.record_origin))
+
+            # Longer matches can be held back, so several may be ready at once
+            matches = self.matcher.feed_all(datum, frame.start_time, frame.end_time)
+            if self.profile_writer is not None:
+                self.profile_writer.tick()
+        if not matches:
+            return None
 
-    
\ No newline at end of file
+        frames = []
+        for match in matches:
+            ty, data = annotate_match(match)
+            frames.append(AnalyzerFrame(ty, match.start_time, match.end_time, data))
+        return frames[0] if len(frames) == 1 else frames
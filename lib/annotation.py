@@ -0,0 +1,15 @@
+from typing import Dict, Tuple, TypeVar
+from .pattern_element import NamePatternElement
+from .pattern_matcher import PatternMatch
+
+T = TypeVar("T")
+
+def annotate_match(match: PatternMatch[T]) -> Tuple[str, Dict[str, object]]:
+    """Get the frame type and data to display for a match."""
+
+    # Create our frame with a formatted message
+    if isinstance(match.pattern, NamePatternElement):
+        text = match.pattern.template().render(match.captures, match.word_width)
+        return "named", { "text": text }
+    else:
+        return "unnamed", {}
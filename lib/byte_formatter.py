@@ -1,33 +1,65 @@
 from dataclasses import dataclass
+from typing import Sequence, Tuple
+
+# A sequence of data words, such as the data captured by a pattern
+Words = Tuple[int, ...]
+
+# The width of data words, in bits, unless configured otherwise
+DEFAULT_WORD_WIDTH = 8
+
+# The widest data words supported
+MAX_WORD_WIDTH = 64
+
+# The format specs which `ByteFormatter` understands
+FORMAT_SPECS = ("", "s", "L", "B")
+
+def words_to_integer(data: Sequence[int], little_endian: bool, width: int = DEFAULT_WORD_WIDTH) -> int:
+    """Interpret words of `width` bits as the digits of one unsigned integer."""
+
+    if little_endian:
+        data = data[::-1]
+
+    value = 0
+    for x in data:
+        value = value << width | x
+    return value
+
+def format_words(data: Sequence[int], spec: str, width: int = DEFAULT_WORD_WIDTH) -> str:
+    """Render words of `width` bits according to one of the `FORMAT_SPECS`."""
+
+    # Convention here is that lowercase options change formatting, while uppercase options
+    # change how the data is actually interpreted.
+
+    # Enough hex digits for any word
+    digits = (width + 3) // 4
+
+    if spec == "":
+        # By default, render as a "packed" hexadecimal sequence:
+        #   xABCDEF1234
+        return "x" + "".join(f"{x:0{digits}X}" for x in data)
+
+    elif spec == "s":
+        # Render the string with *s*pacing
+        #   xAB xCD xEF x12 x34
+        return " ".join(f"x{x:0{digits}X}" for x in data)
+
+    elif spec == "L":
+        # Interpret the string as a *l*ittle-endian integer, with the first word least significant
+        return str(words_to_integer(data, True, width))
+
+    elif spec == "B":
+        # Interpret the string as a *b*ittle-endian integer
+        return str(words_to_integer(data, False, width))
+
+    else:
+        raise ValueError(f"unknown string format spec: {spec}")
 
 @dataclass
 class ByteFormatter:
-    """Wraps a `bytes` instance to provide in-depth formatting control."""
+    """Wraps a sequence of words to provide in-depth formatting control."""
 
-    data: bytes
+    data: Sequence[int]
+    width: int = DEFAULT_WORD_WIDTH
 
     def __format__(self, spec: str) -> str:
-        # Convention here is that lowercase options change formatting, while uppercase options
-        # change how the data is actually interpreted.
-
-        if spec == "":
-            # By default, render as a "packed" hexadecimal sequence:
-            #   xABCDEF1234
-            return f"x{self.data.hex().upper()}"
-
-        elif spec == "s":
-            # Render the string with *s*pacing
-            #   xAB xCD xEF x12 x34
-            return " ".join(f"x{x:02X}" for x in self.data)
-        
-        elif spec == "L":
-            # Interpret the string as a *l*ittle-endian integer
-            return str(int.from_bytes(self.data, byteorder="little"))
-        
-        elif spec == "B":
-            # Interpret the string as a *b*ittle-endian integer
-            return str(int.from_bytes(self.data, byteorder="big"))
-
-        else:
-            raise ValueError(f"unknown string format spec: {spec}")
-        
\ No newline at end of file
+        return format_words(self.data, spec, self.width)
@@ -1,6 +1,5 @@
 from enum import Enum
-from saleae.analyzers import AnalyzerFrame
-from typing import Optional, cast
+from typing import Callable, Dict, Optional, Protocol, cast
 from .errors import CustomException
 
 class InputAnalyzerType(str, Enum):
@@ -8,26 +7,105 @@ class InputAnalyzerType(str, Enum):
     Each enum value is a friendly name."""
 
     ASYNC_SERIAL = "Async Serial"
+    ASYNC_SERIAL_ERRORS = "Async Serial (errors end matches)"
     SPI_MOSI = "SPI (use MOSI)"
     SPI_MISO = "SPI (use MISO)"
+    SPI_MOSI_MISO = "SPI (use MOSI then MISO)"
+    I2C = "I2C"
+    CAN = "CAN"
 
-def extract_datum_from_frame(ty: str, frame: AnalyzerFrame) -> Optional[bytes]:
-    """Extract relevant datum given a frame, based on the given type.
-    Returns `None` if this frame is valid but contains no data."""
-
-    try:
-        if ty == InputAnalyzerType.ASYNC_SERIAL.value:
-            return cast(bytes, frame.data["data"])
-        elif ty == InputAnalyzerType.SPI_MOSI.value:
-            if frame.type == "result":
-                return cast(bytes, frame.data["mosi"])
-        elif ty == InputAnalyzerType.SPI_MISO.value:
-            if frame.type == "result":
-                return cast(bytes, frame.data["miso"])
-        else:
-            raise ValueError(f"unknown input type '{ty}'")
-    except KeyError as e:
-        raise CustomException.from_analyzer_data_error(e, frame.data, ty)
-
-    # Data was found, but isn't relevant
-    return None
+class InputFrame(Protocol):
+    """The parts of a frame from the input analyzer which are needed to extract a datum.
+    `AnalyzerFrame` has these, and so does anything standing in for it outside of Logic2."""
+
+    type: str
+    data: Dict[str, object]
+
+# Extracted instead of a datum when a frame means that no match can continue past it, such as an
+# I2C stop condition. Data are never negative.
+DATA_BOUNDARY = -1
+
+# Extracts a datum from a frame, returning `None` if the frame is valid but contains no data, or
+# `DATA_BOUNDARY`
+DatumExtractor = Callable[[InputFrame], Optional[int]]
+
+def datum_extractor(ty: str) -> DatumExtractor:
+    """Get the function which extracts data from the frames of the given type of input analyzer.
+
+    Input analyzers give data as `bytes`, which may be several bytes long for wide words. These are
+    read as a big-endian word."""
+
+    if ty == InputAnalyzerType.ASYNC_SERIAL.value:
+        def extract(frame: InputFrame) -> Optional[int]:
+            try:
+                return word_from_bytes(cast(bytes, frame.data["data"]))
+            except KeyError as e:
+                raise CustomException.from_analyzer_data_error(e, frame.data, ty)
+
+    elif ty == InputAnalyzerType.ASYNC_SERIAL_ERRORS.value:
+        # Frames with framing or parity errors have an "error" field
+        def extract(frame: InputFrame) -> Optional[int]:
+            try:
+                if "error" in frame.data:
+                    return DATA_BOUNDARY
+                return word_from_bytes(cast(bytes, frame.data["data"]))
+            except KeyError as e:
+                raise CustomException.from_analyzer_data_error(e, frame.data, ty)
+
+    elif ty == InputAnalyzerType.SPI_MOSI.value or ty == InputAnalyzerType.SPI_MISO.value:
+        field = "mosi" if ty == InputAnalyzerType.SPI_MOSI.value else "miso"
+        def extract(frame: InputFrame) -> Optional[int]:
+            try:
+                if frame.type == "result":
+                    return word_from_bytes(cast(bytes, frame.data[field]))
+                return None
+            except KeyError as e:
+                raise CustomException.from_analyzer_data_error(e, frame.data, ty)
+
+    elif ty == InputAnalyzerType.SPI_MOSI_MISO.value:
+        # Both sides of a transfer form one word, so this needs a word width of twice the SPI word size
+        def extract(frame: InputFrame) -> Optional[int]:
+            try:
+                if frame.type == "result":
+                    return word_from_bytes(cast(bytes, frame.data["mosi"]) + cast(bytes, frame.data["miso"]))
+                return None
+            except KeyError as e:
+                raise CustomException.from_analyzer_data_error(e, frame.data, ty)
+
+    elif ty == InputAnalyzerType.I2C.value:
+        # A match can only be within the data of one transfer, between its address and the next
+        # start or stop condition
+        def extract(frame: InputFrame) -> Optional[int]:
+            try:
+                if frame.type == "data":
+                    return word_from_bytes(cast(bytes, frame.data["data"]))
+                if frame.type in ("address", "start", "stop"):
+                    return DATA_BOUNDARY
+                return None
+            except KeyError as e:
+                raise CustomException.from_analyzer_data_error(e, frame.data, ty)
+
+    elif ty == InputAnalyzerType.CAN.value:
+        # A match can only be within the data of one CAN frame. Logic2 gives each data byte as an
+        # integer, but it's read back from exports as bytes.
+        def extract(frame: InputFrame) -> Optional[int]:
+            try:
+                if frame.type == "data_field":
+                    data = frame.data["data"]
+                    return word_from_bytes(data) if isinstance(data, bytes) else cast(int, data)
+                if frame.type in ("identifier_field", "can_error"):
+                    return DATA_BOUNDARY
+                return None
+            except KeyError as e:
+                raise CustomException.from_analyzer_data_error(e, frame.data, ty)
+
+    else:
+        raise ValueError(f"unknown input type '{ty}'")
+
+    return extract
+
+def word_from_bytes(data: bytes) -> int:
+    # Single bytes are by far the most common, and indexing is much quicker than `int.from_bytes`
+    if len(data) == 1:
+        return data[0]
+    return int.from_bytes(data, byteorder="big")
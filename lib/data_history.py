@@ -0,0 +1,72 @@
+from array import array
+from typing import Generic, List, MutableSequence, TypeVar
+from .byte_formatter import DEFAULT_WORD_WIDTH, Words
+
+T = TypeVar("T")
+
+def word_typecode(width: int) -> str:
+    """Get the typecode of the smallest `array` which can hold words of `width` bits."""
+
+    for typecode in ("B", "H", "I", "L", "Q"):
+        if width <= array(typecode).itemsize * 8:
+            return typecode
+    raise ValueError(f"no array can hold {width}-bit words")
+
+class DataHistory(Generic[T]):
+    """
+    The data recently fed to a matcher, and the time each datum started, indexed by its position
+    in the whole stream.
+
+    Captures refer to ranges of this rather than copying data as they go, so that every candidate
+    shares one copy of the data, and words are only copied out for a match which is emitted. Old
+    data is discarded explicitly once nothing can refer to it.
+
+    Data is stored in an `array` sized for words of `width` bits, so doesn't hold an object per
+    datum.
+    """
+
+    def __init__(self, width: int = DEFAULT_WORD_WIDTH) -> None:
+        self.data: MutableSequence[int] = array(word_typecode(width))
+        self.times: List[T] = []
+
+        # The stream index of the first item in `data`
+        self.first_index = 0
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def end_index(self) -> int:
+        """The stream index which the next datum will have."""
+        return self.first_index + len(self.data)
+
+    def append(self, datum: int, time: T) -> None:
+        try:
+            self.data.append(datum)
+        except OverflowError:
+            # Wider than the words this was expecting, so fall back to storing any integer. Only a
+            # wildcard could match this datum, but it could still be captured.
+            self.data = list(self.data)
+            self.data.append(datum)
+        self.times.append(time)
+
+    def data_between(self, start: int, end: int) -> Words:
+        """Copy out the data from index `start` up to (but not including) `end`."""
+
+        assert start >= self.first_index, "data has already been discarded"
+        return tuple(self.data[start - self.first_index : end - self.first_index])
+
+    def time_at(self, index: int) -> T:
+        """Get the start time of the datum at an index."""
+
+        assert index >= self.first_index, "data has already been discarded"
+        return self.times[index - self.first_index]
+
+    def discard_before(self, index: int) -> None:
+        """Forget everything before an index."""
+
+        count = index - self.first_index
+        if count > 0:
+            del self.data[:count]
+            del self.times[:count]
+            self.first_index = index
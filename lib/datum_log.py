@@ -0,0 +1,288 @@
+import atexit
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+from .byte_formatter import DEFAULT_WORD_WIDTH, MAX_WORD_WIDTH
+from .data_extractor import DATA_BOUNDARY
+
+# A datum log starts with a header of (magic, format version, word width)
+LOG_MAGIC = b"CDATALOG"
+LOG_FORMAT_VERSION = 1
+LOG_HEADER = struct.Struct("<8sII")
+
+# Each datum is then a fixed-width record of (datum, start time, end time), with times in seconds
+# from the start of the first datum
+LOG_RECORD = struct.Struct("<Qdd")
+
+# The sparse time index, in a file alongside the log, has the start time of every this many records
+LOG_INDEX_INTERVAL = 1024
+LOG_INDEX_ENTRY = struct.Struct("<d")
+
+# Where the data was broken, such as between I2C transfers, so that no match may continue across it,
+# is in another file alongside the log. Each entry is the index of the record after the break.
+LOG_BOUNDARY_ENTRY = struct.Struct("<Q")
+
+# How many records to unpack at once when reading through a log
+LOG_READ_BLOCK = 4096
+
+# A datum read back from a log, as (datum, start time, end time)
+LogRecord = Tuple[int, float, float]
+
+def log_index_path(path: str) -> str:
+    return path + ".index"
+
+def log_boundaries_path(path: str) -> str:
+    return path + ".boundaries"
+
+# Writers which haven't been closed yet, by the absolute path of their log
+_open_writers: Dict[str, "DatumLogWriter"] = {}
+
+def close_open_writers() -> None:
+    """Close every datum log writer which hasn't been closed yet."""
+
+    for writer in list(_open_writers.values()):
+        writer.close()
+
+atexit.register(close_open_writers)
+
+class DatumLogWriter:
+    """
+    Records extracted data to a compact, append-only datum log, so that patterns can be re-matched
+    against a capture later without decoding it again. Open the result with `DatumLog`.
+
+    The log is written to a temporary file, which only replaces the one at `path` when `close` is
+    called. Any other writer for the same path which is still open is closed first, so a log always
+    holds the data of one writer. Writers still open when the process exits are closed then.
+    """
+
+    def __init__(self, path: str, word_width: int = DEFAULT_WORD_WIDTH) -> None:
+        if not 1 <= word_width <= MAX_WORD_WIDTH:
+            raise ValueError(f"word width must be between 1 and {MAX_WORD_WIDTH} bits, not {word_width}")
+
+        self.path = os.path.abspath(path)
+        previous = _open_writers.get(self.path)
+        if previous is not None:
+            previous.close()
+
+        self.temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        self.file: BinaryIO = open(self.temporary_path, "wb")
+        self.index_file: BinaryIO = open(log_index_path(self.temporary_path), "wb")
+        self.boundaries_file: BinaryIO = open(log_boundaries_path(self.temporary_path), "wb")
+        self.file.write(LOG_HEADER.pack(LOG_MAGIC, LOG_FORMAT_VERSION, word_width))
+        self.count = 0
+        self.last_boundary = 0
+        self.closed = False
+        _open_writers[self.path] = self
+
+    def append(self, datum: int, start_time: float, end_time: float) -> None:
+        """Add a datum to the end of the log."""
+
+        if self.count % LOG_INDEX_INTERVAL == 0:
+            # Flush along with each index entry, so that little is lost if the process is killed
+            self.file.flush()
+            self.index_file.write(LOG_INDEX_ENTRY.pack(start_time))
+            self.index_file.flush()
+
+        self.file.write(LOG_RECORD.pack(datum, start_time, end_time))
+        self.count += 1
+
+    def append_boundary(self) -> None:
+        """Note that no match may continue from the data appended so far to the data appended next."""
+
+        # A boundary before all data, or straight after another, changes nothing
+        if self.count != self.last_boundary:
+            self.boundaries_file.write(LOG_BOUNDARY_ENTRY.pack(self.count))
+            self.last_boundary = self.count
+
+    def close(self) -> None:
+        """
+        Write out everything which has been appended, and move the log to its path. Closing twice
+        is allowed.
+        """
+
+        if self.closed:
+            return
+        self.closed = True
+        if _open_writers.get(self.path) is self:
+            del _open_writers[self.path]
+
+        self.file.close()
+        self.index_file.close()
+        self.boundaries_file.close()
+
+        # Remove the old log's other files first, so that the new log is never read with them
+        for other_path in [log_index_path, log_boundaries_path]:
+            try:
+                os.remove(other_path(self.path))
+            except FileNotFoundError:
+                pass
+        os.replace(self.temporary_path, self.path)
+        for other_path in [log_index_path, log_boundaries_path]:
+            os.replace(other_path(self.temporary_path), other_path(self.path))
+
+    def __enter__(self) -> "DatumLogWriter":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+class DatumLog:
+    """
+    A datum log written by `DatumLogWriter`, memory-mapped so that only the parts being read are
+    loaded into memory.
+
+    A record which was only partly written, such as if the writer was interrupted, is ignored.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file: BinaryIO = open(path, "rb")
+        try:
+            header = self.file.read(LOG_HEADER.size)
+            if len(header) < LOG_HEADER.size or header[:len(LOG_MAGIC)] != LOG_MAGIC:
+                raise ValueError(f"'{path}' is not a datum log")
+
+            _, version, self.word_width = LOG_HEADER.unpack(header)
+            if version != LOG_FORMAT_VERSION:
+                raise ValueError(f"'{path}' is a datum log of unsupported version {version}")
+
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self.file.close()
+            raise
+
+        self.count = (len(self.map) - LOG_HEADER.size) // LOG_RECORD.size
+        self.index = self.load_index()
+        self.boundaries = self.load_boundaries()
+
+    def load_index(self) -> "array[float]":
+        """
+        Read the sparse time index. Any entries missing from its file, such as if the writer was
+        interrupted, are read from the records instead.
+        """
+
+        entries = (self.count + LOG_INDEX_INTERVAL - 1) // LOG_INDEX_INTERVAL
+
+        index = array("d")
+        try:
+            with open(log_index_path(self.path), "rb") as f:
+                index.frombytes(f.read(entries * LOG_INDEX_ENTRY.size))
+        except OSError:
+            pass
+
+        for entry in range(len(index), entries):
+            index.append(self.start_time(entry * LOG_INDEX_INTERVAL))
+        return index
+
+    def load_boundaries(self) -> "array[int]":
+        """
+        Read the indices of the records which no match may continue to from the record before. A log
+        without a boundaries file has no boundaries.
+        """
+
+        boundaries = array("Q")
+        try:
+            with open(log_boundaries_path(self.path), "rb") as f:
+                data = f.read()
+        except OSError:
+            return boundaries
+
+        boundaries.extend(
+            position
+            for position, in LOG_BOUNDARY_ENTRY.iter_unpack(data[:len(data) - len(data) % LOG_BOUNDARY_ENTRY.size])
+            if position < self.count
+        )
+        return boundaries
+
+    def __len__(self) -> int:
+        return self.count
+
+    def record(self, position: int) -> LogRecord:
+        """Read the record at an index."""
+
+        if not 0 <= position < self.count:
+            raise IndexError(f"record {position} is out of range")
+        datum, start_time, end_time = LOG_RECORD.unpack_from(self.map, LOG_HEADER.size + position * LOG_RECORD.size)
+        return datum, start_time, end_time
+
+    def start_time(self, position: int) -> float:
+        return self.record(position)[1]
+
+    def records(self, start: int = 0, stop: Optional[int] = None, boundaries: bool = False) -> Iterator[LogRecord]:
+        """
+        Read the records from index `start` up to `stop` (exclusive, or the end if not given), in order.
+
+        If `boundaries` is true, a record with the datum `DATA_BOUNDARY` comes before each record
+        which no match may continue to, as it would from `datum_extractor`.
+        """
+
+        if boundaries:
+            yield from self.records_with_boundaries(start, stop)
+            return
+
+        stop = self.count if stop is None else min(stop, self.count)
+        for block_start in range(start, stop, LOG_READ_BLOCK):
+            block_stop = min(block_start + LOG_READ_BLOCK, stop)
+            offset = LOG_HEADER.size + block_start * LOG_RECORD.size
+            yield from LOG_RECORD.iter_unpack(self.map[offset : offset + (block_stop - block_start) * LOG_RECORD.size])
+
+    def records_with_boundaries(self, start: int, stop: Optional[int]) -> Iterator[LogRecord]:
+        next_boundary = bisect_left(self.boundaries, start + 1)
+        following = self.boundaries[next_boundary] if next_boundary < len(self.boundaries) else None
+        for position, record in enumerate(self.records(start, stop), start):
+            if position == following:
+                yield DATA_BOUNDARY, record[1], record[1]
+                next_boundary += 1
+                following = self.boundaries[next_boundary] if next_boundary < len(self.boundaries) else None
+            yield record
+
+    def find(self, time: float) -> int:
+        """Get the index of the first record which starts at or after a time, or the log's length if none do."""
+
+        # Find the block of records between two index entries which the time is in...
+        low, high = 0, len(self.index)
+        while low < high:
+            middle = (low + high) // 2
+            if self.index[middle] < time:
+                low = middle + 1
+            else:
+                high = middle
+        if low == 0:
+            return 0
+
+        # ...then search only within that block
+        low, high = (low - 1) * LOG_INDEX_INTERVAL, min(low * LOG_INDEX_INTERVAL, self.count)
+        while low < high:
+            middle = (low + high) // 2
+            if self.start_time(middle) < time:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def close(self) -> None:
+        """
+        Close the log. If the records are still being used through a buffer, such as a NumPy array,
+        the mapping is left open until that is released.
+        """
+
+        try:
+            self.map.close()
+        except BufferError:
+            pass
+        self.file.close()
+
+    def __enter__(self) -> "DatumLog":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+def is_datum_log(path: str) -> bool:
+    """Check whether a file is a datum log, rather than some other kind of file."""
+
+    with open(path, "rb") as f:
+        return f.read(len(LOG_MAGIC)) == LOG_MAGIC
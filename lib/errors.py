@@ -43,6 +43,13 @@ class InvalidDatumError(SourceError):
     def explain(self) -> str:
         return self.reason
 
+@dataclass
+class InvalidNameError(SourceError):
+    reason: str
+
+    def explain(self) -> str:
+        return self.reason
+
 
 @dataclass
 class CustomException(Exception):
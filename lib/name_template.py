@@ -0,0 +1,62 @@
+from dataclasses import dataclass
+from string import Formatter
+from typing import Dict, FrozenSet, List, Tuple, Union
+from .byte_formatter import DEFAULT_WORD_WIDTH, FORMAT_SPECS, Words, format_words
+
+@dataclass(frozen=True)
+class TemplateSlot:
+    """A place in a name where a capture is interpolated."""
+
+    capture: str
+    spec: str
+
+@dataclass(frozen=True)
+class NameTemplate:
+    """
+    A pattern name, split up into its literal text and the captures interpolated into it, so that
+    it doesn't need to be parsed again for every match.
+
+    This renders the same as calling `str.format` on the name with a `ByteFormatter` for each
+    capture.
+    """
+
+    parts: Tuple[Union[str, TemplateSlot], ...]
+
+    @staticmethod
+    def parse(name: str) -> "NameTemplate":
+        """Parse a name, raising `ValueError` if it isn't valid."""
+
+        parts: List[Union[str, TemplateSlot]] = []
+        for literal, field_name, spec, conversion in Formatter().parse(name):
+            # Escaped braces split the literal text up, so join it back together
+            if literal and parts and isinstance(parts[-1], str):
+                parts[-1] += literal
+            elif literal:
+                parts.append(literal)
+            if field_name is None:
+                continue
+
+            if conversion is not None:
+                raise ValueError(f"conversion `!{conversion}` isn't supported in names")
+            if not field_name.isidentifier():
+                raise ValueError(f"`{{{field_name}}}` in name must refer to a capture by name")
+            if spec not in FORMAT_SPECS:
+                raise ValueError(f"unknown format specifier `{spec}` for capture `{field_name}` - expected one of: " + ", ".join(f"`{s}`" for s in FORMAT_SPECS if s))
+            parts.append(TemplateSlot(field_name, spec))
+
+        return NameTemplate(tuple(parts))
+
+    def captures(self) -> FrozenSet[str]:
+        """Get the names of the captures used by this template."""
+        return frozenset(part.capture for part in self.parts if isinstance(part, TemplateSlot))
+
+    def render(self, captures: Dict[str, Words], width: int = DEFAULT_WORD_WIDTH) -> str:
+        """Fill in this template with captures of `width`-bit words, formatting only those it uses."""
+
+        pieces = []
+        for part in self.parts:
+            if isinstance(part, str):
+                pieces.append(part)
+            else:
+                pieces.append(format_words(captures[part.capture], part.spec, width))
+        return "".join(pieces)
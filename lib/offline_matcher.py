@@ -0,0 +1,306 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar, Union
+import numpy as np
+from .datum_log import DatumLog, LOG_HEADER
+from .pattern_element import PatternElement, PatternMatchEnvironment, PatternMatchResult, MatchState, UNBOUNDED_LENGTH
+from .pattern_automaton import Alphabet, compile_program, compile_prefix, ANY_DATUM_MASK, OTHER_DATUM
+from .pattern_matcher import PatternMatch, pattern_ranks
+from .byte_formatter import DEFAULT_WORD_WIDTH
+
+T = TypeVar("T")
+
+# The layout of a datum log's records, matching `LOG_RECORD`
+LOG_RECORD_DTYPE = np.dtype([("datum", "<u8"), ("start_time", "<f8"), ("end_time", "<f8")])
+
+# How many data of a datum log to search at once in `match_log`
+DEFAULT_LOG_WINDOW = 1 << 20
+
+# How many data to search in each process in `match_parallel`
+DEFAULT_CHUNK_SIZE = 1 << 18
+
+# How many data the interpreter is given at once when confirming a match
+INTERPRETER_BLOCK = 64
+
+# A match found before overlaps are resolved, as (start index, end index, rank, pattern index).
+# Both indices are inclusive.
+MatchSpan = Tuple[int, int, int, int]
+
+def as_datum_array(data: Union[bytes, bytearray, memoryview, "np.ndarray"]) -> "np.ndarray":
+    """
+    View data as a NumPy array of words, without copying if possible. A buffer of bytes is viewed as
+    `uint8`, and an array must already have an unsigned integer type.
+    """
+
+    if isinstance(data, np.ndarray):
+        if data.dtype.kind != "u":
+            raise ValueError(f"expected unsigned integer data, got {data.dtype}")
+        return data
+    return np.frombuffer(data, dtype=np.uint8)
+
+def log_records(log: DatumLog) -> "np.ndarray":
+    """View the records of a datum log as a NumPy array, without copying them."""
+    return np.frombuffer(log.map, dtype=LOG_RECORD_DTYPE, count=len(log), offset=LOG_HEADER.size)
+
+def resolve_overlaps(matches: Iterable[MatchSpan], last_end: int = -1) -> List[MatchSpan]:
+    """
+    Choose which of a set of possible matches would be emitted by `PatternMatcher`.
+
+    Each time any matches end on the same datum, the earliest-starting (then lowest-ranked) one
+    which started after the previously emitted match is chosen. If some matches have already been
+    emitted, `last_end` is where the last of them ended.
+    """
+
+    results = []
+    for match in sorted(matches, key=lambda m: (m[1], m[0], m[2])):
+        # Sorting means that the first viable match for each end is the best one, and choosing it
+        # makes every other match with the same end non-viable
+        if match[0] > last_end:
+            results.append(match)
+            last_end = match[1]
+    return results
+
+def drop_crossing(spans: List[MatchSpan], boundaries: "np.ndarray") -> List[MatchSpan]:
+    """
+    Remove the matches which continue across a boundary in the data, given as the sorted indices of
+    the data which no match may continue to from the datum before.
+    """
+
+    if not spans or len(boundaries) == 0:
+        return spans
+
+    starts = np.searchsorted(boundaries, [span[0] for span in spans], side="right")
+    ends = np.searchsorted(boundaries, [span[1] for span in spans], side="right")
+    return [span for span, keep in zip(spans, (starts == ends).tolist()) if keep]
+
+class OfflineMatcher:
+    """
+    Finds every match of a set of patterns in a buffer of data which is entirely in memory.
+
+    Rather than stepping through data one datum at a time, this uses vectorised comparisons to find
+    every position where the data at fixed offsets from the start of a pattern is correct. Patterns
+    which compile to an automaton program are checked completely this way. Others are checked only
+    on as much of their start as can be compiled (or the data they can start with), and each
+    candidate position is then confirmed by the interpreter.
+
+    The results are the same as feeding the data through a `PatternMatcher` one datum at a time.
+    """
+
+    def __init__(self, patterns: Sequence[PatternElement], word_width: int = DEFAULT_WORD_WIDTH) -> None:
+        self.patterns = list(patterns)
+        self.ranks = pattern_ranks(self.patterns)
+        self.word_width = word_width
+        self.alphabet = Alphabet()
+
+        # For each pattern, the step bitmasks to check, and whether these describe the entire
+        # pattern (or only its prefix, needing confirmation)
+        self.checks: List[Tuple[List[int], bool]] = []
+        for pattern in self.patterns:
+            program = compile_program(pattern, self.alphabet)
+            if program is not None:
+                self.checks.append((program.steps, True))
+            else:
+                steps, _ = compile_prefix(pattern, self.alphabet)
+                while steps and steps[-1] == ANY_DATUM_MASK:
+                    steps.pop()
+                self.checks.append((steps, False))
+
+        # The values accepted by each step mask which has been checked, as arrays for `np.isin`
+        self.step_values: Dict[int, "np.ndarray"] = {}
+
+        # The most data which any match can span, or `None` if some pattern has no limit
+        longest = max((pattern.length_bounds()[1] for pattern in self.patterns), default=1)
+        self.max_length: Optional[int] = longest if longest < UNBOUNDED_LENGTH else None
+
+    def match(self, data: Union[bytes, bytearray, memoryview, "np.ndarray"], start_times: Sequence[T], end_times: Optional[Sequence[T]] = None) -> List[PatternMatch[T]]:
+        """
+        Find the matches in `data`, where each datum started at the time with the same index in
+        `start_times` and ended at that in `end_times` (or `start_times` again, if not given).
+        """
+
+        array = as_datum_array(data)
+        return self.choose(self.find_all(array), array, start_times, end_times)
+
+    def match_parallel(self, data: Union[bytes, bytearray, memoryview, "np.ndarray"], start_times: Sequence[T], end_times: Optional[Sequence[T]] = None, processes: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[PatternMatch[T]]:
+        """
+        Like `match`, but searching chunks of `chunk_size` data in a pool of `processes` processes
+        (or one per CPU, if not given).
+
+        Each process finds the matches starting in its chunk, using as much of the following data as
+        the longest possible match needs. Overlaps between all of these are then resolved here, so
+        the results are exactly the same as `match`. If some pattern has no maximum length, chunks
+        can't be searched independently, so the data is searched in this process instead.
+        """
+
+        array = as_datum_array(data)
+        if self.max_length is None or len(array) <= chunk_size:
+            return self.match(array, start_times, end_times)
+
+        chunk_starts = range(0, len(array), chunk_size)
+        chunks = [array[chunk_start : chunk_start + chunk_size + self.max_length - 1] for chunk_start in chunk_starts]
+        with ProcessPoolExecutor(processes, initializer=initialize_worker, initargs=(self, None)) as executor:
+            spans = [
+                span
+                for chunk_spans in executor.map(find_in_chunk, chunk_starts, chunks, [chunk_size] * len(chunks))
+                for span in chunk_spans
+            ]
+        return self.choose(spans, array, start_times, end_times)
+
+    def choose(self, spans: Iterable[MatchSpan], array: "np.ndarray", start_times: Sequence[T], end_times: Optional[Sequence[T]]) -> List[PatternMatch[T]]:
+        """Resolve overlaps between all of the matches found in `array`, and find their captures."""
+
+        if end_times is None:
+            end_times = start_times
+
+        results = []
+        for start, end, _, pattern_index in resolve_overlaps(spans):
+            pattern = self.patterns[pattern_index]
+            env = PatternMatchEnvironment()
+            self.run_interpreter(pattern, array, start, env)
+            results.append(PatternMatch(pattern, env.captures, start_times[start], end_times[end], self.word_width))
+        return results
+
+    def match_log(self, log: DatumLog, start: int = 0, stop: Optional[int] = None, window: int = DEFAULT_LOG_WINDOW, processes: int = 1) -> Iterator[PatternMatch[float]]:
+        """
+        Find the matches in the records of a datum log from index `start` up to `stop` (exclusive, or
+        the end if not given), in order. Matches never continue across the log's boundaries.
+
+        The log is searched `window` data at a time, so only that much of it (and the data of any
+        matches crossing the end of the window) needs to be in memory at once. If `processes` is more
+        than one, windows are searched in a pool of that many processes, each mapping the log
+        itself. As with `match_parallel`, this is only done if every pattern has a maximum length.
+        """
+
+        records = log_records(log)
+        stop = len(records) if stop is None else min(stop, len(records))
+        data = records["datum"][:stop]
+        start_times = records["start_time"]
+        end_times = records["end_time"]
+        boundaries = np.array(log.boundaries, dtype=np.int64)
+
+        with ExitStack() as stack:
+            window_starts = range(start, stop, window)
+            window_stops = [min(window_start + window, stop) for window_start in window_starts]
+
+            window_spans: Iterable[List[MatchSpan]]
+            if processes > 1 and self.max_length is not None and len(window_starts) > 1:
+                executor = stack.enter_context(ProcessPoolExecutor(processes, initializer=initialize_worker, initargs=(self, log.path)))
+                window_spans = executor.map(find_in_log, window_starts, window_stops, [stop] * len(window_stops))
+            else:
+                window_spans = (self.find_all(data, *window) for window in zip(window_starts, window_stops))
+
+            # Any match ending inside a window must start inside it or an earlier one, so once a
+            # window has been searched, every match ending before its end is known and can be chosen
+            # between
+            pending: List[MatchSpan] = []
+            last_end = start - 1
+            for window_stop, spans in zip(window_stops, window_spans):
+                pending.extend(drop_crossing(spans, boundaries))
+
+                ready = [span for span in pending if span[1] < window_stop]
+                pending = [span for span in pending if span[1] >= window_stop]
+                for match_start, match_end, _, pattern_index in resolve_overlaps(ready, last_end):
+                    pattern = self.patterns[pattern_index]
+                    env = PatternMatchEnvironment()
+                    self.run_interpreter(pattern, data, match_start, env)
+                    yield PatternMatch(pattern, env.captures, float(start_times[match_start]), float(end_times[match_end]), self.word_width)
+                    last_end = match_end
+
+    def find_all(self, array: "np.ndarray", first_start: int = 0, last_start: Optional[int] = None) -> List[MatchSpan]:
+        """
+        Find every match in `array` which starts between `first_start` and `last_start` (exclusive,
+        or the end of the array if not given), including those which overlap each other.
+        """
+
+        if last_start is None:
+            last_start = len(array)
+
+        spans: List[MatchSpan] = []
+        for pattern_index, (steps, exact) in enumerate(self.checks):
+            starts = self.find_starts(array, steps, first_start, last_start)
+
+            if exact:
+                for start in starts.tolist():
+                    spans.append((start, start + len(steps) - 1, self.ranks[pattern_index], pattern_index))
+            else:
+                pattern = self.patterns[pattern_index]
+                for start in starts.tolist():
+                    end = self.run_interpreter(pattern, array, start, PatternMatchEnvironment())
+                    if end is not None:
+                        spans.append((start, end, self.ranks[pattern_index], pattern_index))
+
+        return spans
+
+    def find_starts(self, array: "np.ndarray", steps: List[int], first_start: int, last_start: int) -> "np.ndarray":
+        """Find the indices in a range where every step accepts the datum at its offset."""
+
+        count = min(last_start, len(array) - len(steps) + 1) - first_start
+        if count <= 0:
+            return np.empty(0, dtype=np.int64)
+
+        possible = np.ones(count, dtype=bool)
+        for offset, step in enumerate(steps):
+            if step == ANY_DATUM_MASK:
+                continue
+
+            window = array[first_start + offset : first_start + offset + count]
+            if step >> OTHER_DATUM & 1:
+                # Accepts anything other than the values it doesn't have bits for
+                possible &= ~np.isin(window, self.values_of(~step))
+            elif step != 0 and step & (step - 1) == 0:
+                # Only one datum is accepted, so compare directly
+                possible &= window == self.alphabet.values[step.bit_length() - 1]
+            else:
+                possible &= np.isin(window, self.values_of(step))
+
+            if not possible.any():
+                break
+
+        return np.flatnonzero(possible) + first_start
+
+    def values_of(self, mask: int) -> "np.ndarray":
+        """Get the data values whose symbols are in a step mask."""
+
+        values = self.step_values.get(mask)
+        if values is None:
+            values = np.array([value for symbol, value in enumerate(self.alphabet.values) if value is not None and mask >> symbol & 1], dtype=np.uint64)
+            self.step_values[mask] = values
+        return values
+
+    def run_interpreter(self, pattern: PatternElement, array: "np.ndarray", start: int, env: PatternMatchEnvironment) -> Optional[int]:
+        """Match a pattern from `start`, returning the index of the datum it ended on if it matched."""
+
+        # Converting data to Python integers a block at a time is much quicker than one at a time
+        state: MatchState = None
+        for block_start in range(start, len(array), INTERPRETER_BLOCK):
+            for index, datum in enumerate(array[block_start : block_start + INTERPRETER_BLOCK].tolist(), block_start):
+                result, state = pattern.match(datum, state, env)
+                if result == PatternMatchResult.SUCCESS:
+                    return index
+                elif result == PatternMatchResult.FAILURE:
+                    return None
+        return None
+
+# The matcher used by a worker process of `match_parallel` or `match_log`, and the data of the datum
+# log which it is searching (if any)
+worker_matcher: Optional[OfflineMatcher] = None
+worker_data: Optional["np.ndarray"] = None
+
+def initialize_worker(matcher: OfflineMatcher, log_path: Optional[str]) -> None:
+    global worker_matcher, worker_data
+    worker_matcher = matcher
+    if log_path is not None:
+        # Left open for as long as the process lives
+        worker_data = log_records(DatumLog(log_path))["datum"]
+
+def find_in_chunk(offset: int, chunk: "np.ndarray", count: int) -> List[MatchSpan]:
+    """In a worker process, find every match starting in the first `count` data of a chunk starting at `offset`."""
+
+    assert worker_matcher is not None
+    return [(start + offset, end + offset, rank, pattern_index) for start, end, rank, pattern_index in worker_matcher.find_all(chunk, 0, count)]
+
+def find_in_log(first_start: int, last_start: int, stop: int) -> List[MatchSpan]:
+    """In a worker process, find every match in the datum log up to `stop` which starts in a range."""
+
+    assert worker_matcher is not None and worker_data is not None
+    return worker_matcher.find_all(worker_data[:stop], first_start, last_start)
@@ -0,0 +1,353 @@
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+from .pattern_element import PatternElement, FixedPatternElement, ClassPatternElement, WildcardPatternElement, SequencePatternElement, NamePatternElement, CapturePatternElement, RepeatPatternElement, AlternationPatternElement
+
+# Sets of data are represented as integer bitmasks over the symbols of an `Alphabet`. Symbol 0
+# stands for any datum which no pattern mentions (which only a wildcard can match), and a mask of
+# -1 has every bit set, so accepts any datum - including those given symbols later.
+OTHER_DATUM = 0
+ANY_DATUM_MASK = -1
+
+# Patterns which unroll to more steps than this are left to the interpreter instead. Long
+# wildcard runs make every DFA state large, so it stops being a win well before this.
+DEFAULT_MAX_PROGRAM_LENGTH = 1024
+
+# The default number of DFA states to keep before the cache is flushed.
+DEFAULT_MAX_STATES = 4096
+
+class Alphabet:
+    """
+    The symbols which automaton programs are written in.
+
+    Only data values which appear in patterns are given their own symbol, as they're compiled, and
+    every other value shares `OTHER_DATUM`. This keeps the alphabet small no matter how wide data
+    words are.
+    """
+
+    def __init__(self) -> None:
+        self.symbols: Dict[int, int] = {}
+
+        # The value of each symbol, with `None` for `OTHER_DATUM`
+        self.values: List[Optional[int]] = [None]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def add(self, value: int) -> int:
+        """Get the symbol for a value which a pattern matches, giving it one if it's new."""
+
+        symbol = self.symbols.get(value)
+        if symbol is None:
+            symbol = len(self.values)
+            self.symbols[value] = symbol
+            self.values.append(value)
+        return symbol
+
+    def symbol(self, datum: int) -> int:
+        """Convert a datum into its symbol."""
+        return self.symbols.get(datum, OTHER_DATUM)
+
+    def copy(self) -> "Alphabet":
+        """Make a copy of this alphabet, which symbols can be added to without affecting it."""
+
+        alphabet = Alphabet()
+        alphabet.symbols = dict(self.symbols)
+        alphabet.values = list(self.values)
+        return alphabet
+
+@dataclass
+class AutomatonProgram:
+    """
+    A pattern compiled to a fixed-length list of steps, where each step is a bitmask of the data
+    accepted at that position. A pattern matches if and only if every step accepts its datum.
+    """
+
+    steps: List[int]
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+class ProgramTooLongError(Exception):
+    """
+    Raised internally when a pattern can't be compiled, usually because it unrolls to more steps
+    than are allowed.
+    """
+
+def compile_program(element: PatternElement, alphabet: Alphabet, max_length: int = DEFAULT_MAX_PROGRAM_LENGTH) -> Optional[AutomatonProgram]:
+    """
+    Compile a pattern element into an `AutomatonProgram`, adding the data it matches to `alphabet`.
+
+    Returns `None` if the element can't be represented by the automaton, in which case it needs
+    to be matched by the interpreter.
+    """
+
+    # Don't bother unrolling anything which is certain to be too long
+    _, max_match_length = element.length_bounds()
+    if max_match_length > max_length:
+        return None
+
+    steps: List[int] = []
+    try:
+        _compile_steps(element, steps, alphabet, max_length)
+    except ProgramTooLongError:
+        return None
+
+    if len(steps) == 0:
+        return None
+
+    return AutomatonProgram(steps)
+
+def compile_prefix(element: PatternElement, alphabet: Alphabet, max_length: int = DEFAULT_MAX_PROGRAM_LENGTH) -> Tuple[List[int], bool]:
+    """
+    Compile as much of the start of a pattern element as possible into steps, for elements which
+    `compile_program` can't compile completely. Every match of the element begins with data which
+    these steps accept, but not all data which they accept begins a match.
+
+    Returns the steps, and whether they describe the entire element.
+    """
+
+    steps: List[int] = []
+    try:
+        _compile_steps(element, steps, alphabet, max_length)
+        return steps, True
+    except ProgramTooLongError:
+        pass
+
+    if isinstance(element, (NamePatternElement, CapturePatternElement)):
+        return compile_prefix(element.pattern_element, alphabet, max_length)
+    elif isinstance(element, SequencePatternElement):
+        steps = []
+        for child in element.pattern_elements:
+            if len(steps) >= max_length:
+                break
+            child_steps, complete = compile_prefix(child, alphabet, max_length - len(steps))
+            steps.extend(child_steps)
+            if not complete:
+                break
+        return steps, False
+    elif isinstance(element, RepeatPatternElement) and element.quantity > 0:
+        steps, _ = compile_prefix(element.pattern_element, alphabet, max_length)
+        return steps, False
+
+    # Otherwise, only the first datum can be described, and only if the element can't be empty
+    minimum_length, _ = element.length_bounds()
+    hint = element.start_hint() if minimum_length > 0 else None
+    if hint is None:
+        return [], False
+
+    mask = 0
+    for value in hint:
+        mask |= 1 << alphabet.add(value)
+    return [mask], False
+
+def _compile_steps(element: PatternElement, steps: List[int], alphabet: Alphabet, max_length: int) -> None:
+    if isinstance(element, FixedPatternElement):
+        steps.append(1 << alphabet.add(element.datum))
+    elif isinstance(element, ClassPatternElement):
+        # Too big a class would need too many symbols
+        if element.members is None:
+            raise ProgramTooLongError()
+        mask = 0
+        for member in sorted(element.members):
+            mask |= 1 << alphabet.add(member)
+        steps.append(mask)
+    elif isinstance(element, WildcardPatternElement):
+        steps.append(ANY_DATUM_MASK)
+    elif isinstance(element, AlternationPatternElement):
+        # Only alternatives of one datum each can be merged into a single step. Longer ones can't
+        # be checked step by step independently.
+        mask = 0
+        for alternative in element.alternatives:
+            alternative_steps: List[int] = []
+            _compile_steps(alternative, alternative_steps, alphabet, max_length)
+            if len(alternative_steps) != 1:
+                raise ProgramTooLongError()
+            mask |= alternative_steps[0]
+        steps.append(mask)
+    elif isinstance(element, SequencePatternElement):
+        for child in element.pattern_elements:
+            _compile_steps(child, steps, alphabet, max_length)
+    elif isinstance(element, (NamePatternElement, CapturePatternElement)):
+        # Captures are recovered later by replaying the interpreter over the winning match, so
+        # they don't affect what the automaton recognises
+        _compile_steps(element.pattern_element, steps, alphabet, max_length)
+    elif isinstance(element, RepeatPatternElement):
+        if element.quantity == 0:
+            # The interpreter never finishes a zero-quantity repeat, so it can never match
+            steps.append(0)
+        else:
+            inner: List[int] = []
+            _compile_steps(element.pattern_element, inner, alphabet, max_length)
+            if len(steps) + len(inner) * element.quantity > max_length:
+                raise ProgramTooLongError()
+            steps.extend(inner * element.quantity)
+    else:
+        raise ProgramTooLongError()
+
+    if len(steps) > max_length:
+        raise ProgramTooLongError()
+
+# A thread is a pattern (by index into the automaton's programs) and the number of steps of it
+# which have matched so far
+Thread = Tuple[int, int]
+
+# The next state, the winning completed pattern (if any), and every completed pattern
+Transition = Tuple["AutomatonState", Optional[int], Tuple[int, ...]]
+
+class AutomatonState:
+    """One state of the lazily-built DFA: the set of pattern threads which are still in flight."""
+
+    __slots__ = ("threads", "transitions", "longest_thread")
+
+    threads: FrozenSet[Thread]
+
+    # The most steps matched by any thread, so the earliest in-flight start is this many data ago
+    longest_thread: int
+
+    # For each input symbol, the next state, the winning pattern index which completed on that
+    # symbol (if any), and every pattern index which completed on it. Entries are filled in on
+    # first use.
+    transitions: List[Optional["Transition"]]
+
+    def __init__(self, threads: FrozenSet[Thread], alphabet_size: int) -> None:
+        self.threads = threads
+        self.transitions = [None] * alphabet_size
+        self.longest_thread = max((matched for _, matched in threads), default=0)
+
+class LazyAutomaton:
+    """
+    A DFA recognising when any of a set of fixed-length patterns completes, following the same
+    overlap rules as the candidate interpreter: the earliest-starting pattern to complete wins
+    (ties broken by `ranks`), and all in-flight matches are discarded afterwards.
+
+    If `discard_on_match` is false, a completion doesn't discard anything else in flight, so that
+    the caller can choose between overlapping matches itself with `step_all` and
+    `discard_started_within`.
+
+    States are built on demand and cached. If the cache grows beyond `max_states`, it is flushed
+    entirely and rebuilt as required.
+
+    The programs must all have been compiled with `alphabet`, and data is converted into symbols
+    with it before being stepped.
+    """
+
+    def __init__(self, programs: Sequence[AutomatonProgram], ranks: Sequence[int], alphabet: Alphabet, max_states: int = DEFAULT_MAX_STATES, discard_on_match: bool = True) -> None:
+        self.programs = list(programs)
+        self.ranks = list(ranks)
+        self.alphabet = alphabet
+        self.alphabet_size = len(alphabet)
+        self.max_states = max(max_states, 2)
+        self.discard_on_match = discard_on_match
+        self.cache_flushes = 0
+
+        # Patterns whose first step accepts each symbol
+        self.start_patterns: List[List[int]] = [[] for _ in range(self.alphabet_size)]
+        all_symbols = (1 << self.alphabet_size) - 1
+        for index, program in enumerate(self.programs):
+            # Visit only the set bits, since most patterns start with one particular datum
+            first = program.steps[0] & all_symbols
+            while first:
+                lowest = first & -first
+                self.start_patterns[lowest.bit_length() - 1].append(index)
+                first ^= lowest
+
+        self.states: Dict[FrozenSet[Thread], AutomatonState] = {}
+        self.initial_state = self.intern_state(frozenset())
+        self.current_state = self.initial_state
+
+    def reset(self) -> None:
+        """Discard all in-flight matches."""
+        self.current_state = self.initial_state
+
+    def discard_started_within(self, length: int) -> None:
+        """Discard every in-flight match except those which started within the last `length` data."""
+
+        if self.current_state.longest_thread > length:
+            self.current_state = self.intern_state(frozenset(
+                thread for thread in self.current_state.threads if thread[1] <= length
+            ))
+
+    def step(self, symbol: int) -> Optional[int]:
+        """
+        Advance the automaton by one symbol, returning the index of the winning pattern if one
+        completed.
+        """
+
+        transition = self.current_state.transitions[symbol]
+        if transition is None:
+            transition = self.build_transition(self.current_state, symbol)
+
+        self.current_state, winner, _ = transition
+        return winner
+
+    def step_all(self, symbol: int) -> Tuple[int, ...]:
+        """
+        Advance the automaton by one symbol, returning the index of every pattern which completed,
+        in order of pattern index.
+        """
+
+        transition = self.current_state.transitions[symbol]
+        if transition is None:
+            transition = self.build_transition(self.current_state, symbol)
+
+        self.current_state, _, completed = transition
+        return completed
+
+    def build_transition(self, state: AutomatonState, symbol: int) -> Transition:
+        advanced = [
+            (index, matched + 1)
+            for index, matched in state.threads
+            if self.programs[index].steps[matched] >> symbol & 1
+        ]
+        advanced.extend((index, 1) for index in self.start_patterns[symbol])
+
+        next_threads = set()
+        completed = set()
+        winner: Optional[int] = None
+        for index, matched in advanced:
+            if matched < len(self.programs[index]):
+                next_threads.add((index, matched))
+            else:
+                completed.add(index)
+                if winner is None or self.beats(index, winner):
+                    winner = index
+
+        # Any completion discards everything else in flight, unless the caller is choosing
+        if winner is not None and self.discard_on_match:
+            next_state = self.initial_state
+        else:
+            next_state = self.intern_state(frozenset(next_threads))
+
+        transition = (next_state, winner, tuple(sorted(completed)))
+        state.transitions[symbol] = transition
+        return transition
+
+    def beats(self, index: int, other: int) -> bool:
+        """Whether pattern `index` should be chosen over `other` when both complete together."""
+
+        # Longer patterns started earlier, so win
+        length, other_length = len(self.programs[index]), len(self.programs[other])
+        if length != other_length:
+            return length > other_length
+        return self.ranks[index] < self.ranks[other]
+
+    def intern_state(self, threads: FrozenSet[Thread]) -> AutomatonState:
+        state = self.states.get(threads)
+        if state is not None:
+            return state
+
+        if len(self.states) >= self.max_states:
+            self.flush()
+
+        state = AutomatonState(threads, self.alphabet_size)
+        self.states[threads] = state
+        return state
+
+    def flush(self) -> None:
+        """Drop every cached state except the initial and current ones."""
+
+        self.cache_flushes += 1
+        self.states = {}
+        for state in (self.initial_state, self.current_state):
+            state.transitions = [None] * self.alphabet_size
+            self.states[state.threads] = state
@@ -0,0 +1,244 @@
+import atexit
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+from .pattern_matcher import PatternMatcher, DEFAULT_MAX_CANDIDATES
+from .pattern_compiler import IncrementalCompiler
+from .pattern_source import read_pattern_source
+from .byte_formatter import DEFAULT_WORD_WIDTH
+
+# The environment variable which, if set, overrides where compiled patterns are cached. Setting it
+# to an empty string disables the cache.
+CACHE_DIRECTORY_ENVIRONMENT_VARIABLE = "CUSTOM_DATA_CACHE_DIR"
+
+# Increase this whenever the layout of a cache entry changes
+CACHE_FORMAT_VERSION = 2
+
+# A file modified less than this many seconds before it was loaded might be modified again without
+# its modification time changing, so its contents are always checked next time
+RACY_MODIFICATION_SECONDS = 2.0
+
+# The directory containing the library, whose source is part of every cache key
+_LIB_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+def cache_directory() -> Optional[str]:
+    """Get the directory to cache compiled patterns in, or `None` if caching is disabled."""
+
+    directory = os.environ.get(CACHE_DIRECTORY_ENVIRONMENT_VARIABLE)
+    if directory is not None:
+        return directory or None
+
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "saleae-logic2-custom-data")
+
+def code_version() -> str:
+    """
+    Hash the source of the library, so that cached patterns are never loaded into a different
+    version of the classes which they were created with.
+    """
+
+    import hashlib
+
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(_LIB_DIRECTORY)):
+        if name.endswith(".py"):
+            digest.update(name.encode())
+            with open(os.path.join(_LIB_DIRECTORY, name), "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+def cache_key(pattern: str, word_width: int = DEFAULT_WORD_WIDTH, max_latency: Optional[int] = None) -> str:
+    """Get the key under which the compiled form of some pattern text is cached."""
+
+    import hashlib
+
+    digest = hashlib.sha256()
+    digest.update(f"{CACHE_FORMAT_VERSION}:{code_version()}:{word_width}:{max_latency}:".encode())
+    digest.update(pattern.encode())
+    return digest.hexdigest()
+
+def cache_path(directory: str, prefix: str, key: str) -> str:
+    return os.path.join(directory, f"{prefix}{key}.pickle")
+
+def cache_entry_prefix(source_path: str, word_width: int = DEFAULT_WORD_WIDTH, max_latency: Optional[int] = None) -> str:
+    """
+    Get the prefix of the names of the cache entries for a pattern file loaded with some settings,
+    so that only the latest entry can be kept.
+    """
+
+    import hashlib
+
+    digest = hashlib.sha256(f"{os.path.abspath(source_path)}:{word_width}:{max_latency}".encode())
+    return digest.hexdigest()[:16] + "-"
+
+def read_cache_entry(path: str, key: str) -> Optional[IncrementalCompiler]:
+    """Load a compiler which has compiled some patterns from the cache, if there is a valid entry for `key`."""
+
+    import pickle
+
+    try:
+        with open(path, "rb") as f:
+            version, entry_key, compiler = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # Corrupt or from an incompatible version - get rid of it so that it's rewritten
+        remove_quietly(path)
+        return None
+
+    if version != CACHE_FORMAT_VERSION or entry_key != key or not isinstance(compiler, IncrementalCompiler):
+        remove_quietly(path)
+        return None
+    return compiler
+
+def write_cache_entry(path: str, key: str, compiler: IncrementalCompiler) -> None:
+    """
+    Store a compiler in the cache, replacing any other entry with the same prefix (see
+    `cache_entry_prefix`). Failing to do so isn't an error.
+    """
+
+    import pickle
+
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temporary_path, "wb") as f:
+            pickle.dump((CACHE_FORMAT_VERSION, key, compiler), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+    except (OSError, pickle.PicklingError, RecursionError):
+        remove_quietly(temporary_path)
+        return
+
+    # Any other entries for the same file and settings are older
+    directory, name = os.path.split(path)
+    prefix = name[:name.index("-") + 1]
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for other_name in names:
+        if other_name.startswith(prefix) and other_name.endswith(".pickle") and other_name != name:
+            remove_quietly(os.path.join(directory, other_name))
+
+def remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+@dataclass
+class LoadedFile:
+    """A pattern file which has been loaded by this process."""
+
+    compiler: IncrementalCompiler
+
+    # The cache key of the text which `compiler` compiled last, if any
+    key: Optional[str] = None
+
+    # The modification time (in nanoseconds) and size of the file when it was compiled, if it can
+    # be trusted to change whenever the file does
+    signature: Optional[Tuple[int, int]] = None
+
+    # Whether `compiler` has been changed since it was last read from or written to the cache
+    unsaved: bool = False
+
+# Pattern files loaded by this process, by path and matcher settings
+_loaded_files: Dict[Tuple[str, int, Optional[int]], LoadedFile] = {}
+
+# Compilers for the patterns given as text to this process, by matcher settings. Each remembers
+# only the text it compiled last, so analyzers created again with the same text don't parse it again.
+_text_compilers: Dict[Tuple[int, Optional[int]], IncrementalCompiler] = {}
+
+def save_loaded_files() -> None:
+    """
+    Write the pattern files which have been compiled again since they were cached to the cache.
+    This is done when the process exits.
+    """
+
+    directory = cache_directory()
+    if directory is None:
+        return
+    for (source_path, word_width, max_latency), loaded in _loaded_files.items():
+        if loaded.unsaved and loaded.key is not None:
+            path = cache_path(directory, cache_entry_prefix(source_path, word_width, max_latency), loaded.key)
+            write_cache_entry(path, loaded.key, loaded.compiler)
+            loaded.unsaved = False
+
+atexit.register(save_loaded_files)
+
+def forget_loaded_files() -> None:
+    """Forget the patterns loaded by this process, so that they're next loaded from the cache."""
+    _loaded_files.clear()
+    _text_compilers.clear()
+
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    """Get the modification time and size of a file, if it wasn't modified too recently to trust them."""
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if stat.st_mtime > time.time() - RACY_MODIFICATION_SECONDS:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def load_matcher(source_setting: str, pattern_setting: str, word_width: int = DEFAULT_WORD_WIDTH, max_latency: Optional[int] = None, max_candidates: int = DEFAULT_MAX_CANDIDATES) -> PatternMatcher[Any]:
+    """
+    Load patterns in the same way as `load_patterns`, and create a `PatternMatcher` for them,
+    choosing between overlapping matches as described by `max_latency` and tracking at most
+    `max_candidates` partial matches at once.
+
+    Patterns given as text are compiled again only where they have changed since this process last
+    loaded text with the same settings. Pattern files can be very large, so they are compiled as
+    little as possible:
+
+    - If a file hasn't been modified since this process last loaded it, it isn't even read.
+    - Otherwise, if this process has loaded the file before, only the statements which have changed
+      since are compiled again. The cache is updated when the process exits.
+    - Otherwise, the compiled form of the file is cached on disk, keyed by the file's contents, the
+      matcher's settings and the version of this library, and used if none of these have changed.
+      Only the latest entry for each file is kept.
+    """
+
+    if source_setting != "File":
+        source_name, pattern = read_pattern_source(source_setting, pattern_setting)
+        compiler = _text_compilers.get((word_width, max_latency))
+        if compiler is None:
+            compiler = IncrementalCompiler(word_width, max_latency)
+            _text_compilers[(word_width, max_latency)] = compiler
+        return compiler.compile(source_name, pattern, max_candidates)
+
+    loaded_key = (os.path.abspath(pattern_setting), word_width, max_latency)
+    loaded = _loaded_files.get(loaded_key)
+    if loaded is None:
+        loaded = LoadedFile(IncrementalCompiler(word_width, max_latency))
+        _loaded_files[loaded_key] = loaded
+
+    signature = file_signature(pattern_setting)
+    if signature is not None and signature == loaded.signature:
+        return loaded.compiler.assemble(max_candidates)
+
+    source_name, pattern = read_pattern_source(source_setting, pattern_setting)
+    key = cache_key(pattern, word_width, max_latency)
+    if key != loaded.key and loaded.key is not None:
+        # Writing the whole compiler to the cache takes longer than compiling only what was edited,
+        # so wait until the process exits
+        loaded.compiler.compile_statements(source_name, pattern)
+        loaded.unsaved = True
+        loaded.key = key
+    elif key != loaded.key:
+        directory = cache_directory()
+        path = cache_path(directory, cache_entry_prefix(*loaded_key), key) if directory is not None else None
+
+        compiler = read_cache_entry(path, key) if path is not None else None
+        if compiler is not None:
+            loaded.compiler = compiler
+        else:
+            loaded.compiler.compile_statements(source_name, pattern)
+            if path is not None:
+                write_cache_entry(path, key, loaded.compiler)
+        loaded.key = key
+
+    loaded.signature = signature
+    return loaded.compiler.assemble(max_candidates)
@@ -0,0 +1,137 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from .pattern_element import PatternElement
+from .pattern_tokenizer import Tokenizer
+from .pattern_parser import Parser
+from .pattern_automaton import Alphabet, AutomatonProgram, compile_program
+from .pattern_matcher import PatternMatcher, DEFAULT_MAX_CANDIDATES
+from .errors import SourceError, CustomException
+from .byte_formatter import DEFAULT_WORD_WIDTH
+
+# The parts of pattern text which a statement-ending `;` can't be inside of, and the `;` itself
+_STATEMENT_END_REGEX = re.compile(r"""
+    "[^"]*"
+  | //[^\n]*
+  | (?P<end> ; )
+""", re.VERBOSE)
+
+# A top-level pattern, along with its automaton program if it has one
+CompiledPattern = Tuple[PatternElement, Optional[AutomatonProgram]]
+
+def split_statements(text: str) -> List[Tuple[int, str]]:
+    """
+    Split the text of patterns into top-level statements, each ending with its `;` (except perhaps
+    the last). Returns the offset of each statement in the text, and the statement itself.
+    """
+
+    statements = []
+    start = 0
+    for match in _STATEMENT_END_REGEX.finditer(text):
+        if match.lastgroup == "end":
+            statements.append((start, text[start : match.end()]))
+            start = match.end()
+
+    if text[start:].strip():
+        statements.append((start, text[start:]))
+    return statements
+
+class IncrementalCompiler:
+    """
+    Compiles the text of patterns into `PatternMatcher`s, remembering the result for each top-level
+    statement. Compiling an edited version of the same text then only parses the statements which
+    have changed, and only compiles automaton programs for their patterns.
+
+    Data are words of `word_width` bits, and matchers choose between overlapping matches as
+    described by `max_latency`.
+    """
+
+    def __init__(self, word_width: int = DEFAULT_WORD_WIDTH, max_latency: Optional[int] = None) -> None:
+        self.word_width = word_width
+        self.max_latency = max_latency
+
+        # The patterns of each statement in the text compiled last
+        self.statements: Dict[str, List[CompiledPattern]] = {}
+
+        # Shared between every statement, so that programs from different compiles can be used
+        # together. Both only grow.
+        self.alphabet = Alphabet()
+        self.interned: Dict[Tuple[Any, ...], PatternElement] = {}
+
+        # The patterns of the text compiled last, in order
+        self.compiled: List[CompiledPattern] = []
+
+        # How many statements the last compile had to parse
+        self.parsed = 0
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Interned elements are keyed by the identities of their fields, which are meaningless once
+        # unpickled
+        state = dict(self.__dict__)
+        state["interned"] = {}
+        return state
+
+    def compile(self, source_name: str, text: str, max_candidates: int = DEFAULT_MAX_CANDIDATES) -> PatternMatcher[Any]:
+        """
+        Create a matcher for the patterns in some text, which tracks at most `max_candidates` partial
+        matches at once.
+
+        Syntax errors are raised as a `CustomException` describing where the error is.
+        """
+
+        self.compile_statements(source_name, text)
+        return self.assemble(max_candidates)
+
+    def assemble(self, max_candidates: int = DEFAULT_MAX_CANDIDATES) -> PatternMatcher[Any]:
+        """
+        Create a new matcher for the patterns of the text compiled last, which tracks at most
+        `max_candidates` partial matches at once.
+        """
+
+        return PatternMatcher(
+            [pattern for pattern, _ in self.compiled],
+            max_candidates=max_candidates,
+            word_width=self.word_width,
+            max_latency=self.max_latency,
+            alphabet=self.alphabet.copy(),
+            programs=[program for _, program in self.compiled],
+        )
+
+    def compile_statements(self, source_name: str, text: str) -> List[CompiledPattern]:
+        """Parse and compile each statement of some text, reusing those which are unchanged."""
+
+        statements: Dict[str, List[CompiledPattern]] = {}
+        compiled: List[CompiledPattern] = []
+        self.parsed = 0
+        for offset, statement in split_statements(text):
+            patterns = statements.get(statement)
+            if patterns is None:
+                patterns = self.statements.get(statement)
+            if patterns is None:
+                try:
+                    parsed = self.parse_statement(source_name, text, offset, statement)
+                except CustomException:
+                    # Keep what has been parsed so far, so that fixing the error doesn't mean
+                    # starting again
+                    self.statements.update(statements)
+                    raise
+                patterns = [(pattern, compile_program(pattern, self.alphabet)) for pattern in parsed]
+                self.parsed += 1
+
+            statements[statement] = patterns
+            compiled.extend(patterns)
+
+        # Forget statements which have been removed
+        self.statements = statements
+        self.compiled = compiled
+        return compiled
+
+    def parse_statement(self, source_name: str, text: str, offset: int, statement: str) -> List[PatternElement]:
+        try:
+            parser = Parser(Tokenizer(statement).tokenize(), self.word_width)
+            parser.interned = self.interned
+            return parser.parse()
+        except SourceError as e:
+            # Report the error's position within the whole text
+            if e.position is not None:
+                e.position = range(e.position.start + offset, e.position.stop + offset)
+            raise CustomException.from_syntax_error(e, source_name, text)
@@ -1,63 +1,126 @@
+import sys
 from abc import ABC, abstractmethod
-from typing import List, Optional, Tuple, Dict, cast
-from dataclasses import dataclass, field
-import copy
+from typing import Any, Callable, FrozenSet, List, Optional, Sequence, Set, Tuple, Dict, TypeVar, cast
+from dataclasses import dataclass, field, fields
+from .byte_formatter import DEFAULT_WORD_WIDTH, Words, words_to_integer
+from .name_template import NameTemplate
+from .data_history import DataHistory
 
 @dataclass
 class PatternMatchEnvironment:
-    captures: Dict[str, bytes] = field(default_factory=lambda: {})
+    captures: Dict[str, Words] = field(default_factory=lambda: {})
 
-    def add_capture(self, name: str, data: bytes) -> None:
+    # If the data being matched is stored in a history, captures are recorded as the range of
+    # indices they cover in it, rather than being copied
+    history: Optional[DataHistory[Any]] = None
+    spans: Dict[str, Tuple[int, int]] = field(default_factory=lambda: {})
+
+    def add_capture(self, name: str, data: Words) -> None:
         self.captures[name] = data
 
-class PatternMatchResult:
+    def add_span(self, name: str, start: int, end: int) -> None:
+        self.spans[name] = (start, end)
+
+    def snapshot(self) -> "PatternMatchEnvironment":
+        """Copy the captures made so far, without copying any data."""
+        return PatternMatchEnvironment(dict(self.captures), self.history, dict(self.spans))
+
+    def capture(self, name: str) -> Optional[Words]:
+        """Get the data of one capture made so far, or `None` if it hasn't been made."""
+
+        span = self.spans.get(name)
+        if span is not None and self.history is not None:
+            return self.history.data_between(*span)
+        return self.captures.get(name)
+
+    def materialize(self) -> Dict[str, Words]:
+        """Get the data of every capture made."""
+
+        captures = dict(self.captures)
+        if self.history is not None:
+            for name, (start, end) in self.spans.items():
+                captures[name] = self.history.data_between(start, end)
+        return captures
+
+class PatternMatchResult(int):
     # Work around https://bugs.python.org/issue30545 by defining something enum-like manually,
     # except which implements value-equality.
+    #
+    # Results are compared for every datum, so they're small integers underneath. Equality is then
+    # just integer comparison, which still holds between results made before and after
+    # `importlib.reload` redefines this class. Within one load, there's exactly one instance of each
+    # result, so they can be compared by identity too.
 
     SUCCESS: "PatternMatchResult"
     FAILURE: "PatternMatchResult"
     NEED_MORE: "PatternMatchResult"
 
-    _value: str
-
-    def __init__(self, value: str) -> None:
-        self._value = value
-    
-    def __eq__(self, other: object) -> bool:
-        # `isinstance` is module-sensitive, so use a worse approach
-        return type(other).__name__ == "PatternMatchResult" and self._value == cast(PatternMatchResult, other)._value
-    
-PatternMatchResult.SUCCESS   = PatternMatchResult("SUCCESS")
-PatternMatchResult.FAILURE   = PatternMatchResult("FAILURE")
-PatternMatchResult.NEED_MORE = PatternMatchResult("NEED_MORE")
+    def __repr__(self) -> str:
+        return ("SUCCESS", "FAILURE", "NEED_MORE")[self]
+
+PatternMatchResult.SUCCESS   = PatternMatchResult(0)
+PatternMatchResult.FAILURE   = PatternMatchResult(1)
+PatternMatchResult.NEED_MORE = PatternMatchResult(2)
+
+# The match state of a pattern element for one candidate. Pattern elements themselves are
+# immutable and shared between every candidate, so anything which changes as data is matched lives
+# in here instead.
+#
+# `None` always means that the element hasn't seen any data yet. Otherwise, the structure of the
+# state is private to each kind of element, but is always built from immutable tuples so that
+# candidates can share and discard states freely.
+MatchState = Any
+
+R = TypeVar("R")
+
+def memoized(method: Callable[[Any], R]) -> Callable[[Any], R]:
+    """
+    Cache the result of a method which takes no arguments on the (immutable) pattern element it was
+    called on. The result is shared between all callers, so must not be modified.
+    """
+
+    attribute = f"_memoized_{method.__name__}"
+
+    def wrapper(self: Any) -> R:
+        try:
+            return cast(R, self.__dict__[attribute])
+        except KeyError:
+            result = method(self)
+            object.__setattr__(self, attribute, result)
+            return result
+
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+@memoized
+def structural_hash(self: "PatternElement") -> int:
+    """
+    Hash a pattern element by its type and fields, like the `__hash__` which `dataclass` would
+    generate. Elements can be deeply nested, so this is memoized rather than recomputed every time
+    an element is used as a key.
+    """
+    return hash((type(self).__name__,) + tuple(getattr(self, f.name) for f in fields(cast(Any, self)) if f.compare))
 
 class PatternElement(ABC):
     """An abstract class describing how one datum of a packet should be matched."""
 
     @abstractmethod
-    def reset(self) -> None:
-        """Forget all match state and start again."""
-        ...
-
-    @abstractmethod
-    def match(self, datum: bytes, env: PatternMatchEnvironment) -> PatternMatchResult:
+    def match(self, datum: int, state: MatchState, env: PatternMatchEnvironment) -> Tuple[PatternMatchResult, MatchState]:
         """
-        Try to match one datum, returning a result based on whether it matched.
-        This may be a stateful method if multiple data are required for a match. If so, state
-        should be maintained until `reset` is called.
+        Try to match one datum, returning a result based on whether it matched, and the new match
+        state to pass in with the next datum.
+        Matching starts with a state of `None`, and the returned state is only meaningful if the
+        result is `PatternMatchResult.NEED_MORE`.
 
         Capturing pattern elements may modify the `env` *if and only if* the match returns
         `PatternMatchResult.SUCCESS`. Matches shouldn't be modified incrementally, to prevent
         clashes between multiple concurrent match candidates.
-
-        This can be implemented assuming that, once `PatternMatchResult.SUCCESS` or
-        `PatternMatchResult.FAILURE` has been returned, `match` won't be called again before `reset`
-        is called.
         """
         ...
 
     @abstractmethod
-    def start_hint(self) -> Optional[List[bytes]]:
+    def start_hint(self) -> Optional[List[int]]:
         """
         Get the first matching possibilities for this pattern element.
 
@@ -73,168 +136,544 @@ class PatternElement(ABC):
         """
         ...
 
-    def copy_element(self) -> "PatternElement":
-        return copy.deepcopy(self)
+    @abstractmethod
+    def literal_prefix(self) -> Tuple[List[int], bool]:
+        """
+        Get the longest sequence of data which any match of this element must begin with, and
+        whether that sequence is the entire element (meaning it matches nothing else).
+
+        Like `start_hint`, this is for optimisation purposes.
+        """
+        ...
+
+    @abstractmethod
+    def length_bounds(self) -> Tuple[int, int]:
+        """
+        Get the minimum and maximum number of data which a successful match of this element can
+        consume.
+        """
+        ...
 
-@dataclass
+    def __getstate__(self) -> Dict[str, Any]:
+        # Memoized results aren't pickled, because hashes of strings (such as capture names)
+        # differ between processes
+        return { k: v for k, v in self.__dict__.items() if not k.startswith("_memoized_") }
+
+def match_data(element: PatternElement, data: Sequence[int], env: PatternMatchEnvironment) -> PatternMatchResult:
+    """Match a pattern element against a sequence of data from the start, returning the final result."""
+
+    result = PatternMatchResult.NEED_MORE
+    state: MatchState = None
+    for datum in data:
+        result, state = element.match(datum, state, env)
+        if result != PatternMatchResult.NEED_MORE:
+            break
+    return result
+
+@dataclass(frozen=True)
 class FixedPatternElement(PatternElement):
     """Matches one specific datum."""
 
-    datum: bytes
+    datum: int
 
-    def reset(self) -> None:
-        # No state, nothing to do!
-        pass
+    __hash__ = structural_hash
 
-    def match(self, datum: bytes, _env: PatternMatchEnvironment) -> PatternMatchResult:
+    def match(self, datum: int, _state: MatchState, _env: PatternMatchEnvironment) -> Tuple[PatternMatchResult, MatchState]:
         if self.datum == datum:
-            return PatternMatchResult.SUCCESS
+            return PatternMatchResult.SUCCESS, None
         else:
-            return PatternMatchResult.FAILURE
-        
-    def start_hint(self) -> Optional[List[bytes]]:
+            return PatternMatchResult.FAILURE, None
+
+    def start_hint(self) -> Optional[List[int]]:
         return [self.datum]
 
-@dataclass
+    def literal_prefix(self) -> Tuple[List[int], bool]:
+        return [self.datum], True
+
+    def length_bounds(self) -> Tuple[int, int]:
+        return 1, 1
+
+# Classes with no more members than this are matched by looking datums up in a set of every
+# member, and give all of their members as a start hint
+MAX_CLASS_MEMBERS = 4096
+
+@dataclass(frozen=True)
+class ClassPatternElement(PatternElement):
+    """Matches any one datum out of a set, given as inclusive ranges of values."""
+
+    ranges: Tuple[Tuple[int, int], ...]
+
+    # Every member, unless there are too many to list
+    members: Optional[FrozenSet[int]] = field(init=False, compare=False, repr=False)
+
+    __hash__ = structural_hash
+
+    def __post_init__(self) -> None:
+        size = sum(high - low + 1 for low, high in self.ranges)
+        members = None
+        if size <= MAX_CLASS_MEMBERS:
+            members = frozenset(value for low, high in self.ranges for value in range(low, high + 1))
+        object.__setattr__(self, "members", members)
+
+    def contains(self, datum: int) -> bool:
+        if self.members is not None:
+            return datum in self.members
+        return any(low <= datum <= high for low, high in self.ranges)
+
+    def match(self, datum: int, _state: MatchState, _env: PatternMatchEnvironment) -> Tuple[PatternMatchResult, MatchState]:
+        if self.contains(datum):
+            return PatternMatchResult.SUCCESS, None
+        else:
+            return PatternMatchResult.FAILURE, None
+
+    def start_hint(self) -> Optional[List[int]]:
+        return sorted(self.members) if self.members is not None else None
+
+    def literal_prefix(self) -> Tuple[List[int], bool]:
+        return [], False
+
+    def length_bounds(self) -> Tuple[int, int]:
+        return 1, 1
+
+@dataclass(frozen=True)
 class SequencePatternElement(PatternElement):
     """Matches a sequence of different patterns, one after the other."""
 
-    pattern_elements: List[PatternElement]
+    # State: (index of current pattern element, state of current pattern element)
 
-    def __post_init__(self) -> None:
-        self.current_pattern_index = 0
+    pattern_elements: Tuple[PatternElement, ...]
+
+    __hash__ = structural_hash
 
-        if len(self.pattern_elements) == 0:
+    def __init__(self, pattern_elements: Sequence[PatternElement]) -> None:
+        if len(pattern_elements) == 0:
             raise ValueError("empty pattern list is not allowed")
-        
-    def reset(self) -> None:
-        # Revert to the first pattern element
-        self.current_pattern_index = 0
 
-        # Reset all child elements
-        for pe in self.pattern_elements:
-            pe.reset()
+        object.__setattr__(self, "pattern_elements", tuple(pattern_elements))
+
+    def match(self, datum: int, state: MatchState, env: PatternMatchEnvironment) -> Tuple[PatternMatchResult, MatchState]:
+        index, inner_state = (0, None) if state is None else state
 
-    def match(self, datum: bytes, env: PatternMatchEnvironment) -> PatternMatchResult:
-        result = self.pattern_elements[self.current_pattern_index].match(datum, env)
+        result, inner_state = self.pattern_elements[index].match(datum, inner_state, env)
         if result == PatternMatchResult.SUCCESS:
             # Move onto the next pattern
-            self.current_pattern_index += 1
+            index += 1
 
             # If we're now at the end, this is a match overall too!
-            if self.current_pattern_index >= len(self.pattern_elements):
-                return PatternMatchResult.SUCCESS
-            
-            return PatternMatchResult.NEED_MORE
-        
+            if index >= len(self.pattern_elements):
+                return PatternMatchResult.SUCCESS, None
+
+            return PatternMatchResult.NEED_MORE, (index, None)
+
         elif result == PatternMatchResult.FAILURE:
             # This is a failure too
-            return PatternMatchResult.FAILURE
-        
+            return PatternMatchResult.FAILURE, None
+
         elif result == PatternMatchResult.NEED_MORE:
             # Our current pattern needs more data, so we do too
-            return PatternMatchResult.NEED_MORE
-        
+            return PatternMatchResult.NEED_MORE, (index, inner_state)
+
         else:
             raise ValueError(f"unknown result: {result}")
-        
-    def start_hint(self) -> Optional[List[bytes]]:
+
+    @memoized
+    def start_hint(self) -> Optional[List[int]]:
         return self.pattern_elements[0].start_hint()
 
-@dataclass            
+    @memoized
+    def literal_prefix(self) -> Tuple[List[int], bool]:
+        prefix: List[int] = []
+        for pe in self.pattern_elements:
+            inner_prefix, complete = pe.literal_prefix()
+            prefix.extend(inner_prefix)
+            if not complete:
+                return prefix, False
+        return prefix, True
+
+    @memoized
+    def length_bounds(self) -> Tuple[int, int]:
+        bounds = [pe.length_bounds() for pe in self.pattern_elements]
+        return sum(low for low, _ in bounds), sum(high for _, high in bounds)
+
+@dataclass(frozen=True)
 class NamePatternElement(PatternElement):
     """A pattern element which wraps another, assigning a name to it."""
 
+    # State: the state of the wrapped element
+
     name: str
     pattern_element: PatternElement
 
-    def reset(self) -> None:
-        self.pattern_element.reset()
+    __hash__ = structural_hash
 
-    def match(self, datum: bytes, env: PatternMatchEnvironment) -> PatternMatchResult:
-        return self.pattern_element.match(datum, env)
-    
-    def start_hint(self) -> Optional[List[bytes]]:
+    @memoized
+    def template(self) -> NameTemplate:
+        """Get the parsed form of this element's name. Raises `ValueError` if it isn't valid."""
+        return NameTemplate.parse(self.name)
+
+    def match(self, datum: int, state: MatchState, env: PatternMatchEnvironment) -> Tuple[PatternMatchResult, MatchState]:
+        return self.pattern_element.match(datum, state, env)
+
+    def start_hint(self) -> Optional[List[int]]:
         return self.pattern_element.start_hint()
 
-@dataclass
+    def literal_prefix(self) -> Tuple[List[int], bool]:
+        return self.pattern_element.literal_prefix()
+
+    def length_bounds(self) -> Tuple[int, int]:
+        return self.pattern_element.length_bounds()
+
+@dataclass(frozen=True)
 class WildcardPatternElement(PatternElement):
     """A pattern element which matches any one datum."""
 
-    def reset(self) -> None:
-        pass
+    __hash__ = structural_hash
+
+    def match(self, _datum: int, _state: MatchState, _env: PatternMatchEnvironment) -> Tuple[PatternMatchResult, MatchState]:
+        return PatternMatchResult.SUCCESS, None
 
-    def match(self, _datum: bytes, _env: PatternMatchEnvironment) -> PatternMatchResult:
-        return PatternMatchResult.SUCCESS
-    
-    def start_hint(self) -> Optional[List[bytes]]:
+    def start_hint(self) -> Optional[List[int]]:
         return None
 
-@dataclass
+    def literal_prefix(self) -> Tuple[List[int], bool]:
+        return [], False
+
+    def length_bounds(self) -> Tuple[int, int]:
+        return 1, 1
+
+@dataclass(frozen=True)
 class CapturePatternElement(PatternElement):
     """A pattern element which captures the matched data, for use elsewhere in the pattern."""
-    
+
+    # State: (data captured so far, state of the wrapped element), or if matching against a
+    # `DataHistory`, (index of the first captured datum, state of the wrapped element)
+
     name: str
     pattern_element: PatternElement
 
-    def __post_init__(self) -> None:
-        self.capture_buffer = bytes()
+    __hash__ = structural_hash
 
-    def reset(self) -> None:
-        self.capture_buffer = bytes()
-        self.pattern_element.reset()
+    def match(self, datum: int, state: MatchState, env: PatternMatchEnvironment) -> Tuple[PatternMatchResult, MatchState]:
+        history = env.history
+        if history is not None:
+            return self.match_in_history(history, datum, state, env)
 
-    def match(self, datum: bytes, env: PatternMatchEnvironment) -> PatternMatchResult:
-        result = self.pattern_element.match(datum, env)
+        capture_buffer, inner_state = ((), None) if state is None else state
 
-        # Push datum if it didn't cause a failure
-        if result == PatternMatchResult.SUCCESS or result == PatternMatchResult.NEED_MORE:
-            self.capture_buffer += datum
+        result, inner_state = self.pattern_element.match(datum, inner_state, env)
 
         # If success, submit capture
         if result == PatternMatchResult.SUCCESS:
-            env.add_capture(self.name, self.capture_buffer)
+            env.add_capture(self.name, capture_buffer + (datum,))
+            return result, None
 
-        return result
-    
-    def start_hint(self) -> Optional[List[bytes]]:
+        # Push datum if it didn't cause a failure
+        if result == PatternMatchResult.NEED_MORE:
+            return result, (capture_buffer + (datum,), inner_state)
+
+        return result, None
+
+    def match_in_history(self, history: DataHistory[Any], datum: int, state: MatchState, env: PatternMatchEnvironment) -> Tuple[PatternMatchResult, MatchState]:
+        # The datum being matched is the latest in the history
+        start, inner_state = (history.end_index - 1, None) if state is None else state
+
+        result, inner_state = self.pattern_element.match(datum, inner_state, env)
+
+        # If success, submit the range of data captured
+        if result == PatternMatchResult.SUCCESS:
+            env.add_span(self.name, start, history.end_index)
+            return result, None
+
+        if result == PatternMatchResult.NEED_MORE:
+            return result, (start, inner_state)
+
+        return result, None
+
+    def start_hint(self) -> Optional[List[int]]:
         return self.pattern_element.start_hint()
-        
-@dataclass
+
+    def literal_prefix(self) -> Tuple[List[int], bool]:
+        return self.pattern_element.literal_prefix()
+
+    def length_bounds(self) -> Tuple[int, int]:
+        return self.pattern_element.length_bounds()
+
+@dataclass(frozen=True)
 class RepeatPatternElement(PatternElement):
     """A pattern element which captures a given number of repeats of the matched data."""
 
+    # State: (number of repeats seen so far, state of the current repeat)
+
     pattern_element: PatternElement
     quantity: int
-    quantity_seen_so_far: int = 0
 
-    def reset(self) -> None:
-        self.quantity_seen_so_far = 0
-        self.pattern_element.reset()
+    __hash__ = structural_hash
+
+    def match(self, datum: int, state: MatchState, env: PatternMatchEnvironment) -> Tuple[PatternMatchResult, MatchState]:
+        quantity_seen_so_far, inner_state = (0, None) if state is None else state
 
-    def match(self, datum: bytes, env: PatternMatchEnvironment) -> PatternMatchResult:
-        result = self.pattern_element.match(datum, env)
+        result, inner_state = self.pattern_element.match(datum, inner_state, env)
         if result == PatternMatchResult.SUCCESS:
             # Move onto the next "iteration" of this same pattern
-            self.quantity_seen_so_far += 1
-            self.pattern_element.reset()
+            quantity_seen_so_far += 1
 
             # If we've hit the desired quantity, this is a match too!
-            if self.quantity_seen_so_far == self.quantity:
-                return PatternMatchResult.SUCCESS
-            
-            return PatternMatchResult.NEED_MORE
-        
+            if quantity_seen_so_far == self.quantity:
+                return PatternMatchResult.SUCCESS, None
+
+            return PatternMatchResult.NEED_MORE, (quantity_seen_so_far, None)
+
         elif result == PatternMatchResult.FAILURE:
             # This is a failure too
-            return PatternMatchResult.FAILURE
-        
+            return PatternMatchResult.FAILURE, None
+
         elif result == PatternMatchResult.NEED_MORE:
             # Our current pattern needs more data, so we do too
-            return PatternMatchResult.NEED_MORE
-        
+            return PatternMatchResult.NEED_MORE, (quantity_seen_so_far, inner_state)
+
+        else:
+            raise ValueError("unknown result from inner pattern")
+
+    def start_hint(self) -> Optional[List[int]]:
+        return self.pattern_element.start_hint()
+
+    @memoized
+    def literal_prefix(self) -> Tuple[List[int], bool]:
+        if self.quantity == 0:
+            return [], False
+
+        inner_prefix, complete = self.pattern_element.literal_prefix()
+        if complete:
+            return inner_prefix * self.quantity, True
+        return inner_prefix, False
+
+    @memoized
+    def length_bounds(self) -> Tuple[int, int]:
+        low, high = self.pattern_element.length_bounds()
+        return low * self.quantity, high * self.quantity
+
+@dataclass(frozen=True)
+class AlternationPatternElement(PatternElement):
+    """
+    Matches any one of several patterns.
+
+    If more than one alternative could match, the first to complete is chosen, and if several
+    complete on the same datum, the one written first is.
+    """
+
+    # State: a tuple of (alternative index, state of the alternative, environment) for each
+    # alternative still in flight, in order. Alternatives which capture are given an environment
+    # of their own, so that only the chosen alternative's captures are kept. It's created for this
+    # state alone, so is never shared.
+
+    alternatives: Tuple[PatternElement, ...]
+
+    # The alternatives (by index) to try for each datum which some alternative has as a start
+    # hint, and those to try for any other datum, in order
+    alternatives_by_datum: Dict[int, Tuple[int, ...]] = field(init=False, compare=False, repr=False)
+    alternatives_otherwise: Tuple[int, ...] = field(init=False, compare=False, repr=False)
+
+    # Whether each alternative makes any captures
+    capturing: Tuple[bool, ...] = field(init=False, compare=False, repr=False)
+
+    __hash__ = structural_hash
+
+    def __init__(self, alternatives: Sequence[PatternElement]) -> None:
+        if len(alternatives) == 0:
+            raise ValueError("empty alternative list is not allowed")
+
+        object.__setattr__(self, "alternatives", tuple(alternatives))
+
+        hinted: Dict[int, List[int]] = {}
+        unhinted: List[int] = []
+        for index, alternative in enumerate(self.alternatives):
+            hints = alternative.start_hint()
+            if hints is None:
+                unhinted.append(index)
+            else:
+                for hint in hints:
+                    hinted.setdefault(hint, []).append(index)
+
+        object.__setattr__(self, "alternatives_otherwise", tuple(unhinted))
+        object.__setattr__(self, "alternatives_by_datum", {
+            datum: tuple(sorted(indices + unhinted))
+            for datum, indices in hinted.items()
+        })
+        object.__setattr__(self, "capturing", tuple(bool(capture_names(a)) for a in self.alternatives))
+
+    def match(self, datum: int, state: MatchState, env: PatternMatchEnvironment) -> Tuple[PatternMatchResult, MatchState]:
+        if state is None:
+            # Only look at the alternatives which could start with this datum
+            indices = self.alternatives_by_datum.get(datum, self.alternatives_otherwise)
+            state = tuple((index, None, env.snapshot() if self.capturing[index] else None) for index in indices)
+
+        remaining = []
+        for index, inner_state, inner_env in state:
+            result, inner_state = self.alternatives[index].match(datum, inner_state, env if inner_env is None else inner_env)
+            if result == PatternMatchResult.SUCCESS:
+                if inner_env is not None:
+                    env.captures.update(inner_env.captures)
+                    env.spans.update(inner_env.spans)
+                return PatternMatchResult.SUCCESS, None
+
+            elif result == PatternMatchResult.NEED_MORE:
+                remaining.append((index, inner_state, inner_env))
+
+        if not remaining:
+            return PatternMatchResult.FAILURE, None
+        return PatternMatchResult.NEED_MORE, tuple(remaining)
+
+    @memoized
+    def start_hint(self) -> Optional[List[int]]:
+        if self.alternatives_otherwise:
+            return None
+        return sorted(self.alternatives_by_datum)
+
+    def literal_prefix(self) -> Tuple[List[int], bool]:
+        return [], False
+
+    @memoized
+    def length_bounds(self) -> Tuple[int, int]:
+        bounds = [a.length_bounds() for a in self.alternatives]
+        return min(low for low, _ in bounds), max(high for _, high in bounds)
+
+# The maximum length of an element which can match any amount of data
+UNBOUNDED_LENGTH = sys.maxsize
+
+@dataclass(frozen=True)
+class CountedRepeatPatternElement(PatternElement):
+    """
+    A pattern element which matches another a number of times given by an earlier capture, like a
+    payload following its length.
+
+    The count is the captured words read as one integer, plus `offset`. If it isn't at least one,
+    this fails to match. The capture is at most `count_length` words long, which bounds the count.
+    """
+
+    # State: if `skip_length` isn't `None`, the number of data still to skip over. Otherwise,
+    # (number of repeats still needed, state of the current repeat)
+
+    pattern_element: PatternElement
+    count_capture: str
+    little_endian: bool = False
+    offset: int = 0
+    word_width: int = DEFAULT_WORD_WIDTH
+    count_length: int = UNBOUNDED_LENGTH
+
+    # If each repeat is certain to match a fixed number of data without capturing anything, that
+    # number, so the whole repeat can be matched by counting data rather than matching each one
+    skip_length: Optional[int] = field(init=False, compare=False, repr=False)
+
+    __hash__ = structural_hash
+
+    def __post_init__(self) -> None:
+        skip_length = None
+        low, high = self.pattern_element.length_bounds()
+        if low == high and irrefutable(self.pattern_element) and not capture_names(self.pattern_element):
+            skip_length = low
+        object.__setattr__(self, "skip_length", skip_length)
+
+    def count(self, env: PatternMatchEnvironment) -> int:
+        """Get the number of repeats to match, or 0 if the count hasn't been captured."""
+
+        data = env.capture(self.count_capture)
+        if data is None:
+            return 0
+        return words_to_integer(data, self.little_endian, self.word_width) + self.offset
+
+    def match(self, datum: int, state: MatchState, env: PatternMatchEnvironment) -> Tuple[PatternMatchResult, MatchState]:
+        if self.skip_length is not None:
+            if state is None:
+                count = self.count(env)
+                if count < 1:
+                    return PatternMatchResult.FAILURE, None
+                state = count * self.skip_length
+
+            state -= 1
+            if state == 0:
+                return PatternMatchResult.SUCCESS, None
+            return PatternMatchResult.NEED_MORE, state
+
+        if state is None:
+            remaining, inner_state = self.count(env), None
+            if remaining < 1:
+                return PatternMatchResult.FAILURE, None
+        else:
+            remaining, inner_state = state
+
+        result, inner_state = self.pattern_element.match(datum, inner_state, env)
+        if result == PatternMatchResult.SUCCESS:
+            remaining -= 1
+            if remaining == 0:
+                return PatternMatchResult.SUCCESS, None
+            return PatternMatchResult.NEED_MORE, (remaining, None)
+
+        elif result == PatternMatchResult.FAILURE:
+            return PatternMatchResult.FAILURE, None
+
+        elif result == PatternMatchResult.NEED_MORE:
+            return PatternMatchResult.NEED_MORE, (remaining, inner_state)
+
         else:
             raise ValueError("unknown result from inner pattern")
 
-    def start_hint(self) -> Optional[List[bytes]]:
+    def start_hint(self) -> Optional[List[int]]:
         return self.pattern_element.start_hint()
+
+    def literal_prefix(self) -> Tuple[List[int], bool]:
+        # Whatever the count, there's at least one repeat
+        inner_prefix, _ = self.pattern_element.literal_prefix()
+        return inner_prefix, False
+
+    @memoized
+    def length_bounds(self) -> Tuple[int, int]:
+        low, high = self.pattern_element.length_bounds()
+        min_count = max(self.offset, 1)
+
+        # A count of 64 bits or more could repeat more than any length can be
+        count_bits = self.word_width * self.count_length
+        if high == 0 or count_bits >= 64:
+            return low * min_count, UNBOUNDED_LENGTH if high > 0 else 0
+
+        max_count = max((1 << count_bits) - 1 + self.offset, min_count)
+        return low * min_count, min(high * max_count, UNBOUNDED_LENGTH)
+
+def capture_names(element: PatternElement, certain: bool = False) -> Set[str]:
+    """
+    Get the names of every capture made anywhere within an element or, if `certain`, only those
+    which every successful match makes.
+    """
+
+    names: Set[str] = set()
+    stack = [element]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, CapturePatternElement):
+            names.add(current.name)
+        if isinstance(current, SequencePatternElement):
+            stack.extend(current.pattern_elements)
+        elif isinstance(current, AlternationPatternElement):
+            if certain:
+                names |= set.intersection(*(capture_names(a, True) for a in current.alternatives))
+            else:
+                stack.extend(current.alternatives)
+        elif isinstance(current, (NamePatternElement, CapturePatternElement, RepeatPatternElement, CountedRepeatPatternElement)):
+            stack.append(current.pattern_element)
+    return names
+
+def irrefutable(element: PatternElement) -> bool:
+    """Whether an element is certain to match any data."""
+
+    if isinstance(element, WildcardPatternElement):
+        return True
+    elif isinstance(element, SequencePatternElement):
+        return all(irrefutable(pe) for pe in element.pattern_elements)
+    elif isinstance(element, (NamePatternElement, CapturePatternElement)):
+        return irrefutable(element.pattern_element)
+    elif isinstance(element, RepeatPatternElement):
+        # A repeat of nothing never completes
+        return element.quantity > 0 and irrefutable(element.pattern_element)
+    elif isinstance(element, AlternationPatternElement):
+        return any(irrefutable(a) for a in element.alternatives)
+    else:
+        return False
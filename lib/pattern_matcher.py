@@ -0,0 +1,620 @@
+import heapq
+from dataclasses import dataclass
+from typing import Any, Dict, Generic, List, Optional, Sequence, Tuple, TypeVar
+from .byte_formatter import DEFAULT_WORD_WIDTH, Words
+from .data_history import DataHistory
+from .pattern_element import PatternElement, PatternMatchEnvironment, PatternMatchResult, MatchState, match_data
+from .prefix_index import PrefixIndex
+from .pattern_trie import PatternTrieNode, build_pattern_trie
+from .pattern_automaton import Alphabet, AutomatonProgram, LazyAutomaton, compile_program, DEFAULT_MAX_STATES
+
+# The type of timestamps attached to data. Within Logic2 this is `SaleaeTime`, but the matcher
+# doesn't care, so that it can be used elsewhere too.
+T = TypeVar("T")
+
+@dataclass
+class PatternMatch(Generic[T]):
+    """A successful match of one of the top-level patterns."""
+
+    pattern: PatternElement
+    captures: Dict[str, Words]
+    start_time: T
+    end_time: T
+
+    # The width of the captured words, in bits
+    word_width: int = DEFAULT_WORD_WIDTH
+
+class PatternMatchCandidate(Generic[T]):
+    """
+    A position in the pattern trie which is part-way through matching incoming data.
+
+    The patterns themselves are shared between all candidates - only the match state is specific
+    to this candidate. These are created for almost every datum, so are recycled rather than
+    reallocated.
+    """
+
+    __slots__ = ("node", "state", "at_junction", "env", "start_index", "start_time")
+
+    # The node whose element is being matched or, if `at_junction`, the node whose element has
+    # just finished matching, so that one of its children will be matched next
+    node: PatternTrieNode
+    state: MatchState
+    at_junction: bool
+
+    env: PatternMatchEnvironment
+    start_index: int
+    start_time: T
+
+    def __init__(self, node: PatternTrieNode, start_index: int, start_time: T, history: DataHistory[T]) -> None:
+        self.env = PatternMatchEnvironment(history=history)
+        self.reuse(node, start_index, start_time)
+
+    def reuse(self, node: PatternTrieNode, start_index: int, start_time: T) -> None:
+        """Reinitialise this candidate to start matching from a new node."""
+
+        self.node = node
+        self.state = None
+        self.at_junction = False
+        self.env.captures.clear()
+        self.env.spans.clear()
+        self.start_index = start_index
+        self.start_time = start_time
+
+# A pattern which the interpreter found a match for, as (start index, pattern index, captures,
+# start time). The captured data isn't copied out of the history unless the match is emitted.
+InterpreterCompletion = Tuple[int, int, PatternMatchEnvironment, T]
+
+# Anything which completed on a datum, as (start index, rank, pattern index, interpreter
+# completion). The interpreter completion is None for automaton matches, whose captures haven't
+# been found yet.
+Completion = Tuple[int, int, int, Optional[InterpreterCompletion[T]]]
+
+# A completed match being held back until it's certain that nothing overlapping it will be chosen
+# instead, as (start index, negated end index, rank, sequence number, pattern index, interpreter
+# completion, end time). These are kept in a heap, so the first is the earliest-starting, then the
+# longest, then the highest-priority - which is the one that would be chosen. The sequence number
+# keeps the order stable without comparing completions.
+HeldMatch = Tuple[int, int, int, int, int, Optional[InterpreterCompletion[T]], T]
+
+# The maximum number of spare candidates kept for reuse
+CANDIDATE_POOL_SIZE = 1024
+
+# The maximum number of candidates in flight at once, by default
+DEFAULT_MAX_CANDIDATES = 4096
+
+# The length the data history can reach before it's first trimmed
+HISTORY_TRIM_LENGTH = 4096
+
+def pattern_ranks(patterns: Sequence[PatternElement]) -> List[int]:
+    """
+    Work out the order in which patterns take priority if they start and complete on the same
+    data.
+
+    This preserves the original behaviour of the analyzer, where candidates for patterns with a
+    start hint were created before those without one, and the first created would win a tie.
+    """
+
+    hinted = [i for i, p in enumerate(patterns) if p.start_hint() is not None]
+    unhinted = [i for i, p in enumerate(patterns) if p.start_hint() is None]
+
+    ranks = [0] * len(patterns)
+    for rank, index in enumerate(hinted + unhinted):
+        ranks[index] = rank
+    return ranks
+
+def start_index_of(candidate: PatternMatchCandidate[Any]) -> int:
+    return candidate.start_index
+
+class CandidateInterpreter(Generic[T]):
+    """
+    Matches patterns by keeping a candidate for every position each one could start at, and
+    feeding each datum through all of them.
+
+    Patterns are merged into a trie on their common leading elements, so that a single candidate
+    walks any shared section and only splits where the patterns diverge.
+
+    Paths through the trie which start with literal data aren't given a candidate until a
+    `PrefixIndex` has seen that whole prefix, at which point the candidate is created with its
+    start back-dated. Any others get a candidate whenever their start hint allows.
+
+    Candidates which can no longer be chosen by the overlap rules are dropped early. If there are
+    still more than `max_candidates` in flight, the latest-starting are evicted, because they are
+    the least likely to be chosen.
+
+    Candidates capture data by referring to the shared `history`, which whoever is feeding this
+    interpreter must append each datum to before stepping it.
+
+    `candidates` is kept in order of start index, so the earliest-starting is always first.
+
+    This can handle every kind of pattern element, but is much slower than `LazyAutomaton`.
+    """
+
+    def __init__(self, patterns: Sequence[PatternElement], pattern_indices: Sequence[int], history: DataHistory[T], max_candidates: int = DEFAULT_MAX_CANDIDATES, prune: bool = True) -> None:
+        self.history = history
+        self.max_candidates = max(max_candidates, 1)
+        self.candidates: List[PatternMatchCandidate[T]] = []
+        self.pool: List[PatternMatchCandidate[T]] = []
+        self.completions: List[InterpreterCompletion[T]] = []
+
+        self.root = build_pattern_trie(patterns, pattern_indices)
+
+        # Index the literal paths through the trie. Only nodes where something happens next need to
+        # be found - other nodes are just on the way to a longer literal path.
+        self.prefix_index = PrefixIndex()
+        self.prefix_node = PrefixIndex.ROOT
+        self.literal_nodes: List[PatternTrieNode] = []
+        self.max_prefix_length = 1
+        for node in self.root.walk():
+            if node is self.root or node.literal_path is None:
+                continue
+            if node.terminals or node.has_next:
+                self.prefix_index.add(node.literal_path, len(self.literal_nodes))
+                self.literal_nodes.append(node)
+                self.max_prefix_length = max(self.max_prefix_length, len(node.literal_path))
+        self.prefix_index.build()
+
+        # Only look for doomed candidates if some pattern can be certain to complete. This relies on
+        # every other candidate being discarded when a match is emitted, so can be turned off.
+        self.can_prune = prune and any(node.certain_future is not None for node in self.root.walk())
+
+        # Candidates dropped because they couldn't be chosen, and because there were too many
+        self.pruned = 0
+        self.evictions = 0
+
+        # Candidates are only created for literal prefixes which start at or after this index
+        self.min_start_index = 0
+
+    def reset(self) -> None:
+        """Discard all in-flight candidates."""
+
+        self.prefix_node = PrefixIndex.ROOT
+        for candidate in self.candidates:
+            self.recycle(candidate)
+        self.candidates.clear()
+
+    def discard_through(self, index: int) -> None:
+        """Discard every in-flight candidate which started at or before an index."""
+
+        count = 0
+        while count < len(self.candidates) and self.candidates[count].start_index <= index:
+            self.recycle(self.candidates[count])
+            count += 1
+        del self.candidates[:count]
+        self.min_start_index = index + 1
+
+    def earliest_start(self, index: int) -> Optional[int]:
+        """
+        Get the earliest index at which something in flight after `index` started, if anything is:
+        either a candidate, or a literal prefix which hasn't been seen in full yet.
+        """
+
+        earliest_start = self.candidates[0].start_index if self.candidates else None
+
+        unfinished = self.prefix_index.unfinished[self.prefix_node]
+        if unfinished > 0:
+            prefix_start = max(index - unfinished + 1, self.min_start_index)
+            if earliest_start is None or prefix_start < earliest_start:
+                earliest_start = prefix_start
+
+        return earliest_start
+
+    def recycle(self, candidate: PatternMatchCandidate[T]) -> None:
+        """Return a candidate which is no longer needed to the pool."""
+
+        if len(self.pool) < CANDIDATE_POOL_SIZE:
+            self.pool.append(candidate)
+
+    def spawn(self, node: PatternTrieNode, start_index: int, start_time: T) -> PatternMatchCandidate[T]:
+        """Create a new candidate, from the pool if possible."""
+
+        if self.pool:
+            candidate = self.pool.pop()
+            candidate.reuse(node, start_index, start_time)
+            return candidate
+        return PatternMatchCandidate(node, start_index, start_time, self.history)
+
+    def fork(self, candidate: PatternMatchCandidate[T], node: PatternTrieNode) -> PatternMatchCandidate[T]:
+        """Create a copy of a candidate at a junction, to match a different child."""
+
+        forked = self.spawn(node, candidate.start_index, candidate.start_time)
+        forked.env.captures.update(candidate.env.captures)
+        forked.env.spans.update(candidate.env.spans)
+        return forked
+
+    def step(self, datum: int, index: int, start_time: T) -> List[InterpreterCompletion[T]]:
+        """Feed a datum through every candidate, returning the patterns which matched."""
+
+        self.completions = []
+        remaining: List[PatternMatchCandidate[T]] = []
+
+        # Pipe datum into each candidate
+        for candidate in self.candidates:
+            if candidate.at_junction:
+                next_nodes = candidate.node.next_nodes(datum)
+                if not next_nodes:
+                    self.recycle(candidate)
+                    continue
+
+                # Split the candidate if the patterns diverge here
+                for node in next_nodes[1:]:
+                    self.advance(self.fork(candidate, node), datum, remaining)
+                candidate.node = next_nodes[0]
+                candidate.state = None
+                candidate.at_junction = False
+
+            self.advance(candidate, datum, remaining)
+
+        # Create a new candidate for each pattern which could start here
+        for node in self.root.next_nodes(datum):
+            self.advance(self.spawn(node, index, start_time), datum, remaining)
+
+        # Create candidates for patterns whose literal prefix has just been seen. These are already
+        # past this datum, and started before it, so may be out of order.
+        self.prefix_node = self.prefix_index.step(self.prefix_node, datum)
+        outputs = self.prefix_index.outputs[self.prefix_node]
+        for key, prefix_length in outputs:
+            start_index = index - prefix_length + 1
+            if start_index < self.min_start_index:
+                continue
+
+            node = self.literal_nodes[key]
+            candidate = self.spawn(node, start_index, self.history.time_at(start_index))
+            candidate.env.captures.update(node.literal_captures)
+            self.arrive(candidate, remaining)
+        if outputs and len(remaining) > 1:
+            # Only the few back-dated candidates at the end are out of place
+            remaining.sort(key=start_index_of)
+
+        self.candidates = remaining
+        if self.can_prune:
+            self.prune(index)
+        if len(self.candidates) > self.max_candidates:
+            self.evict()
+
+        return self.completions
+
+    def oldest_needed(self, index: int) -> int:
+        """
+        Get the index of the oldest datum in the history which could still be needed, either by an
+        in-flight candidate or to back-date a literal prefix ending after `index`.
+        """
+        if self.candidates:
+            return min(self.candidates[0].start_index, index + 1 - self.max_prefix_length)
+        return index + 1 - self.max_prefix_length
+
+    def prune(self, index: int) -> None:
+        """
+        Drop candidates which can't be chosen, because an earlier-starting candidate is certain to
+        complete before (or at the same time as) they possibly could.
+        """
+
+        # Find the earliest-starting candidate which is certain to complete, and when it will
+        certain: Optional[Tuple[int, int]] = None
+        for candidate in self.candidates:
+            if candidate.at_junction and candidate.node.certain_future is not None:
+                start_and_end = (candidate.start_index, index + candidate.node.certain_future)
+                if certain is None or start_and_end < certain:
+                    certain = start_and_end
+        if certain is None:
+            return
+
+        certain_start, certain_end = certain
+        remaining = []
+        for candidate in self.candidates:
+            if candidate.start_index > certain_start and self.earliest_end(candidate, index) >= certain_end:
+                self.pruned += 1
+                self.recycle(candidate)
+            else:
+                remaining.append(candidate)
+        self.candidates = remaining
+
+    def earliest_end(self, candidate: PatternMatchCandidate[T], index: int) -> int:
+        """Get the earliest index at which a candidate could complete a pattern."""
+
+        node = candidate.node
+        if candidate.at_junction:
+            return index + node.min_future
+
+        # Part-way through the element of its node, which needs at least one more datum
+        return index + 1 + (0 if node.terminals else node.min_future)
+
+    def evict(self) -> None:
+        """Drop the latest-starting candidates, until there are no more than `max_candidates`."""
+
+        for candidate in self.candidates[self.max_candidates:]:
+            self.recycle(candidate)
+        self.evictions += len(self.candidates) - self.max_candidates
+        del self.candidates[self.max_candidates:]
+
+    def advance(self, candidate: PatternMatchCandidate[T], datum: int, remaining: List[PatternMatchCandidate[T]]) -> None:
+        """Match one datum against the current element of a candidate."""
+
+        element = candidate.node.element
+        assert element is not None
+
+        match_result, candidate.state = element.match(datum, candidate.state, candidate.env)
+        if match_result == PatternMatchResult.SUCCESS:
+            self.arrive(candidate, remaining)
+        elif match_result == PatternMatchResult.NEED_MORE:
+            # Could still match, we don't know yet. Keep it around
+            remaining.append(candidate)
+        else:
+            # No match - throw it away
+            self.recycle(candidate)
+
+    def arrive(self, candidate: PatternMatchCandidate[T], remaining: List[PatternMatchCandidate[T]]) -> None:
+        """Handle a candidate which has just finished matching the element of its node."""
+
+        node = candidate.node
+
+        # Any patterns which end here have matched - store them so we can possibly make them into
+        # a frame later
+        for pattern_index in node.terminals:
+            self.completions.append((candidate.start_index, pattern_index, candidate.env.snapshot(), candidate.start_time))
+
+        if node.has_next:
+            candidate.at_junction = True
+            remaining.append(candidate)
+        else:
+            self.recycle(candidate)
+
+class PatternMatcher(Generic[T]):
+    """
+    Finds occurrences of a set of top-level patterns in a stream of data.
+
+    Patterns which can be compiled into a `LazyAutomaton` are recognised by it with a single table
+    lookup per datum; any others are handled by a `CandidateInterpreter`. Captures for automaton
+    matches are recovered by replaying the interpreter over only the winning match.
+
+    HLAs can't produce overlapping annotations, so if several patterns complete on the same datum,
+    the one which started first is chosen. Then, every other in-flight match is discarded.
+
+    Alternatively, if `max_latency` is given, matches are chosen leftmost-longest: a completed match
+    is held back while anything in flight could still complete an earlier-starting or longer match
+    which overlaps it, and the best of these is emitted. Nothing is held for more than `max_latency`
+    data after it completed, at which point the best so far is emitted regardless. In this mode,
+    several matches can be emitted at once, so use `feed_all` rather than `feed`.
+
+    Data are words of `word_width` bits, which the patterns must have been parsed for.
+
+    If the patterns have already been compiled into automaton programs, such as by an
+    `IncrementalCompiler`, these can be given as `programs` along with the `alphabet` they were
+    compiled with, which is then owned by this matcher.
+    """
+
+    def __init__(self, patterns: Sequence[PatternElement], use_automaton: bool = True, max_automaton_states: int = DEFAULT_MAX_STATES, max_candidates: int = DEFAULT_MAX_CANDIDATES, word_width: int = DEFAULT_WORD_WIDTH, max_latency: Optional[int] = None, alphabet: Optional[Alphabet] = None, programs: Optional[Sequence[Optional[AutomatonProgram]]] = None) -> None:
+        self.patterns = list(patterns)
+        self.ranks = pattern_ranks(self.patterns)
+        self.word_width = word_width
+
+        # Split patterns between the automaton and the interpreter
+        if programs is None or alphabet is None:
+            alphabet = Alphabet()
+            programs = [compile_program(p, alphabet) if use_automaton else None for p in self.patterns]
+        self.automaton_indices = [i for i, program in enumerate(programs) if program is not None]
+        interpreted_indices = [i for i, program in enumerate(programs) if program is None]
+
+        self.automaton = LazyAutomaton(
+            [program for program in programs if program is not None],
+            [self.ranks[i] for i in self.automaton_indices],
+            alphabet,
+            max_states=max_automaton_states,
+            discard_on_match=max_latency is None,
+        )
+
+        # Recent data, which interpreter captures refer to, and which automaton matches are
+        # replayed over to find their captures
+        self.history: DataHistory[T] = DataHistory(word_width)
+        self.history_limit = HISTORY_TRIM_LENGTH
+        self.replay_length = max((len(program) for program in programs if program is not None), default=1)
+        self.index = 0
+
+        self.interpreter: CandidateInterpreter[T] = CandidateInterpreter(self.patterns, interpreted_indices, self.history, max_candidates, prune=max_latency is None)
+
+        # Completed matches which haven't been emitted yet, if choosing leftmost-longest
+        self.max_latency = max_latency
+        self.held: List[HeldMatch[T]] = []
+        self.held_count = 0
+
+    def reset(self) -> None:
+        """Discard all in-flight matches. Completed matches which are being held back are kept."""
+
+        self.automaton.reset()
+        self.interpreter.reset()
+
+    def feed(self, datum: int, start_time: T, end_time: T) -> Optional[PatternMatch[T]]:
+        """
+        Process one datum, returning a match if one completed on it.
+
+        This can't be used if matches are chosen leftmost-longest - see `feed_all`.
+        """
+
+        if self.max_latency is not None:
+            raise ValueError("several matches can be emitted at once when choosing leftmost-longest, so use `feed_all`")
+
+        index = self.record(datum, start_time)
+        completions = self.step(datum, index, start_time)
+        if not completions:
+            return None
+
+        # Find the "longest" match
+        # TODO: more control over what to do?
+        start_index, _, pattern_index, completion = self.choose(completions)
+
+        # Discard other candidates.
+        # The one we just matched is marked with ~, others with -.
+        # None of these are allowed:
+        #
+        #      |~~~~|           |~~~~|          |~~~~|
+        #        |---         |-------               |
+        #
+        # This isn't possible (because the match just ended, so we'd have to time-travel)
+        #
+        #      |~~~~|
+        #   |-----|
+        #
+        # That covers all possibilities, so empty the candidate list.
+        self.reset()
+
+        return self.emit(start_index, index, pattern_index, completion, end_time)
+
+    def feed_all(self, datum: int, start_time: T, end_time: T) -> List[PatternMatch[T]]:
+        """Process one datum, returning every match which is ready to be emitted, in order."""
+
+        if self.max_latency is None:
+            match = self.feed(datum, start_time, end_time)
+            return [] if match is None else [match]
+
+        index = self.record(datum, start_time)
+        for start_index, rank, pattern_index, completion in self.step(datum, index, start_time):
+            heapq.heappush(self.held, (start_index, -index, rank, self.held_count, pattern_index, completion, end_time))
+            self.held_count += 1
+
+        return self.release(index, self.max_latency)
+
+    def flush(self) -> List[PatternMatch[T]]:
+        """
+        Emit every match which is being held back, because no more data is coming. Matches which
+        are still in flight are abandoned.
+        """
+
+        if not self.held:
+            return []
+        return self.release(self.index - 1, 0)
+
+    def boundary(self) -> List[PatternMatch[T]]:
+        """
+        Note that no match can continue past this point in the data, such as at the end of an I2C
+        transfer. Matches which are still in flight are abandoned, so every match which is being
+        held back can be emitted.
+        """
+
+        self.reset()
+        return self.flush()
+
+    def record(self, datum: int, start_time: T) -> int:
+        """Add a datum to the history, returning its index."""
+
+        index = self.index
+        self.index += 1
+        self.history.append(datum, start_time)
+        if len(self.history) >= self.history_limit:
+            self.trim_history(index)
+        return index
+
+    def release(self, index: int, max_latency: int) -> List[PatternMatch[T]]:
+        """
+        Emit the held matches which can't be beaten by anything still in flight, or which have
+        been held for `max_latency` data since completing, as of the datum at `index`.
+        """
+
+        matches = []
+        while self.held:
+            start_index, negated_end_index, _, _, pattern_index, completion, end_time = self.held[0]
+            end_index = -negated_end_index
+
+            # Anything in flight which started at or before this could finish an earlier-starting
+            # or longer match. Everything else in flight overlaps this match, so can only be chosen
+            # if it starts after it.
+            if index - end_index < max_latency:
+                earliest_start = self.earliest_in_flight(index)
+                if earliest_start is not None and earliest_start <= start_index:
+                    break
+
+            heapq.heappop(self.held)
+            matches.append(self.emit(start_index, end_index, pattern_index, completion, end_time))
+            self.discard_through(index, end_index)
+
+        return matches
+
+    def earliest_in_flight(self, index: int) -> Optional[int]:
+        """Get the start index of the earliest-starting match in flight after `index`, if any."""
+
+        earliest_start = self.interpreter.earliest_start(index)
+        longest_thread = self.automaton.current_state.longest_thread
+        if longest_thread > 0:
+            automaton_start = index - longest_thread + 1
+            if earliest_start is None or automaton_start < earliest_start:
+                earliest_start = automaton_start
+        return earliest_start
+
+    def discard_through(self, index: int, end_index: int) -> None:
+        """
+        After the datum at `index`, discard every held or in-flight match which started at or
+        before `end_index`, because a match ending there has been emitted.
+        """
+
+        while self.held and self.held[0][0] <= end_index:
+            heapq.heappop(self.held)
+        self.automaton.discard_started_within(index - end_index)
+        self.interpreter.discard_through(end_index)
+
+    def emit(self, start_index: int, end_index: int, pattern_index: int, completion: Optional[InterpreterCompletion[T]], end_time: T) -> PatternMatch[T]:
+        """Create the match to emit for a completion, copying out its captures."""
+
+        pattern = self.patterns[pattern_index]
+        if completion is not None:
+            _, _, env, match_start_time = completion
+            return PatternMatch(pattern, env.materialize(), match_start_time, end_time, self.word_width)
+        else:
+            return self.replay(pattern, start_index, end_index, end_time)
+
+    def trim_history(self, index: int) -> None:
+        """Discard data from the history which nothing can need any more."""
+
+        self.history.discard_before(self.oldest_needed(index))
+
+        # Wait until the history has doubled before trimming again, so that the cost of finding
+        # what's needed is spread across many data
+        self.history_limit = max(HISTORY_TRIM_LENGTH, 2 * len(self.history))
+
+    def oldest_needed(self, index: int) -> int:
+        """
+        Get the index of the oldest datum which could be needed by a match ending after `index`, or
+        a match being held back.
+        """
+
+        oldest = min(index + 1 - self.replay_length, self.interpreter.oldest_needed(index))
+        if self.held:
+            oldest = min(oldest, self.held[0][0])
+        return oldest
+
+    def step(self, datum: int, index: int, start_time: T) -> List[Completion[T]]:
+        """Feed a datum to the automaton and the interpreter, gathering up everything which completed."""
+
+        completions: List[Completion[T]] = []
+
+        # When choosing leftmost-longest, a match which loses now may still be emitted if the
+        # winner is later discarded, so every completion is needed
+        symbol = self.automaton.alphabet.symbol(datum)
+        automaton_completed: Tuple[int, ...]
+        if self.max_latency is None:
+            automaton_winner = self.automaton.step(symbol)
+            automaton_completed = () if automaton_winner is None else (automaton_winner,)
+        else:
+            automaton_completed = self.automaton.step_all(symbol)
+
+        for program_index in automaton_completed:
+            pattern_index = self.automaton_indices[program_index]
+            length = len(self.automaton.programs[program_index])
+            completions.append((index - length + 1, self.ranks[pattern_index], pattern_index, None))
+
+        for matched in self.interpreter.step(datum, index, start_time):
+            completions.append((matched[0], self.ranks[matched[1]], matched[1], matched))
+
+        return completions
+
+    def choose(self, completions: List[Completion[T]]) -> Completion[T]:
+        """Pick which of the matches completing on the same datum is emitted."""
+        return min(completions, key=lambda c: (c[0], c[1]))
+
+    def replay(self, pattern: PatternElement, start: int, end: int, end_time: T) -> PatternMatch[T]:
+        """Run the interpreter over the data from index `start` to `end` to find the captures of a match."""
+
+        first_index = self.history.first_index
+        data = self.history.data[start - first_index : end + 1 - first_index]
+
+        env = PatternMatchEnvironment()
+        match_data(pattern, data, env)
+
+        return PatternMatch(pattern, env.captures, self.history.time_at(start), end_time, self.word_width)
@@ -1,14 +1,34 @@
 from .pattern_tokenizer import *
-from .pattern_element import PatternElement, SequencePatternElement, NamePatternElement, FixedPatternElement, WildcardPatternElement, CapturePatternElement, RepeatPatternElement
+from .pattern_element import PatternElement, SequencePatternElement, NamePatternElement, FixedPatternElement, WildcardPatternElement, CapturePatternElement, RepeatPatternElement, CountedRepeatPatternElement, ClassPatternElement, AlternationPatternElement, capture_names
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import Any, Dict, List, Optional, Tuple, Type, TypeVar, cast
 from .errors import *
 from .pattern_tokens import *
+from .byte_formatter import DEFAULT_WORD_WIDTH, MAX_WORD_WIDTH
+
+E = TypeVar("E", bound=PatternElement)
+
+# The largest quantity a repeat can have, regardless of word width
+MAX_REPEAT_QUANTITY = 0xFF
+
+# How the words of a repeat's count can be ordered, and whether each is little-endian
+COUNT_BYTE_ORDERS = { "B": False, "L": True }
 
 class Parser:
-    def __init__(self, tokens: List[Token]):
+    def __init__(self, tokens: List[Token], word_width: int = DEFAULT_WORD_WIDTH):
+        if not 1 <= word_width <= MAX_WORD_WIDTH:
+            raise ValueError(f"word width must be between 1 and {MAX_WORD_WIDTH} bits, not {word_width}")
+
         self.input = tokens
         self.current_position = 0
+        self.word_width = word_width
+
+        # Every distinct element made so far, keyed by its type and the identities of its fields
+        self.interned: Dict[Tuple[Any, ...], PatternElement] = {}
+
+        # The names of the captures made so far in the pattern being parsed, which later repeats
+        # can take their count from, and the most data each could capture
+        self.capture_scope: Dict[str, int] = {}
 
     def parse(self) -> List[PatternElement]:
         elements: List[PatternElement] = []
@@ -21,9 +41,11 @@ class Parser:
                 self.take()
 
             elif isinstance(token, QuotedStringToken):
+                self.capture_scope = {}
                 elements.append(self.parse_named())
 
-            elif isinstance(token, DatumToken):
+            elif isinstance(token, (DatumToken, LBracketToken, BangToken)):
+                self.capture_scope = {}
                 elements.append(self.parse_body(end_delimiter=SemicolonToken))
 
             else:
@@ -41,48 +63,94 @@ class Parser:
             raise UnexpectedTokenError(token=eq, position=eq.position)
         
         body = self.parse_body(end_delimiter=SemicolonToken)
+        element = self.make(NamePatternElement, name.contents, body)
+
+        # Check the name now, rather than when it's first used to annotate a match
+        try:
+            template = element.template()
+        except ValueError as e:
+            raise InvalidNameError(reason=f"invalid name `{name.contents}`: {e}", position=name.position)
 
-        return NamePatternElement(name=name.contents, pattern_element=body)
+        missing = template.captures() - capture_names(body, certain=True)
+        if missing:
+            if missing & capture_names(body):
+                problem = "which only some alternatives of the pattern capture"
+            else:
+                problem = "which the pattern doesn't capture"
+            raise InvalidNameError(reason=f"name `{name.contents}` uses " + ", ".join(f"`{c}`" for c in sorted(missing)) + ", " + problem, position=name.position)
+
+        return element
+
+    def parse_body(self, end_delimiter: type) -> PatternElement:
+        """Parse a sequence of elements, or several alternative sequences separated by `|`."""
+
+        sequences = [self.parse_sequence(end_delimiter)]
+        while not self.is_at_end() and isinstance(self.here(), PipeToken):
+            pipe = self.take()
 
-    def parse_body(self, end_delimiter: type) -> SequencePatternElement:
+            # Alternatives can't be empty
+            if not sequences[-1]:
+                raise UnexpectedTokenError(token=pipe, position=pipe.position)
+            sequences.append(self.parse_sequence(end_delimiter))
+            if not sequences[-1]:
+                token = self.here()
+                raise UnexpectedTokenError(token=token, position=token.position)
+
+        alternatives = [self.make(SequencePatternElement, elements) for elements in sequences]
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return self.make(AlternationPatternElement, alternatives)
+
+    def parse_sequence(self, end_delimiter: type) -> List[PatternElement]:
         elements = []
 
         while not self.is_at_end():
             token = self.here()
 
-            if isinstance(token, end_delimiter):
+            if isinstance(token, (end_delimiter, PipeToken)):
                 # Bail - this sequence is over
                 break
             else:
                 elements.append(self.parse_single_element())
             
-        return SequencePatternElement(elements)
-    
+        return elements
+
     def parse_single_element(self) -> PatternElement:
         token = self.here()
 
         if isinstance(token, DatumToken):
+            # This might be a repeat counted by an earlier capture, if it's of the form `len*y`. A
+            # capture can be named like a data value, such as `x04`, but `x04*y` has always been a
+            # constant repeat, so it stays one
+            if token.contents in self.capture_scope and not self.is_datum_literal(token) and self.is_counted_repeat():
+                return self.parse_counted_repeat()
+
             self.take()
 
             # This might be a capture, if it's of the form `x:...`
             if not self.is_at_end() and isinstance(self.here(), ColonToken):
                 self.take()
                 captured_pattern = self.parse_single_element()
-                return CapturePatternElement(token.contents, captured_pattern)
+                _, captured_length = captured_pattern.length_bounds()
+                self.capture_scope[token.contents] = max(self.capture_scope.get(token.contents, 0), captured_length)
+                return self.make(CapturePatternElement, token.contents, captured_pattern)
             
-            datum = self.datum_contents_to_bytes(token)
+            datum = self.datum_contents_to_word(token)
             
             # This might be a repeat, if it's of the form `x*y`
             if not self.is_at_end() and isinstance(self.here(), StarToken):
+                if datum > MAX_REPEAT_QUANTITY:
+                    raise InvalidDatumError(reason=f"repeat quantities must be at most {MAX_REPEAT_QUANTITY}, `{token.contents}` is out-of-range", position=token.position)
+
                 self.take()
                 repeated_pattern = self.parse_single_element()
-                return RepeatPatternElement(pattern_element=repeated_pattern, quantity=datum[0])
+                return self.make(RepeatPatternElement, repeated_pattern, datum)
             else:
-                return FixedPatternElement(datum=datum)
+                return self.make(FixedPatternElement, datum)
 
         elif isinstance(token, DotToken):
             self.take()
-            return WildcardPatternElement()
+            return self.make(WildcardPatternElement)
         
         elif isinstance(token, LParenToken):
             self.take()
@@ -90,12 +158,117 @@ class Parser:
             if not self.is_at_end():
                 self.take() # Consume RParen
             return body
+
+        elif isinstance(token, (LBracketToken, BangToken)):
+            return self.parse_class()
         
         else:
             raise UnexpectedTokenError(token=token, position=token.position)
+
+    def is_counted_repeat(self) -> bool:
+        """
+        Whether the tokens from here are the count of a counted repeat, like `len*`, `len:L*`, or
+        `len-d2*`.
+        """
+
+        offset = 1
+        if isinstance(self.peek(offset), ColonToken):
+            spec = self.peek(offset + 1)
+            if not (isinstance(spec, DatumToken) and spec.contents in COUNT_BYTE_ORDERS):
+                return False
+            offset += 2
+        if isinstance(self.peek(offset), (PlusToken, DashToken)):
+            offset += 2
+        return isinstance(self.peek(offset), StarToken)
+
+    def parse_counted_repeat(self) -> CountedRepeatPatternElement:
+        """Parse a repeat whose count comes from a capture, like `len:L+d2*.`."""
+
+        name = cast(DatumToken, self.take())
+
+        little_endian = False
+        if isinstance(self.here(), ColonToken):
+            self.take()
+            little_endian = COUNT_BYTE_ORDERS[cast(DatumToken, self.take()).contents]
+
+        offset = 0
+        sign = self.here()
+        if isinstance(sign, (PlusToken, DashToken)):
+            self.take()
+            amount = self.take()
+            if not isinstance(amount, DatumToken):
+                raise UnexpectedTokenError(token=amount, position=amount.position)
+            offset = self.datum_contents_to_word(amount)
+            if isinstance(sign, DashToken):
+                offset = -offset
+
+        self.take() # Consume Star
+        repeated_pattern = self.parse_single_element()
+        return self.make(CountedRepeatPatternElement, repeated_pattern, name.contents, little_endian, offset, self.word_width, self.capture_scope[name.contents])
+
+    def parse_class(self) -> ClassPatternElement:
+        """Parse a class of data, like `[x00-x1F x7F]`, or its negation, like `![xAA]`."""
+
+        start = self.here()
+        negated = isinstance(start, BangToken)
+        if negated:
+            self.take()
+
+        bracket = self.take()
+        if not isinstance(bracket, LBracketToken):
+            raise UnexpectedTokenError(token=bracket, position=bracket.position)
+
+        ranges = []
+        while True:
+            token = self.take()
+            if isinstance(token, RBracketToken):
+                break
+            if not isinstance(token, DatumToken):
+                raise UnexpectedTokenError(token=token, position=token.position)
+
+            low = high = self.datum_contents_to_word(token)
+            if not self.is_at_end() and isinstance(self.here(), DashToken):
+                self.take()
+                end = self.take()
+                if not isinstance(end, DatumToken):
+                    raise UnexpectedTokenError(token=end, position=end.position)
+                high = self.datum_contents_to_word(end)
+                if high < low:
+                    raise InvalidDatumError(reason=f"range `{token.contents}-{end.contents}` is backwards", position=range(token.position.start, end.position.stop))
+            ranges.append((low, high))
+
+        ranges = merge_ranges(ranges)
+        if negated:
+            ranges = complement_ranges(ranges, (1 << self.word_width) - 1)
+        if not ranges:
+            raise InvalidDatumError(reason="class can't match any data", position=range(start.position.start, token.position.stop))
+
+        return self.make(ClassPatternElement, tuple(ranges))
     
-    def datum_contents_to_bytes(self, token: DatumToken) -> bytes:
-        """Converts a `DatumToken` into the bytes which that datum should match."""
+    def make(self, cls: Type[E], *args: Any) -> E:
+        """
+        Create an element, or get the existing instance if an identical one has been made before,
+        so that structurally identical parts of patterns are only stored (and analysed) once.
+
+        Elements are made from the bottom up, so any child elements given in `args` are already
+        shared, and can be compared by identity rather than by walking their whole structure.
+        """
+
+        key = (cls,) + tuple(
+            id(arg) if isinstance(arg, PatternElement)
+            else tuple(id(child) for child in arg) if isinstance(arg, list)
+            else arg
+            for arg in args
+        )
+
+        element = self.interned.get(key)
+        if element is None:
+            element = cast(Any, cls)(*args)
+            self.interned[key] = element
+        return cast(E, element)
+
+    def datum_contents_to_word(self, token: DatumToken) -> int:
+        """Converts a `DatumToken` into the word which that datum should match."""
 
         base, value = self.datum_extract_base_and_value(token)
 
@@ -104,10 +277,14 @@ class Parser:
         except ValueError:
             raise InvalidDatumError(reason=f"data value expected to be in base {base}, but `{value}` is not", position=token.position)
         
-        if numeric < 0 or numeric > 0xFF:
-            raise InvalidDatumError(reason=f"data values must be bytes, `{token.contents}` is out-of-range", position=token.position)
+        if numeric < 0 or numeric >= 1 << self.word_width:
+            if self.word_width == 8:
+                reason = f"data values must be bytes, `{token.contents}` is out-of-range"
+            else:
+                reason = f"data values must fit in {self.word_width}-bit words, `{token.contents}` is out-of-range"
+            raise InvalidDatumError(reason=reason, position=token.position)
         
-        return bytes([numeric])
+        return numeric
     
     def datum_extract_base_and_value(self, token: DatumToken) -> Tuple[int, str]:
         """
@@ -138,6 +315,18 @@ class Parser:
         else:
             raise InvalidDatumError(reason=f"cannot find base specifier (`x`, `b`, or `d`) on data value `{token.contents}`", position=token.position)
 
+    def is_datum_literal(self, token: DatumToken) -> bool:
+        """
+        Whether a `DatumToken` is written as a data value, even if that value doesn't fit in a word.
+        """
+
+        try:
+            base, value = self.datum_extract_base_and_value(token)
+            int(value, base)
+        except (InvalidDatumError, ValueError):
+            return False
+        return True
+
     def is_at_end(self) -> bool:
         return self.current_position >= len(self.input)
 
@@ -148,6 +337,12 @@ class Parser:
         self.current_position += 1
         return char
 
+    def peek(self, offset: int) -> Optional[Token]:
+        """Return the token `offset` tokens after the current one, or `None` if there isn't one."""
+
+        position = self.current_position + offset
+        return self.input[position] if position < len(self.input) else None
+
     def here(self) -> Token:
         """Return the current token from the input, without changing it."""
 
@@ -155,3 +350,27 @@ class Parser:
             raise UnexpectedEndError(position=None)
     
         return self.input[self.current_position]
+
+def merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Sort inclusive ranges, joining any which overlap or touch."""
+
+    merged: List[Tuple[int, int]] = []
+    for low, high in sorted(ranges):
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+    return merged
+
+def complement_ranges(ranges: List[Tuple[int, int]], maximum: int) -> List[Tuple[int, int]]:
+    """Get the values from 0 to `maximum` which aren't in a list of merged ranges, as ranges."""
+
+    complement = []
+    next_low = 0
+    for low, high in ranges:
+        if low > next_low:
+            complement.append((next_low, low - 1))
+        next_low = high + 1
+    if next_low <= maximum:
+        complement.append((next_low, maximum))
+    return complement
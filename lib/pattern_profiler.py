@@ -0,0 +1,217 @@
+import atexit
+import csv
+import heapq
+import json
+import os
+import time
+from dataclasses import dataclass, asdict, fields
+from typing import Dict, List, Optional, Sequence, TextIO
+from .byte_formatter import DEFAULT_WORD_WIDTH
+from .data_history import DataHistory
+from .pattern_element import PatternElement, NamePatternElement
+from .pattern_trie import PatternTrieNode
+from .pattern_matcher import PatternMatch, PatternMatcher, DEFAULT_MAX_CANDIDATES, PatternMatchCandidate, CandidateInterpreter, InterpreterCompletion, Completion, T
+
+# The environment variable which, if set to a path, enables profiling and writes a report there.
+# The report is CSV if the path ends in `.csv`, or JSON otherwise.
+PROFILE_ENVIRONMENT_VARIABLE = "CUSTOM_DATA_PROFILE"
+
+# The minimum number of seconds between writes of a profile report
+PROFILE_WRITE_INTERVAL = 5.0
+
+# How many data a candidate must get through without failing to count as having survived, by default
+DEFAULT_SURVIVAL_LENGTH = 4
+
+@dataclass
+class PatternProfile:
+    """Runtime counters for one top-level pattern."""
+
+    # The pattern's position in its source, starting from 1, and its name if it has one
+    index: int
+    name: str
+
+    # Candidates created to match this pattern
+    spawned: int = 0
+
+    # Candidates which matched the survival length of data without failing
+    survived: int = 0
+
+    # Matches of this pattern which were emitted
+    matched: int = 0
+
+    # Completed matches and in-flight candidates which were thrown away because a different match
+    # was emitted
+    discarded: int = 0
+
+    # Total time spent matching data against this pattern
+    seconds: float = 0.0
+
+class ProfilingInterpreter(CandidateInterpreter[T]):
+    """A `CandidateInterpreter` for a single pattern, which counts what its candidates do."""
+
+    def __init__(self, patterns: Sequence[PatternElement], pattern_index: int, history: DataHistory[T], profile: PatternProfile, survival_length: int, max_candidates: int = DEFAULT_MAX_CANDIDATES, prune: bool = True) -> None:
+        super().__init__(patterns, [pattern_index], history, max_candidates, prune=prune)
+        self.profile = profile
+        self.survival_length = survival_length
+        self.index = 0
+
+    def spawn(self, node: PatternTrieNode, start_index: int, start_time: T) -> PatternMatchCandidate[T]:
+        self.profile.spawned += 1
+
+        # Candidates created from a literal prefix have already matched all of it. With only one
+        # pattern there are no junctions to fork at, so nothing else is back-dated.
+        if start_index < self.index and self.index - start_index + 1 >= self.survival_length:
+            self.profile.survived += 1
+
+        return super().spawn(node, start_index, start_time)
+
+    def step(self, datum: int, index: int, start_time: T) -> List[InterpreterCompletion[T]]:
+        self.index = index
+
+        start = time.perf_counter()
+        completions = super().step(datum, index, start_time)
+        self.profile.seconds += time.perf_counter() - start
+
+        return completions
+
+    def advance(self, candidate: PatternMatchCandidate[T], datum: int, remaining: List[PatternMatchCandidate[T]]) -> None:
+        before = len(remaining) + len(self.completions)
+        super().advance(candidate, datum, remaining)
+
+        # The candidate is kept or completes if it didn't fail
+        if len(remaining) + len(self.completions) > before and self.index - candidate.start_index + 1 == self.survival_length:
+            self.profile.survived += 1
+
+    def reset(self) -> None:
+        self.profile.discarded += len(self.candidates)
+        super().reset()
+
+    def discard_through(self, index: int) -> None:
+        before = len(self.candidates)
+        super().discard_through(index)
+        self.profile.discarded += before - len(self.candidates)
+
+class ProfilingPatternMatcher(PatternMatcher[T]):
+    """
+    A `PatternMatcher` which keeps a `PatternProfile` for each of its patterns.
+
+    To attribute work to individual patterns, each one is matched by its own interpreter, without
+    the automaton or any sharing between patterns. This makes it much slower than `PatternMatcher`.
+    The matches it finds are the same, unless there are ever more than `max_candidates` partial
+    matches in flight: the cap applies to each pattern's interpreter separately, rather than to all
+    of them together.
+    """
+
+    def __init__(self, patterns: Sequence[PatternElement], survival_length: int = DEFAULT_SURVIVAL_LENGTH, max_candidates: int = DEFAULT_MAX_CANDIDATES, word_width: int = DEFAULT_WORD_WIDTH, max_latency: Optional[int] = None) -> None:
+        # Every pattern is interpreted, so the automaton is left empty. The interpreter shared between
+        # patterns is replaced by one for each pattern.
+        super().__init__(patterns, use_automaton=False, max_candidates=max_candidates, word_width=word_width, max_latency=max_latency)
+
+        self.profiles = [
+            PatternProfile(i + 1, p.name if isinstance(p, NamePatternElement) else "")
+            for i, p in enumerate(self.patterns)
+        ]
+        self.interpreters: List[ProfilingInterpreter[T]] = [
+            ProfilingInterpreter(self.patterns, i, self.history, self.profiles[i], survival_length, max_candidates, prune=max_latency is None)
+            for i in range(len(self.patterns))
+        ]
+
+    def reset(self) -> None:
+        for interpreter in self.interpreters:
+            interpreter.reset()
+
+    def oldest_needed(self, index: int) -> int:
+        oldest = min((interpreter.oldest_needed(index) for interpreter in self.interpreters), default=index + 1)
+        if self.held:
+            oldest = min(oldest, self.held[0][0])
+        return oldest
+
+    def earliest_in_flight(self, index: int) -> Optional[int]:
+        starts = [interpreter.earliest_start(index) for interpreter in self.interpreters]
+        return min((start for start in starts if start is not None), default=None)
+
+    def discard_through(self, index: int, end_index: int) -> None:
+        while self.held and self.held[0][0] <= end_index:
+            self.profiles[heapq.heappop(self.held)[4]].discarded += 1
+        for interpreter in self.interpreters:
+            interpreter.discard_through(end_index)
+
+    def step(self, datum: int, index: int, start_time: T) -> List[Completion[T]]:
+        completions: List[Completion[T]] = []
+        for interpreter in self.interpreters:
+            for matched in interpreter.step(datum, index, start_time):
+                completions.append((matched[0], self.ranks[matched[1]], matched[1], matched))
+        return completions
+
+    def choose(self, completions: List[Completion[T]]) -> Completion[T]:
+        chosen = super().choose(completions)
+        for completion in completions:
+            if completion is not chosen:
+                self.profiles[completion[2]].discarded += 1
+        return chosen
+
+    def emit(self, start_index: int, end_index: int, pattern_index: int, completion: Optional[InterpreterCompletion[T]], end_time: T) -> PatternMatch[T]:
+        self.profiles[pattern_index].matched += 1
+        return super().emit(start_index, end_index, pattern_index, completion, end_time)
+
+def write_profiles(profiles: List[PatternProfile], f: TextIO, format: str) -> None:
+    """Write a report of pattern profiles, as either "json" or "csv"."""
+
+    if format == "json":
+        json.dump([asdict(profile) for profile in profiles], f, indent=2)
+    elif format == "csv":
+        writer = csv.writer(f)
+        writer.writerow([field.name for field in fields(PatternProfile)])
+        for profile in profiles:
+            writer.writerow(list(asdict(profile).values()))
+    else:
+        raise ValueError(f"unknown profile format '{format}'")
+
+# The latest profile writer for each report, by the absolute path of the report
+_live_writers: Dict[str, "ProfileWriter"] = {}
+
+def write_live_profiles() -> None:
+    """Write the report of the latest profile writer for each path."""
+
+    for writer in list(_live_writers.values()):
+        writer.write()
+
+atexit.register(write_live_profiles)
+
+class ProfileWriter:
+    """
+    Periodically writes a report of pattern profiles to a file.
+
+    Logic2 doesn't tell analyzers when a capture has finished, so the report is rewritten every so
+    often while decoding, and once more when Python exits. Only the latest writer for each path does
+    this, so a writer for an analyzer which has since been re-created can't overwrite the report.
+    """
+
+    def __init__(self, profiles: List[PatternProfile], path: str, interval: float = PROFILE_WRITE_INTERVAL) -> None:
+        self.profiles = profiles
+        self.path = path
+        self.key = os.path.abspath(path)
+        self.format = "csv" if path.lower().endswith(".csv") else "json"
+        self.interval = interval
+        self.last_write = time.monotonic()
+        _live_writers[self.key] = self
+
+    def tick(self) -> None:
+        """Write the report if it hasn't been written recently."""
+
+        if _live_writers.get(self.key) is self and time.monotonic() - self.last_write >= self.interval:
+            self.write()
+
+    def write(self) -> None:
+        """Write the report now."""
+
+        # Replace the old report in one go, so that it can be read while decoding continues
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w", newline="") as f:
+            write_profiles(self.profiles, f, self.format)
+        os.replace(temporary_path, self.path)
+        self.last_write = time.monotonic()
+
+def profile_path_from_environment() -> Optional[str]:
+    """Get the path to write a profile report to, if profiling has been enabled."""
+    return os.environ.get(PROFILE_ENVIRONMENT_VARIABLE) or None
@@ -0,0 +1,45 @@
+from typing import List, Tuple
+from .pattern_element import PatternElement
+from .pattern_tokenizer import Tokenizer
+from .pattern_parser import Parser
+from .errors import SourceError, CustomException
+from .byte_formatter import DEFAULT_WORD_WIDTH
+
+def read_pattern_source(source_setting: str, pattern_setting: str) -> Tuple[str, str]:
+    """
+    Get the text of patterns, either directly (if `source_setting` is "Text") or from the file at
+    the path given in `pattern_setting` (if it is "File"). Returns a name for the source, to use in
+    errors, and the text itself.
+    """
+
+    if source_setting == "Text":
+        return "<text>", pattern_setting
+    elif source_setting == "File":
+        with open(pattern_setting, "r") as f:
+            return pattern_setting, f.read()
+    else:
+        raise ValueError(f"unknown source: {source_setting}")
+
+def parse_patterns(source_name: str, pattern: str, word_width: int = DEFAULT_WORD_WIDTH) -> List[PatternElement]:
+    """
+    Parse the text of patterns, which match data words of `word_width` bits.
+
+    Syntax errors are raised as a `CustomException` describing where the error is.
+    """
+
+    try:
+        tokens = Tokenizer(pattern).tokenize()
+        return Parser(tokens, word_width).parse()
+    except SourceError as e:
+        # Throw another exception with the info presented nicely
+        raise CustomException.from_syntax_error(e, source_name, pattern)
+
+def load_patterns(source_setting: str, pattern_setting: str, word_width: int = DEFAULT_WORD_WIDTH) -> List[PatternElement]:
+    """
+    Load and parse patterns, either from text directly (if `source_setting` is "Text") or from the
+    file at the path given in `pattern_setting` (if it is "File").
+
+    Syntax errors are raised as a `CustomException` describing where the error is.
+    """
+
+    return parse_patterns(*read_pattern_source(source_setting, pattern_setting), word_width)
@@ -1,104 +1,78 @@
+import re
 from dataclasses import dataclass
-from typing import List
+from typing import Dict, List, Type
 from .pattern_tokens import *
 from .errors import *
 
+# Every kind of token, each after anything which should be skipped before it. Anything else is
+# matched one character at a time as an error, so that consecutive matches always cover the whole
+# input. Skipped text at the end of the input is matched with no token.
+_TOKEN_REGEX = re.compile(r"""
+    (?: \s+ | //[^\n]* )*
+    (?:
+        (?P<datum> [^\W_]\w* )
+      | (?P<string> "[^"]*" )
+      | (?P<symbol> [;=.:*()\[\]!+|-] )
+      | (?P<error> . )
+      | \Z
+    )
+""", re.VERBOSE | re.DOTALL)
+
+_SYMBOL_TOKENS: Dict[str, Type[Token]] = {
+    ";": SemicolonToken,
+    "=": EqualsToken,
+    ".": DotToken,
+    ":": ColonToken,
+    "*": StarToken,
+    "(": LParenToken,
+    ")": RParenToken,
+    "[": LBracketToken,
+    "]": RBracketToken,
+    "!": BangToken,
+    "-": DashToken,
+    "+": PlusToken,
+    "|": PipeToken,
+}
+
 class Tokenizer:
     def __init__(self, input: str):
         self.input = input
-        self.current_position = 0
 
     def tokenize(self) -> List[Token]:
+        # Pattern files can be many megabytes, so this scans with one regex rather than looking at
+        # each character in turn
         tokens: List[Token] = []
+        append = tokens.append
+
+        for match in _TOKEN_REGEX.finditer(self.input):
+            kind = match.lastgroup
+            if kind == "datum":
+                start, end = match.span(kind)
+                append(DatumToken(range(start, end), match.group(kind)))
+            elif kind == "symbol":
+                start, end = match.span(kind)
+                append(_SYMBOL_TOKENS[match.group(kind)](range(start, end)))
+            elif kind == "string":
+                start, end = match.span(kind)
+                append(QuotedStringToken(range(start, end), self.input[start + 1 : end - 1]))
+            elif kind == "error":
+                self.raise_error(match.start(kind))
 
-        while not self.is_at_end():
-            # Skip whitespace
-            self.skip_whitespace()
-            if self.is_at_end(): break
-
-            start_pos = self.current_position
-
-            # Comments
-            if self.take_if("/"):
-                if self.is_at_end() or self.here() != "/":
-                    raise UnexpectedCharacterError(char=self.here(), position=self.range_to_here_from(start_pos))
-
-                # Consume all characters up until a newline (or the end of the file)
-                while not self.is_at_end() and self.here() != "\n":
-                    self.take()
-                continue # Restart
-
-            # Simple characters
-            if self.take_if(";"):
-                tokens.append(SemicolonToken(position=self.range_to_here_from(start_pos)))
-            elif self.take_if("="):
-                tokens.append(EqualsToken(position=self.range_to_here_from(start_pos)))
-            elif self.take_if("."):
-                tokens.append(DotToken(position=self.range_to_here_from(start_pos)))
-            elif self.take_if(":"):
-                tokens.append(ColonToken(position=self.range_to_here_from(start_pos)))
-            elif self.take_if("*"):
-                tokens.append(StarToken(position=self.range_to_here_from(start_pos)))
-            elif self.take_if("("):
-                tokens.append(LParenToken(position=self.range_to_here_from(start_pos)))
-            elif self.take_if(")"):
-                tokens.append(RParenToken(position=self.range_to_here_from(start_pos)))
-
-            # Literal bytes or identifiers
-            elif self.here().isalnum():
-                buffer = ""
-                while not self.is_at_end() and (self.here().isalnum() or self.here() == '_'):
-                    buffer += self.take()
-                tokens.append(DatumToken(contents=buffer, position=self.range_to_here_from(start_pos)))
-
-            # Labels
-            elif self.take_if("\""):
-                buffer = ""
-                while not self.is_at_end() and self.here() != "\"":
-                    buffer += self.take()
-
-                # Consume closing quote
-                if self.is_at_end():
-                    raise UnterminatedQuotedStringError(position=None)
-                self.take() 
-
-                tokens.append(QuotedStringToken(contents=buffer, position=self.range_to_here_from(start_pos)))
-
-            else:
-                raise UnexpectedCharacterError(char=self.here(), position=self.range_to_here_from(start_pos))
-            
         return tokens
 
-    def skip_whitespace(self) -> None:
-        while not self.is_at_end() and self.here().isspace():
-            self.take()
-
-    def is_at_end(self) -> bool:
-        return self.current_position >= len(self.input)
-
-    def take(self) -> str:
-        """Consume one character from the input, and return it."""
-
-        char = self.here()
-        self.current_position += 1
-        return char
-    
-    def take_if(self, expected: str) -> bool:
-        """If the next character from the input matches a given one, consume it and return True."""
+    def raise_error(self, position: int) -> None:
+        """Raise an error for an unexpected character at `position`."""
 
-        char = self.here()
-        if char == expected:
-            self.take()
-            return True
-        return False
+        char = self.input[position]
 
-    def here(self) -> str:
-        """Return the current character from the input, without changing it."""
+        # Labels
+        if char == "\"":
+            raise UnterminatedQuotedStringError(position=None)
 
-        if self.is_at_end():
-            raise UnexpectedEndError(position=None)
-    
-        return self.input[self.current_position]
+        # Comments are only valid as `//`, and report the character after a single `/`
+        if char == "/":
+            if position + 1 >= len(self.input):
+                raise UnexpectedEndError(position=None)
+            raise UnexpectedCharacterError(char=self.input[position + 1], position=range(position, position + 1))
 
-    def range_to_here_from(self, start_pos: int) -> range:
-        return range(start_pos, self.current_position)
+        raise UnexpectedCharacterError(char=char, position=range(position, position))
@@ -4,6 +4,9 @@ from typing import no_type_check
 
 @dataclass
 class Token(ABC):
+    # Pattern files can have millions of tokens, so they have slots rather than a `__dict__` each
+    __slots__ = ("position",)
+
     position: range
 
     @abstractmethod
@@ -13,6 +16,8 @@ class Token(ABC):
 
 @dataclass
 class DatumToken(Token):
+    __slots__ = ("contents",)
+
     contents: str
 
     def explain(self) -> str:
@@ -20,22 +25,49 @@ class DatumToken(Token):
 
 @dataclass
 class QuotedStringToken(Token):
+    __slots__ = ("contents",)
+
     contents: str
 
     def explain(self) -> str:
         return self.contents
     
 class SemicolonToken(Token):
+    __slots__ = ()
     def explain(self) -> str: return ";"
 class EqualsToken(Token):
+    __slots__ = ()
     def explain(self) -> str: return "="
 class DotToken(Token):
+    __slots__ = ()
     def explain(self) -> str: return "."
 class ColonToken(Token):
+    __slots__ = ()
     def explain(self) -> str: return ":"
 class StarToken(Token):
+    __slots__ = ()
     def explain(self) -> str: return "*"
 class LParenToken(Token):
+    __slots__ = ()
     def explain(self) -> str: return "("
 class RParenToken(Token):
+    __slots__ = ()
     def explain(self) -> str: return ")"
+class LBracketToken(Token):
+    __slots__ = ()
+    def explain(self) -> str: return "["
+class RBracketToken(Token):
+    __slots__ = ()
+    def explain(self) -> str: return "]"
+class BangToken(Token):
+    __slots__ = ()
+    def explain(self) -> str: return "!"
+class DashToken(Token):
+    __slots__ = ()
+    def explain(self) -> str: return "-"
+class PlusToken(Token):
+    __slots__ = ()
+    def explain(self) -> str: return "+"
+class PipeToken(Token):
+    __slots__ = ()
+    def explain(self) -> str: return "|"
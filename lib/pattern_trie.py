@@ -0,0 +1,177 @@
+import sys
+from typing import Dict, List, Optional, Sequence, Tuple
+from .byte_formatter import Words
+from .pattern_element import PatternElement, PatternMatchEnvironment, SequencePatternElement, NamePatternElement, CapturePatternElement, irrefutable, match_data
+
+# Used for `min_future` when no pattern can be completed from a node
+NEVER = sys.maxsize
+
+class PatternTrieNode:
+    """
+    One element in a trie of top-level patterns, merged on their common leading elements.
+
+    Candidates matching the element of a node are matching every pattern which passes through it,
+    and only split once they reach a node with several children.
+    """
+
+    element: Optional[PatternElement]
+    children: List["PatternTrieNode"]
+    children_by_element: Dict[PatternElement, "PatternTrieNode"]
+
+    # The patterns (by index) which are complete once this node's element has matched
+    terminals: List[int]
+
+    # If this node and every node above it are entirely literal, the data they match, and the
+    # captures they make along the way
+    literal_path: Optional[List[int]]
+    literal_captures: Dict[str, Words]
+
+    # The children to try for each datum which some child has as a start hint, and those to try
+    # for any other datum. Every entry is prepared in advance, so that looking up the children for
+    # a datum doesn't build anything.
+    next_nodes_by_datum: Dict[int, Tuple["PatternTrieNode", ...]]
+    next_nodes_otherwise: Tuple["PatternTrieNode", ...]
+
+    # Whether there are any children in the lookup tables
+    has_next: bool
+
+    # Once this node's element has matched, the fewest further data needed to complete a pattern
+    # through the children in the lookup tables, and the exact number needed if a pattern is
+    # certain to complete
+    min_future: int
+    certain_future: Optional[int]
+
+    def __init__(self, element: Optional[PatternElement], parent: Optional["PatternTrieNode"]) -> None:
+        self.element = element
+        self.children = []
+        self.children_by_element = {}
+        self.terminals = []
+        self.next_nodes_by_datum = {}
+        self.next_nodes_otherwise = ()
+        self.has_next = False
+        self.min_future = NEVER
+        self.certain_future = None
+
+        self.literal_path = None
+        self.literal_captures = {}
+        if parent is None:
+            self.literal_path = []
+        elif element is not None and parent.literal_path is not None:
+            prefix, complete = element.literal_prefix()
+            if complete:
+                self.literal_path = parent.literal_path + prefix
+
+                env = PatternMatchEnvironment(dict(parent.literal_captures))
+                match_data(element, prefix, env)
+                self.literal_captures = env.captures
+
+    def child(self, element: PatternElement) -> "PatternTrieNode":
+        """Find the child for an element, creating it if needed."""
+
+        child = self.children_by_element.get(element)
+        if child is None:
+            child = PatternTrieNode(element, self)
+            self.children.append(child)
+            self.children_by_element[element] = child
+        return child
+
+    def next_nodes(self, datum: int) -> Tuple["PatternTrieNode", ...]:
+        """Get the children which a candidate at this node could move into, given the next datum."""
+        return self.next_nodes_by_datum.get(datum, self.next_nodes_otherwise)
+
+    def build_dispatch(self) -> None:
+        """
+        Fill in the lookup tables for `next_nodes`.
+
+        Children on a literal path are left out, because candidates for those are only created by
+        a `PrefixIndex` once their whole path has been seen.
+        """
+
+        children_by_start_hint: Dict[int, List[PatternTrieNode]] = {}
+        children_without_start_hint: List[PatternTrieNode] = []
+        for child in self.dispatched_children():
+            assert child.element is not None
+            hints = child.element.start_hint()
+            if hints is None:
+                children_without_start_hint.append(child)
+            else:
+                for hint in hints:
+                    children_by_start_hint.setdefault(hint, []).append(child)
+
+        # Children with a matching start hint are tried before the others
+        self.next_nodes_otherwise = tuple(children_without_start_hint)
+        self.next_nodes_by_datum = {
+            datum: tuple(children) + self.next_nodes_otherwise
+            for datum, children in children_by_start_hint.items()
+        }
+        self.has_next = bool(children_by_start_hint or children_without_start_hint)
+
+    def dispatched_children(self) -> List["PatternTrieNode"]:
+        """Get the children in the lookup tables for `next_nodes`."""
+        return [child for child in self.children if child.literal_path is None]
+
+    def analyse_future(self) -> None:
+        """
+        Fill in `min_future` and `certain_future`. This must already have been done for every
+        child.
+        """
+
+        children = self.dispatched_children()
+        for child in children:
+            assert child.element is not None
+            low, _ = child.element.length_bounds()
+            child_future = 0 if child.terminals else child.min_future
+            if child_future != NEVER:
+                self.min_future = min(self.min_future, low + child_future)
+
+        # Certain only if there's no choice to make, and nothing which could fail
+        if len(children) == 1:
+            child = children[0]
+            assert child.element is not None
+            low, high = child.element.length_bounds()
+            if low == high and irrefutable(child.element):
+                if child.terminals:
+                    self.certain_future = low
+                elif child.certain_future is not None:
+                    self.certain_future = low + child.certain_future
+
+    def walk(self) -> List["PatternTrieNode"]:
+        """Get this node and all of its descendants."""
+
+        # Patterns can be very long, so don't recurse
+        nodes = [self]
+        for node in nodes:
+            nodes.extend(node.children)
+        return nodes
+
+def leading_elements(pattern: PatternElement) -> List[PatternElement]:
+    """
+    Break a top-level pattern into the chain of elements which it matches in order, looking
+    through names and plain groups.
+    """
+
+    if isinstance(pattern, NamePatternElement):
+        return leading_elements(pattern.pattern_element)
+    elif isinstance(pattern, SequencePatternElement):
+        return [e for pe in pattern.pattern_elements for e in leading_elements(pe)]
+    else:
+        return [pattern]
+
+def build_pattern_trie(patterns: Sequence[PatternElement], pattern_indices: Sequence[int]) -> PatternTrieNode:
+    """Merge the given patterns into a trie, returning its root."""
+
+    root = PatternTrieNode(None, None)
+    for index in pattern_indices:
+        node = root
+        for element in leading_elements(patterns[index]):
+            node = node.child(element)
+        node.terminals.append(index)
+
+    nodes = root.walk()
+    for node in nodes:
+        node.build_dispatch()
+
+    # Children come after their parents in `walk`
+    for node in reversed(nodes):
+        node.analyse_future()
+    return root
@@ -0,0 +1,86 @@
+from collections import deque
+from typing import Deque, Dict, List, Sequence, Tuple
+
+class PrefixIndex:
+    """
+    An Aho-Corasick automaton over the literal prefixes of a set of patterns.
+
+    Stepping through data with `step` reports every prefix which ends on each datum, including
+    prefixes which overlap each other, in time linear in the amount of data.
+
+    Nodes are identified by integers, with the root (nothing matched) being 0. Call `build` after
+    adding all prefixes and before stepping.
+    """
+
+    ROOT = 0
+
+    def __init__(self) -> None:
+        self.goto: List[Dict[int, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.depth: List[int] = [0]
+
+        # For each node, the (key, prefix length) of every prefix which ends there - including
+        # those which end at a suffix of this node
+        self.outputs: List[List[Tuple[int, int]]] = [[]]
+
+        # For each node, how many data ago the earliest prefix which could still be completed
+        # started - the depth of the deepest node on its suffix chain with somewhere to go next
+        self.unfinished: List[int] = [0]
+
+    def add(self, prefix: Sequence[int], key: int) -> None:
+        """Add a prefix, which will be reported with the given key."""
+
+        if len(prefix) == 0:
+            raise ValueError("empty prefix is not allowed")
+
+        node = self.ROOT
+        for datum in prefix:
+            next_node = self.goto[node].get(datum)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto.append({})
+                self.fail.append(self.ROOT)
+                self.depth.append(self.depth[node] + 1)
+                self.outputs.append([])
+                self.unfinished.append(0)
+                self.goto[node][datum] = next_node
+            node = next_node
+
+        self.outputs[node].append((key, len(prefix)))
+
+    def build(self) -> None:
+        """Compute failure links, in breadth-first order so that shorter suffixes are done first."""
+
+        queue: Deque[int] = deque(self.goto[self.ROOT].values())
+        while queue:
+            node = queue.popleft()
+
+            # The failure link is shallower, so has already been done
+            if self.goto[node]:
+                self.unfinished[node] = self.depth[node]
+            else:
+                self.unfinished[node] = self.unfinished[self.fail[node]]
+            for datum, child in self.goto[node].items():
+                queue.append(child)
+
+                # The failure link is the longest proper suffix of this path which is also a path
+                fallback = self.fail[node]
+                while fallback != self.ROOT and datum not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(datum, self.ROOT)
+                self.fail[child] = target if target != child else self.ROOT
+
+                # Anything which ends at the suffix also ends here
+                self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
+
+    def step(self, node: int, datum: int) -> int:
+        """Advance from `node` by one datum, returning the new node."""
+
+        while True:
+            next_node = self.goto[node].get(datum)
+            if next_node is not None:
+                return next_node
+            if node == self.ROOT:
+                return self.ROOT
+            node = self.fail[node]
+
@@ -0,0 +1,269 @@
+import argparse
+import csv
+import sys
+import types
+from contextlib import ExitStack
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+from .data_extractor import InputAnalyzerType, DATA_BOUNDARY, datum_extractor
+from .pattern_element import PatternElement
+from .pattern_matcher import PatternMatch, PatternMatcher, DEFAULT_MAX_CANDIDATES
+from .byte_formatter import DEFAULT_WORD_WIDTH, MAX_WORD_WIDTH
+from .pattern_profiler import ProfilingPatternMatcher, write_profiles
+from .pattern_source import load_patterns
+from .annotation import annotate_match
+from .datum_log import DatumLog, LogRecord, is_datum_log
+from .errors import CustomException
+
+@dataclass
+class ReplayFrame:
+    """
+    Stands in for Logic2's `AnalyzerFrame` when replaying exported data outside of Logic2.
+
+    Times are in seconds from the start of the capture, standing in for `SaleaeTime`.
+    """
+
+    type: str
+    start_time: float
+    end_time: float
+    data: Dict[str, object]
+
+class StandInSetting:
+    """Stands in for the setting classes of `saleae.analyzers`, which only describe a setting."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        self.args = args
+        self.kwargs = kwargs
+
+class StandInHighLevelAnalyzer:
+    """Stands in for `saleae.analyzers.HighLevelAnalyzer`."""
+
+def install_saleae_stand_in() -> None:
+    """
+    Make the `saleae` module importable outside of Logic2, by registering stand-ins for the parts of
+    it which `CustomDataAnalyzer` uses. Does nothing if the real module is available.
+    """
+
+    try:
+        import saleae.analyzers
+        return
+    except ImportError:
+        pass
+
+    analyzers = types.ModuleType("saleae.analyzers")
+    setattr(analyzers, "HighLevelAnalyzer", StandInHighLevelAnalyzer)
+    setattr(analyzers, "AnalyzerFrame", ReplayFrame)
+    for name in ["StringSetting", "NumberSetting", "ChoicesSetting"]:
+        setattr(analyzers, name, type(name, (StandInSetting,), {}))
+
+    data = types.ModuleType("saleae.data")
+    setattr(data, "SaleaeTime", float)
+
+    saleae = types.ModuleType("saleae")
+    setattr(saleae, "analyzers", analyzers)
+    setattr(saleae, "data", data)
+
+    sys.modules.update({ "saleae": saleae, "saleae.analyzers": analyzers, "saleae.data": data })
+
+def create_analyzer(cls: Any, **settings: Any) -> Any:
+    """
+    Instantiate a high-level analyzer class the same way that Logic2 does, replacing its setting
+    descriptions with the given values before calling `__init__`.
+    """
+
+    analyzer = cls.__new__(cls)
+    for name, value in settings.items():
+        setattr(analyzer, name, value)
+    analyzer.__init__()
+    return analyzer
+
+# Columns of an exported data table which hold data values, rather than text
+DATA_COLUMNS = { "data", "mosi", "miso" }
+
+# Columns of an exported data table which describe the frame itself
+FRAME_COLUMNS = { "name", "type", "start_time", "duration", "end_time" }
+
+# Escapes used by Logic2 when exporting with the ASCII display radix
+ASCII_ESCAPES = { "\\0": 0, "\\t": 9, "\\n": 10, "\\r": 13, "\\\\": 92, " ": 32 }
+
+def parse_exported_value(text: str) -> bytes:
+    """
+    Convert a data value from a Logic2 data table export back into bytes. This accepts any of the
+    display radixes that Logic2 can export with.
+    """
+
+    if text in ASCII_ESCAPES:
+        return bytes([ASCII_ESCAPES[text]])
+
+    stripped = text.strip()
+    if len(stripped) == 3 and stripped[0] == stripped[-1] == "'":
+        stripped = stripped[1]
+    if len(stripped) == 1 and not stripped.isdigit():
+        return stripped.encode("latin-1")
+
+    try:
+        if stripped.lower().startswith("0x"):
+            digits = stripped[2:]
+            return int(digits, 16).to_bytes((len(digits) + 1) // 2, byteorder="big")
+        elif stripped.lower().startswith("0b"):
+            digits = stripped[2:]
+            return int(digits, 2).to_bytes((len(digits) + 7) // 8, byteorder="big")
+        else:
+            value = int(stripped, 10)
+            return value.to_bytes(max(1, (value.bit_length() + 7) // 8), byteorder="big")
+    except ValueError:
+        raise ValueError(f"can't understand exported data value '{text}'")
+
+def read_csv_export(f: TextIO) -> Iterator[ReplayFrame]:
+    """
+    Read frames from a data table exported as CSV from Logic2, such as from the Async Serial or SPI
+    analyzers. Frames are read one row at a time, so this works with files of any size.
+    """
+
+    reader = csv.reader(f)
+    header = [column.strip().lower() for column in next(reader, [])]
+    if "start_time" not in header or not ("duration" in header or "end_time" in header):
+        raise ValueError("export must have 'start_time' and 'duration' columns")
+
+    for row in reader:
+        if not row:
+            continue
+        columns = dict(zip(header, row))
+
+        start_time = float(columns["start_time"])
+        if "duration" in columns:
+            end_time = start_time + float(columns["duration"])
+        else:
+            end_time = float(columns["end_time"])
+
+        data: Dict[str, object] = {}
+        for name, value in columns.items():
+            if name in FRAME_COLUMNS or value == "":
+                continue
+            data[name] = parse_exported_value(value) if name in DATA_COLUMNS else value
+
+        yield ReplayFrame(columns.get("type", "data"), start_time, end_time, data)
+
+def replay(frames: Iterable[ReplayFrame], input_type: str, patterns: List[PatternElement], matcher: Optional[PatternMatcher[float]] = None) -> Iterator[ReplayFrame]:
+    """
+    Feed frames from an input analyzer through the same matching process as `CustomDataAnalyzer`,
+    producing its output frames. Only the frames currently being matched are held in memory.
+
+    A matcher for the patterns can be given, such as a `ProfilingPatternMatcher`.
+    """
+    return replay_data(extract_data(frames, input_type), patterns, matcher)
+
+def extract_data(frames: Iterable[ReplayFrame], input_type: str) -> Iterator[LogRecord]:
+    """
+    Extract the data from an input analyzer's frames, as (datum, start time, end time). Frames which
+    no match can continue past give `DATA_BOUNDARY` instead of a datum.
+    """
+
+    extract_datum = datum_extractor(input_type)
+    for frame in frames:
+        datum = extract_datum(frame)
+        if datum is not None:
+            yield datum, frame.start_time, frame.end_time
+
+def replay_data(data: Iterable[LogRecord], patterns: List[PatternElement], matcher: Optional[PatternMatcher[float]] = None) -> Iterator[ReplayFrame]:
+    """Like `replay`, but for data which has already been extracted, such as from a datum log."""
+
+    if matcher is None:
+        matcher = PatternMatcher(patterns)
+    for datum, start_time, end_time in data:
+        matches = matcher.boundary() if datum == DATA_BOUNDARY else matcher.feed_all(datum, start_time, end_time)
+        for match in matches:
+            yield match_frame(match)
+
+    # The data has ended, so nothing more can beat the matches being held back
+    for match in matcher.flush():
+        yield match_frame(match)
+
+def replay_log_offline(log: DatumLog, patterns: List[PatternElement], word_width: int, processes: int = 1) -> Optional[Iterator[ReplayFrame]]:
+    """
+    Match a datum log with an `OfflineMatcher`, which is much faster than stepping through it, using
+    up to `processes` processes. Returns `None` if NumPy isn't available.
+    """
+
+    try:
+        from .offline_matcher import OfflineMatcher
+    except ImportError:
+        return None
+    return (match_frame(match) for match in OfflineMatcher(patterns, word_width).match_log(log, processes=processes))
+
+def match_frame(match: PatternMatch[float]) -> ReplayFrame:
+    ty, data = annotate_match(match)
+    return ReplayFrame(ty, match.start_time, match.end_time, data)
+
+def write_csv_frames(frames: Iterable[ReplayFrame], f: TextIO) -> None:
+    """Write output frames as CSV, one row at a time."""
+
+    writer = csv.writer(f)
+    writer.writerow(["type", "start_time", "end_time", "text"])
+    for frame in frames:
+        writer.writerow([frame.type, repr(frame.start_time), repr(frame.end_time), frame.data.get("text", "")])
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Entry point for running the replay tool from the command line."""
+
+    parser = argparse.ArgumentParser(description="Run Custom Data patterns over data exported from Logic2, without needing Logic2 itself.")
+    parser.add_argument("export", help="the input analyzer's data table exported as CSV, or a datum log recorded by the analyzer")
+    parser.add_argument("-t", "--input-type", choices=[t.value for t in InputAnalyzerType], default=InputAnalyzerType.ASYNC_SERIAL.value, help="the type of the input analyzer, if replaying an export (default: %(default)s)")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("-p", "--pattern", help="patterns to match")
+    source.add_argument("-f", "--pattern-file", help="file to load patterns from")
+    parser.add_argument("-w", "--word-width", type=int, choices=range(1, MAX_WORD_WIDTH + 1), metavar="BITS", help=f"the width of each datum, in bits (default: as recorded in a datum log, or {DEFAULT_WORD_WIDTH})")
+    parser.add_argument("-o", "--output", default="-", help="file to write matches to as CSV (default: standard output)")
+    parser.add_argument("--max-candidates", type=int, default=DEFAULT_MAX_CANDIDATES, help="the most partial matches to track at once, after which the latest-starting are dropped (default: %(default)s)")
+    parser.add_argument("--longest", type=int, metavar="LATENCY", help="when matches overlap, choose the longest of those starting earliest, holding each match back for at most this many data while waiting for longer ones (default: choose the first to finish)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="processes to match a datum log with, if none of its patterns can match an unlimited amount of data (default: %(default)s)")
+    parser.add_argument("--profile", help="file to write per-pattern profiling counters to, as CSV if it ends in .csv or JSON otherwise")
+    args = parser.parse_args(argv)
+
+    try:
+        with ExitStack() as stack:
+            log = stack.enter_context(DatumLog(args.export)) if is_datum_log(args.export) else None
+
+            word_width = args.word_width
+            if word_width is None:
+                word_width = log.word_width if log is not None else DEFAULT_WORD_WIDTH
+
+            if args.pattern_file is not None:
+                patterns = load_patterns("File", args.pattern_file, word_width)
+            else:
+                patterns = load_patterns("Text", args.pattern, word_width)
+
+            matcher: PatternMatcher[float]
+            profiling_matcher: Optional[ProfilingPatternMatcher[float]] = None
+            if args.profile is not None:
+                profiling_matcher = ProfilingPatternMatcher(patterns, max_candidates=args.max_candidates, word_width=word_width, max_latency=args.longest)
+                matcher = profiling_matcher
+            else:
+                matcher = PatternMatcher(patterns, max_candidates=args.max_candidates, word_width=word_width, max_latency=args.longest)
+
+            frames: Optional[Iterator[ReplayFrame]] = None
+            if log is not None:
+                # Data in a log is already extracted, so can be matched all at once if nothing
+                # needs the matcher itself
+                if profiling_matcher is None and args.longest is None:
+                    frames = replay_log_offline(log, patterns, word_width, args.jobs)
+                if frames is None:
+                    frames = replay_data(log.records(boundaries=True), patterns, matcher)
+            else:
+                export = stack.enter_context(open(args.export, "r", newline=""))
+                frames = replay(read_csv_export(export), args.input_type, patterns, matcher)
+
+            if args.output == "-":
+                write_csv_frames(frames, sys.stdout)
+            else:
+                with open(args.output, "w", newline="") as output:
+                    write_csv_frames(frames, output)
+
+            if profiling_matcher is not None:
+                with open(args.profile, "w", newline="") as profile:
+                    write_profiles(profiling_matcher.profiles, profile, "csv" if args.profile.lower().endswith(".csv") else "json")
+    except CustomException as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    return 0
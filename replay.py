@@ -0,0 +1,8 @@
+# Replays data exported from Logic2 through Custom Data, without needing Logic2 itself.
+# Run `python replay.py --help` for usage.
+
+import sys
+from lib.replay import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,3 +11,13 @@ def test_spaced_format():
 def test_integer_conversion():
     assert "{:B}".format(ByteFormatter(bytes([1, 2, 0xa]))) == "66058"
     assert "{:L}".format(ByteFormatter(bytes([1, 2, 0xa]))) == "655873"
+
+def test_wide_words():
+    words = ByteFormatter([0x0102, 0xA], width=16)
+    assert "{}".format(words) == "x0102000A"
+    assert "{:s}".format(words) == "x0102 x000A"
+    assert "{:B}".format(words) == str(0x0102000A)
+    assert "{:L}".format(words) == str(0x000A0102)
+
+    # Hex digits are padded for words which aren't a multiple of 4 bits
+    assert "{:s}".format(ByteFormatter([0x1FF], width=9)) == "x1FF"
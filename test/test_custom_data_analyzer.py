@@ -0,0 +1,134 @@
+# type: ignore
+
+import importlib
+import os
+import shutil
+import sys
+import pytest
+from ..lib.replay import ReplayFrame, install_saleae_stand_in, create_analyzer
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def is_extension_module(name):
+    return name in ("lib", "custom_data_analyzer") or name.startswith("lib.")
+
+@pytest.fixture
+def extension(tmp_path, monkeypatch):
+    """
+    Import a copy of the extension from a temporary directory, the same way Logic2 does, so that
+    its files can be modified.
+    """
+
+    install_saleae_stand_in()
+    shutil.copytree(os.path.join(REPOSITORY, "lib"), tmp_path / "lib", ignore=shutil.ignore_patterns("__pycache__"))
+    shutil.copy(os.path.join(REPOSITORY, "custom_data_analyzer.py"), tmp_path)
+
+    for name in [name for name in sys.modules if is_extension_module(name)]:
+        monkeypatch.delitem(sys.modules, name)
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    yield importlib.import_module("custom_data_analyzer")
+
+    for name in [name for name in sys.modules if is_extension_module(name)]:
+        del sys.modules[name]
+
+def make_analyzer(extension, **settings):
+    return create_analyzer(extension.CustomDataAnalyzer, **{
+        "input_analyzer_type": "Async Serial",
+        "source_setting": "Text",
+        "pattern_setting": "x01 x02",
+        "word_width_setting": "8",
+        "overlap_setting": "First to finish",
+        "max_candidates_setting": 4096.0,
+        "record_setting": "",
+        **settings,
+    })
+
+def decode(analyzer, data):
+    for i, datum in enumerate(data):
+        analyzer.decode(ReplayFrame("data", i * 0.1, i * 0.1 + 0.05, { "data": bytes([datum]) }))
+
+def test_recording_recreated_analyzer(tmp_path, extension):
+    path = str(tmp_path / "capture.cdlog")
+    decode(make_analyzer(extension, record_setting=path), [0xAA] * 3000)
+
+    # Logic2 creates the analyzer again when it's re-run, which replaces the first run's log
+    decode(make_analyzer(extension, record_setting=path), list(range(10)))
+    datum_log = sys.modules["lib.datum_log"]
+    datum_log.close_open_writers()
+
+    with datum_log.DatumLog(path) as log:
+        assert [datum for datum, _, _ in log.records()] == list(range(10))
+        assert list(log.index) == [0.0]
+
+    # No temporary files are left behind
+    assert sorted(name for name in os.listdir(tmp_path) if name.startswith("capture")) == ["capture.cdlog", "capture.cdlog.boundaries", "capture.cdlog.index"]
+
+def test_recording_boundaries(tmp_path, extension):
+    path = str(tmp_path / "capture.cdlog")
+    analyzer = make_analyzer(extension, input_analyzer_type="I2C", record_setting=path)
+    for i, (ty, data) in enumerate([("start", {}), ("data", { "data": b"\x01" }), ("stop", {}), ("start", {}), ("data", { "data": b"\x02" })]):
+        assert analyzer.decode(ReplayFrame(ty, float(i), float(i), data)) is None
+
+    datum_log = sys.modules["lib.datum_log"]
+    datum_log.close_open_writers()
+    with datum_log.DatumLog(path) as log:
+        assert [datum for datum, _, _ in log.records()] == [0x01, 0x02]
+        assert list(log.boundaries) == [1]
+
+def touch(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+def test_unchanged_modules_not_reloaded(extension):
+    matcher_class = sys.modules["lib.pattern_matcher"].PatternMatcher
+    assert extension.reload_changed_lib_modules(extension.LIB_MODULES) == []
+
+    # Logic2 imports the extension again, such as when "Reload Extension" is pressed
+    del sys.modules["custom_data_analyzer"]
+    importlib.import_module("custom_data_analyzer")
+    assert sys.modules["lib.pattern_matcher"].PatternMatcher is matcher_class
+
+def test_changed_module_reloaded_with_dependents(tmp_path, extension):
+    element_class = sys.modules["lib.pattern_element"].PatternElement
+    tokens_class = sys.modules["lib.pattern_tokens"].Token
+    touch(tmp_path / "lib" / "pattern_element.py")
+
+    # The changed module and everything after it, which might import it, but not modules before it
+    # or ones which haven't been imported
+    loaded = [name for name in extension.LIB_MODULES if name not in extension.LAZY_LIB_MODULES]
+    reloaded = extension.reload_changed_lib_modules(extension.LIB_MODULES)
+    assert reloaded == loaded[loaded.index("lib.pattern_element"):]
+    assert "lib.datum_log" not in sys.modules
+
+    # Dependents see the new version of the changed module
+    element = sys.modules["lib.pattern_element"]
+    assert element.PatternElement is not element_class
+    assert sys.modules["lib.pattern_matcher"].PatternElement is element.PatternElement
+    assert sys.modules["lib.pattern_tokens"].Token is tokens_class
+
+    assert extension.reload_changed_lib_modules(extension.LIB_MODULES) == []
+
+def test_lazy_module_change_reloaded(tmp_path, extension):
+    make_analyzer(extension, record_setting=str(tmp_path / "capture.cdlog"))
+    writer_class = sys.modules["lib.datum_log"].DatumLogWriter
+    sys.modules["lib.datum_log"].close_open_writers()
+
+    touch(tmp_path / "lib" / "datum_log.py")
+    assert "lib.datum_log" in extension.reload_changed_lib_modules(extension.LIB_MODULES)
+    assert sys.modules["lib.datum_log"].DatumLogWriter is not writer_class
+
+def test_max_candidates(extension):
+    # Counted repeats are interpreted, rather than compiled into the automaton
+    pattern = "\"w\" = n:. (n*.) xCC"
+    analyzer = make_analyzer(extension, pattern_setting=pattern, max_candidates_setting=3.0)
+    decode(analyzer, [0x10] * 20)
+    assert analyzer.matcher.interpreter.max_candidates == 3
+    assert analyzer.matcher.interpreter.evictions > 0
+
+    # The same patterns are compiled once, but each analyzer has its own limit
+    assert make_analyzer(extension, pattern_setting=pattern).matcher.interpreter.max_candidates == 4096
+
+    # Logic2 has no default for number settings, so an unset or zero limit uses the matcher's
+    for unset in [0.0, None]:
+        assert make_analyzer(extension, pattern_setting=pattern, max_candidates_setting=unset).matcher.interpreter.max_candidates == 4096
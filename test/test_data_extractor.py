@@ -0,0 +1,47 @@
+# type: ignore
+
+import pytest
+from ..lib.data_extractor import *
+from ..lib.replay import ReplayFrame
+
+def frame(ty, **data):
+    return ReplayFrame(ty, 0.0, 0.0, data)
+
+def test_async_serial():
+    extract = datum_extractor("Async Serial")
+    assert extract(frame("data", data=b"\x41")) == 0x41
+    assert extract(frame("data", data=b"\x01\x02")) == 0x0102
+    assert extract(frame("data", data=b"\x41", error="Framing")) == 0x41
+
+    extract = datum_extractor("Async Serial (errors end matches)")
+    assert extract(frame("data", data=b"\x41")) == 0x41
+    assert extract(frame("data", data=b"\x41", error="Framing")) == DATA_BOUNDARY
+
+def test_spi():
+    result = frame("result", mosi=b"\x01", miso=b"\xFF")
+    assert datum_extractor("SPI (use MOSI)")(result) == 0x01
+    assert datum_extractor("SPI (use MISO)")(result) == 0xFF
+    assert datum_extractor("SPI (use MOSI then MISO)")(result) == 0x01FF
+    assert datum_extractor("SPI (use MOSI)")(frame("enable")) is None
+
+def test_i2c():
+    extract = datum_extractor("I2C")
+    assert extract(frame("data", data=b"\x10", ack=True)) == 0x10
+    for ty in ["start", "stop"]:
+        assert extract(frame(ty)) == DATA_BOUNDARY
+    assert extract(frame("address", address=b"\x50", read=False, ack=True)) == DATA_BOUNDARY
+
+def test_can():
+    extract = datum_extractor("CAN")
+    assert extract(frame("data_field", data=0x12)) == 0x12
+    assert extract(frame("data_field", data=b"\x12")) == 0x12
+    assert extract(frame("identifier_field", identifier=0x123, extended=False, remote_frame=False)) == DATA_BOUNDARY
+    assert extract(frame("crc_field", crc=0x1234)) is None
+
+def test_missing_data():
+    with pytest.raises(CustomException):
+        datum_extractor("I2C")(frame("data", address=b"\x50"))
+
+def test_unknown_type():
+    with pytest.raises(ValueError):
+        datum_extractor("Morse")
@@ -0,0 +1,30 @@
+# type: ignore
+
+import pytest
+from ..lib.data_history import *
+
+def test_indices_kept_after_discard():
+    history = DataHistory()
+    for i in range(10):
+        history.append(i, i * 10)
+
+    history.discard_before(4)
+    assert len(history) == 6
+    assert history.end_index == 10
+    assert history.data_between(4, 7) == (4, 5, 6)
+    assert history.time_at(9) == 90
+
+    with pytest.raises(AssertionError):
+        history.data_between(3, 5)
+
+def test_word_width():
+    history = DataHistory(16)
+    assert history.data.itemsize == 2
+    history.append(0x1234, 0)
+    assert history.data_between(0, 1) == (0x1234,)
+
+def test_data_wider_than_words():
+    history = DataHistory()
+    history.append(0x01, 0)
+    history.append(0x1234, 1)
+    assert history.data_between(0, 2) == (0x01, 0x1234)
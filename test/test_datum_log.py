@@ -0,0 +1,81 @@
+# type: ignore
+
+import os
+import pytest
+from ..lib.datum_log import *
+from ..lib.data_extractor import DATA_BOUNDARY
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "capture.cdlog")
+    with DatumLogWriter(path, word_width=16) as writer:
+        for i in range(3000):
+            writer.append(i * 7 % 65536, i * 0.5, i * 0.5 + 0.25)
+
+    assert is_datum_log(path)
+    with DatumLog(path) as log:
+        assert (len(log), log.word_width) == (3000, 16)
+        assert log.record(1234) == (1234 * 7, 617.0, 617.25)
+        assert list(log.records(2998)) == [(2998 * 7, 1499.0, 1499.25), (2999 * 7, 1499.5, 1499.75)]
+        assert sum(1 for _ in log.records()) == 3000
+
+        with pytest.raises(IndexError):
+            log.record(3000)
+
+def test_find(tmp_path):
+    path = str(tmp_path / "capture.cdlog")
+    with DatumLogWriter(path) as writer:
+        for i in range(5000):
+            writer.append(0, float(i // 2), float(i // 2))
+
+    with DatumLog(path) as log:
+        assert log.find(-1.0) == 0
+        assert log.find(0.0) == 0
+        assert log.find(1000.0) == 2000
+        assert log.find(1000.5) == 2002
+        assert log.find(2499.0) == 4998
+        assert log.find(9999.0) == 5000
+
+def test_interrupted_writer(tmp_path):
+    path = str(tmp_path / "capture.cdlog")
+    with DatumLogWriter(path) as writer:
+        for i in range(2500):
+            writer.append(i % 256, float(i), float(i))
+
+    # Lose the index and half of the last record
+    os.remove(path + ".index")
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - LOG_RECORD.size // 2)
+
+    with DatumLog(path) as log:
+        assert len(log) == 2499
+        assert list(log.index) == [0.0, 1024.0, 2048.0]
+        assert log.find(2000.0) == 2000
+
+def test_boundaries(tmp_path):
+    path = str(tmp_path / "capture.cdlog")
+    with DatumLogWriter(path) as writer:
+        writer.append_boundary()
+        for i in range(6):
+            writer.append(i, float(i), float(i))
+            if i in (1, 3):
+                writer.append_boundary()
+                writer.append_boundary()
+        writer.append_boundary()
+
+    with DatumLog(path) as log:
+        assert list(log.boundaries) == [2, 4]
+        assert [datum for datum, _, _ in log.records(boundaries=True)] == [0, 1, DATA_BOUNDARY, 2, 3, DATA_BOUNDARY, 4, 5]
+        assert list(log.records(2, 5, boundaries=True)) == [(2, 2.0, 2.0), (3, 3.0, 3.0), (DATA_BOUNDARY, 4.0, 4.0), (4, 4.0, 4.0)]
+
+    # A log without boundaries
+    os.remove(path + ".boundaries")
+    with DatumLog(path) as log:
+        assert list(log.boundaries) == []
+
+def test_not_a_log(tmp_path):
+    path = tmp_path / "export.csv"
+    path.write_text("name,type,start_time,duration,data\n")
+
+    assert not is_datum_log(str(path))
+    with pytest.raises(ValueError):
+        DatumLog(str(path))
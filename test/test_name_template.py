@@ -0,0 +1,25 @@
+# type: ignore
+
+import pytest
+from ..lib.name_template import *
+from ..lib.byte_formatter import ByteFormatter
+
+def test_parse():
+    assert NameTemplate.parse("Set {x:L}, {y}!").parts == (
+        "Set ", TemplateSlot("x", "L"), ", ", TemplateSlot("y", ""), "!",
+    )
+    assert NameTemplate.parse("{{literal}}").parts == ("{literal}",)
+
+def test_render_matches_format():
+    captures = { "a": b"\x01\x02", "b": b"\xFF", "unused": b"" }
+    for name in ["plain", "{a} {b}", "{a:s} and {a:L} / {b:B}", "{{{a}}}"]:
+        expected = name.format(**{ k: ByteFormatter(v) for k, v in captures.items() })
+        assert NameTemplate.parse(name).render(captures) == expected
+
+def test_captures():
+    assert NameTemplate.parse("{a} {b:s} {a:L}").captures() == { "a", "b" }
+
+@pytest.mark.parametrize("name", ["{x:Q}", "{}", "{0}", "{x.y}", "{x!r}", "{x", "x}"])
+def test_invalid(name):
+    with pytest.raises(ValueError):
+        NameTemplate.parse(name)
@@ -0,0 +1,148 @@
+# type: ignore
+
+import random
+import pytest
+np = pytest.importorskip("numpy")
+
+from ..lib.offline_matcher import *
+from ..lib.datum_log import DatumLog, DatumLogWriter
+from ..lib.pattern_matcher import PatternMatcher
+from ..lib.pattern_parser import Parser
+from ..lib.pattern_tokenizer import Tokenizer
+
+SOURCE = """
+    "a {x}" = xAA x:. x01;
+    "b" = xAA .. x02;
+    "c {y:s}" = . y:(d3*.) xBB;
+    "d" = xBB xBB;
+    "big" = xAA d20*(d60*.) x02;
+    "e {n}" = x03 n:. (n-d1*.) xBB;
+"""
+
+def test_resolve_overlaps():
+    assert resolve_overlaps([
+        (5, 8, 0, 0),
+        (2, 6, 1, 1),
+        (3, 6, 0, 2),
+        (7, 9, 0, 3),
+        (9, 9, 0, 4),
+    ]) == [(2, 6, 1, 1), (7, 9, 0, 3)]
+
+def test_matches_serial():
+    patterns = parse(SOURCE)
+    rng = random.Random(5)
+    data = bytes(rng.choice([0xAA, 0xBB, 0x01, 0x02, 0x03]) for _ in range(2000))
+    times = list(range(len(data)))
+
+    serial = PatternMatcher(patterns)
+    expected = [m for i, d in enumerate(data) if (m := serial.feed(d, i, i)) is not None]
+
+    assert OfflineMatcher(patterns).match(data, times) == expected
+    assert OfflineMatcher(patterns).match(np.frombuffer(data, dtype=np.uint8), times) == expected
+
+def test_interpreted_start_checks():
+    source = """
+        "class" = [x01-x03] xBB n:. (n-d1*.) xAA;
+        "alternation" = (xAA xBB | x03) n:. (n-d1*.);
+        "wildcard" = . x02 x01 n:. (n-d1*.);
+    """
+    matcher = OfflineMatcher(parse(source))
+    assert [len(steps) for steps, exact in matcher.checks] == [2, 1, 3]
+    assert not any(exact for _, exact in matcher.checks)
+
+    rng = random.Random(9)
+    data = bytes(rng.choice([0xAA, 0xBB, 0x01, 0x02, 0x03]) for _ in range(3000))
+    serial = PatternMatcher(parse(source))
+    expected = [m for i, d in enumerate(data) if (m := serial.feed(d, i, i)) is not None]
+    assert {m.pattern.name for m in expected} == {"class", "alternation", "wildcard"}
+    assert matcher.match(data, range(len(data))) == expected
+
+def test_end_times():
+    matches = OfflineMatcher(parse("\"a\" = x01 x02")).match(b"\x00\x01\x02", [0, 10, 20], [5, 15, 25])
+    assert [(m.start_time, m.end_time) for m in matches] == [(10, 25)]
+
+def test_wide_words():
+    patterns = Parser(Tokenizer("\"a {x:s}\" = x1234 x:. ; \"b\" = x00FF x1234").tokenize(), 16).parse()
+    data = np.array([0x00FF, 0x1234, 0xABCD, 0x1234, 0x0001], dtype=np.uint16)
+
+    matches = OfflineMatcher(patterns, word_width=16).match(data, range(5))
+    assert [(m.pattern.name, m.captures, m.start_time) for m in matches] == [("b", {}, 0), ("a {x:s}", { "x": (0x0001,) }, 3)]
+
+def test_match_log(tmp_path):
+    patterns = parse(SOURCE)
+    rng = random.Random(6)
+    data = [rng.choice([0xAA, 0xBB, 0x01, 0x02, 0x03]) for _ in range(3000)]
+
+    path = str(tmp_path / "capture.cdlog")
+    with DatumLogWriter(path) as writer:
+        for i, datum in enumerate(data):
+            writer.append(datum, float(i), i + 0.5)
+
+    serial = PatternMatcher(patterns)
+    expected = [m for i, d in enumerate(data) if (m := serial.feed(d, float(i), i + 0.5)) is not None]
+
+    with DatumLog(path) as log:
+        # Small windows, so that many matches cross from one to the next
+        assert list(OfflineMatcher(patterns).match_log(log, window=50)) == expected
+
+        # Only part of the log
+        serial = PatternMatcher(patterns)
+        expected = [m for i, d in enumerate(data[1000:2000], 1000) if (m := serial.feed(d, float(i), i + 0.5)) is not None]
+        assert list(OfflineMatcher(patterns).match_log(log, log.find(1000.0), 2000, window=64)) == expected
+
+def test_match_log_boundaries(tmp_path):
+    patterns = parse(SOURCE)
+    rng = random.Random(7)
+    data = [rng.choice([0xAA, 0xBB, 0x01, 0x02, 0x03]) for _ in range(3000)]
+    boundaries = set(rng.sample(range(1, 3000), 300))
+
+    path = str(tmp_path / "capture.cdlog")
+    serial = PatternMatcher(patterns)
+    expected = []
+    with DatumLogWriter(path) as writer:
+        for i, datum in enumerate(data):
+            if i in boundaries:
+                writer.append_boundary()
+                expected += serial.boundary()
+            writer.append(datum, float(i), i + 0.5)
+            if (m := serial.feed(datum, float(i), i + 0.5)) is not None:
+                expected.append(m)
+
+    with DatumLog(path) as log:
+        assert list(OfflineMatcher(patterns).match_log(log, window=50)) == expected
+
+def test_parallel_matches_serial(tmp_path):
+    # Every pattern has a maximum length, even the counted repeat, whose count is one byte, so
+    # chunks can be searched separately
+    patterns = parse(SOURCE)
+    assert OfflineMatcher(patterns).max_length == 1202
+
+    rng = random.Random(8)
+    data = [rng.choice([0xAA, 0xBB, 0x01, 0x02, 0x03]) for _ in range(5000)]
+    data[1000:1000 + 1202] = [0xAA] + [0x00] * 1200 + [0x02]
+    times = [float(i) for i in range(len(data))]
+
+    serial = PatternMatcher(patterns)
+    expected = [m for i, d in enumerate(data) if (m := serial.feed(d, times[i], times[i])) is not None]
+    assert "big" in [m.pattern.name for m in expected]
+
+    # Small chunks, so that matches often cross from one to the next
+    assert OfflineMatcher(patterns).match_parallel(bytes(data), times, processes=2, chunk_size=97) == expected
+
+    path = str(tmp_path / "capture.cdlog")
+    with DatumLogWriter(path) as writer:
+        for datum, time in zip(data, times):
+            writer.append(datum, time, time)
+    with DatumLog(path) as log:
+        assert list(OfflineMatcher(patterns).match_log(log, window=300, processes=2)) == expected
+
+def test_parallel_unbounded_is_serial():
+    # A count of eight bytes could be too large for any chunk
+    matcher = OfflineMatcher(parse(SOURCE + "\"f {n}\" = x04 n:(........) (n*.) xBB;"))
+    assert matcher.max_length is None
+
+    data = bytes([0x03, 0x02, 0xAA, 0xBB])
+    assert matcher.match_parallel(data, range(4), chunk_size=1) == [PatternMatch(matcher.patterns[5], { "n": (0x02,) }, 0, 3)]
+
+def parse(source):
+    return Parser(Tokenizer(source).tokenize()).parse()
@@ -0,0 +1,148 @@
+# type: ignore
+
+import os
+import pickle
+import pytest
+from ..lib.pattern_cache import *
+from ..lib.pattern_cache import _loaded_files, _text_compilers
+
+@pytest.fixture(autouse=True)
+def forget_files():
+    forget_loaded_files()
+    yield
+    forget_loaded_files()
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "cache"
+    monkeypatch.setenv(CACHE_DIRECTORY_ENVIRONMENT_VARIABLE, str(directory))
+    return directory
+
+def write_patterns(tmp_path, source):
+    path = tmp_path / "patterns.cdpat"
+    path.write_text(source)
+    return str(path)
+
+def names(matcher):
+    return [p.name for p in matcher.patterns]
+
+def test_cache_written_and_used(tmp_path, cache_dir):
+    path = write_patterns(tmp_path, "\"a\" = x01; \"b\" = x02 .")
+    assert names(load_matcher("File", path)) == ["a", "b"]
+
+    entries = os.listdir(cache_dir)
+    assert len(entries) == 1
+
+    # Prove the entry is used by sneakily replacing what's in it
+    key = cache_key("\"a\" = x01; \"b\" = x02 .")
+    compiler = IncrementalCompiler()
+    compiler.compile("", "\"c\" = x03")
+    with open(cache_path(str(cache_dir), cache_entry_prefix(path), key), "wb") as f:
+        pickle.dump((CACHE_FORMAT_VERSION, key, compiler), f)
+    forget_loaded_files()
+    assert names(load_matcher("File", path)) == ["c"]
+
+def test_cache_invalidated_by_change(tmp_path, cache_dir):
+    path = write_patterns(tmp_path, "\"a\" = x01")
+    assert names(load_matcher("File", path)) == ["a"]
+
+    write_patterns(tmp_path, "\"b\" = x01")
+    assert names(load_matcher("File", path)) == ["b"]
+
+def test_corrupt_entry_replaced(tmp_path, cache_dir):
+    source = "\"a\" = x01"
+    path = write_patterns(tmp_path, source)
+    load_matcher("File", path)
+
+    entry = cache_path(str(cache_dir), cache_entry_prefix(path), cache_key(source))
+    with open(entry, "wb") as f:
+        f.write(b"not a pickle")
+    forget_loaded_files()
+    assert names(load_matcher("File", path)) == ["a"]
+
+    # Removed, then rewritten by the load above
+    with open(entry, "rb") as f:
+        assert pickle.load(f)[1] == cache_key(source)
+
+def test_cached_matcher_matches(tmp_path, cache_dir):
+    path = write_patterns(tmp_path, "\"a {x}\" = xAA x:. x01")
+    load_matcher("File", path)
+    matcher = load_matcher("File", path)
+
+    results = [matcher.feed(d, i, i) for i, d in enumerate([0xAA, 0x05, 0x01])]
+    assert results[-1].captures == { "x": (0x05,) }
+
+def test_only_changed_statements_recompiled(tmp_path, cache_dir):
+    source = "".join(f"\"p{i}\" = x{i:02X} . ;\n" for i in range(50))
+    path = write_patterns(tmp_path, source)
+    load_matcher("File", path)
+
+    write_patterns(tmp_path, source.replace("\"p7\" = x07", "\"p7\" = x77"))
+    matcher = load_matcher("File", path)
+    assert _loaded_files[(path, 8, None)].compiler.parsed == 1
+
+    assert names(matcher)[7] == "p7"
+    assert [m.pattern.name for i, d in enumerate([0x77, 0x00, 0x07, 0x00]) if (m := matcher.feed(d, i, i))] == ["p7"]
+
+def test_recompiled_file_cached_on_exit(tmp_path, cache_dir):
+    source = "".join(f"\"p{i}\" = x{i:02X} . ;\n" for i in range(50))
+    path = write_patterns(tmp_path, source)
+    load_matcher("File", path)
+    first_entry = cache_path(str(cache_dir), cache_entry_prefix(path), cache_key(source))
+    assert os.listdir(cache_dir) == [os.path.basename(first_entry)]
+
+    # Not written straight away after an edit...
+    edited = source.replace("\"p7\" = x07", "\"p7\" = x77")
+    write_patterns(tmp_path, edited)
+    load_matcher("File", path)
+    assert os.listdir(cache_dir) == [os.path.basename(first_entry)]
+
+    # ...but on exit, replacing the older entry
+    save_loaded_files()
+    assert os.listdir(cache_dir) == [os.path.basename(cache_path(str(cache_dir), cache_entry_prefix(path), cache_key(edited)))]
+    forget_loaded_files()
+    matcher = load_matcher("File", path)
+    assert any("x77" in statement for statement in _loaded_files[(path, 8, None)].compiler.statements)
+    assert [m.pattern.name for i, d in enumerate([0x77, 0x00]) if (m := matcher.feed(d, i, i))] == ["p7"]
+
+    # Entries for different settings are kept separately
+    load_matcher("File", path, 16)
+    assert len(os.listdir(cache_dir)) == 2
+
+def test_unmodified_file_not_read(tmp_path, cache_dir):
+    path = write_patterns(tmp_path, "\"a\" = x01")
+    os.utime(path, (1000000000, 1000000000))
+    assert names(load_matcher("File", path)) == ["a"]
+
+    # The same size and modification time, so assumed to be unchanged
+    write_patterns(tmp_path, "\"b\" = x01")
+    os.utime(path, (1000000000, 1000000000))
+    assert names(load_matcher("File", path)) == ["a"]
+
+    # A recently-modified file can't be trusted to change its modification time when it changes
+    write_patterns(tmp_path, "\"c\" = x01")
+    assert names(load_matcher("File", path)) == ["c"]
+    write_patterns(tmp_path, "\"d\" = x01")
+    assert names(load_matcher("File", path)) == ["d"]
+
+def test_text_not_cached(cache_dir):
+    assert names(load_matcher("Text", "\"a\" = x01")) == ["a"]
+    assert not cache_dir.exists()
+
+def test_cache_disabled(tmp_path, monkeypatch):
+    monkeypatch.setenv(CACHE_DIRECTORY_ENVIRONMENT_VARIABLE, "")
+    assert cache_directory() is None
+    assert names(load_matcher("File", write_patterns(tmp_path, "\"a\" = x01"))) == ["a"]
+
+def test_text_compiled_incrementally(cache_dir):
+    source = "".join(f"\"p{i}\" = x{i:02X} ;\n" for i in range(20))
+    assert names(load_matcher("Text", source)) == [f"p{i}" for i in range(20)]
+    assert names(load_matcher("Text", source)) == [f"p{i}" for i in range(20)]
+    assert _text_compilers[(8, None)].parsed == 0
+
+    assert names(load_matcher("Text", source + "\"q\" = x01")) == [f"p{i}" for i in range(20)] + ["q"]
+    assert _text_compilers[(8, None)].parsed == 1
+
+    # Different settings don't share statements
+    load_matcher("Text", source, 16)
+    assert _text_compilers[(16, None)].parsed == 20
@@ -0,0 +1,47 @@
+# type: ignore
+
+import pytest
+from ..lib.pattern_compiler import *
+from ..lib.pattern_source import parse_patterns
+
+SOURCE = """
+    // Header; with a semicolon in a comment
+    "a {x}" = xAA x:. x01;
+    "b; c" = xAA .. x02;
+    xBB xBB
+"""
+
+def test_split_statements():
+    statements = split_statements(SOURCE)
+    assert [text.strip().splitlines()[-1].strip() for _, text in statements] == ["\"a {x}\" = xAA x:. x01;", "\"b; c\" = xAA .. x02;", "xBB xBB"]
+    assert "".join(text for _, text in statements) == SOURCE.rstrip() + "\n"
+    assert all(SOURCE[offset:].startswith(text) for offset, text in statements)
+
+def test_same_patterns_as_parser():
+    compiler = IncrementalCompiler()
+    assert compiler.compile("<text>", SOURCE).patterns == parse_patterns("<text>", SOURCE)
+    assert compiler.parsed == 3
+
+def test_unchanged_statements_reused():
+    compiler = IncrementalCompiler()
+    first = compiler.compile("<text>", SOURCE)
+
+    edited = "\"d\" = xCC;" + SOURCE.replace("x02", "x03")
+    second = compiler.compile("<text>", edited)
+    assert compiler.parsed == 2
+    assert second.patterns == parse_patterns("<text>", edited)
+    assert second.patterns[1] is first.patterns[0]
+
+    # Programs compiled for the same alphabet, which each matcher has its own copy of
+    matches = [second.feed(d, i, i) for i, d in enumerate([0xAA, 0x05, 0x01, 0xAA, 0x00, 0x00, 0x03])]
+    assert [m.pattern.name for m in matches if m is not None] == ["a {x}", "b; c"]
+    assert first.automaton.alphabet is not second.automaton.alphabet
+
+def test_error_position():
+    compiler = IncrementalCompiler()
+    compiler.compile("<text>", SOURCE)
+
+    with pytest.raises(CustomException) as error:
+        compiler.compile("<text>", SOURCE.replace("x02", "x02 ?"))
+    assert str(error.value) == str(pytest.raises(CustomException, parse_patterns, "<text>", SOURCE.replace("x02", "x02 ?")).value)
+    assert "line 4" in str(error.value)
@@ -3,80 +3,213 @@
 from ..lib.pattern_element import *
 
 def test_fixed():
-    assert FixedPatternElement(b"\x12").match(b"\x12", env()) == PatternMatchResult.SUCCESS
-    assert FixedPatternElement(b"\x12").match(b"\xAB", env()) == PatternMatchResult.FAILURE
+    assert FixedPatternElement(0x12).match(0x12, None, env()) == (PatternMatchResult.SUCCESS, None)
+    assert FixedPatternElement(0x12).match(0xAB, None, env()) == (PatternMatchResult.FAILURE, None)
 
 def test_sequence():
-    seq = SequencePatternElement([
-        FixedPatternElement(b"\x01"),
+    seq = Cursor(SequencePatternElement([
+        FixedPatternElement(0x01),
         SequencePatternElement([
-            FixedPatternElement(b"\x02"),
-            FixedPatternElement(b"\x03"),
+            FixedPatternElement(0x02),
+            FixedPatternElement(0x03),
         ]),
-        FixedPatternElement(b"\x04"),
-    ])
+        FixedPatternElement(0x04),
+    ]))
 
-    assert seq.match(b"\x01", env()) == PatternMatchResult.NEED_MORE
-    assert seq.match(b"\x03", env()) == PatternMatchResult.FAILURE
+    assert seq.match(0x01, env()) == PatternMatchResult.NEED_MORE
+    assert seq.match(0x03, env()) == PatternMatchResult.FAILURE
     seq.reset()
 
-    assert seq.match(b"\x01", env()) == PatternMatchResult.NEED_MORE
-    assert seq.match(b"\x02", env()) == PatternMatchResult.NEED_MORE
-    assert seq.match(b"\x03", env()) == PatternMatchResult.NEED_MORE
-    assert seq.match(b"\x04", env()) == PatternMatchResult.SUCCESS
+    # The pattern itself holds no state, so can be shared between cursors
+    other = Cursor(seq.element)
+    assert other.match(0x01, env()) == PatternMatchResult.NEED_MORE
+
+    assert seq.match(0x01, env()) == PatternMatchResult.NEED_MORE
+    assert seq.match(0x02, env()) == PatternMatchResult.NEED_MORE
+    assert seq.match(0x03, env()) == PatternMatchResult.NEED_MORE
+    assert seq.match(0x04, env()) == PatternMatchResult.SUCCESS
 
 def test_wildcard():
-    seq = SequencePatternElement([
-        FixedPatternElement(b"\x01"),
+    seq = Cursor(SequencePatternElement([
+        FixedPatternElement(0x01),
         WildcardPatternElement(),
         WildcardPatternElement(),
-        FixedPatternElement(b"\x04"),
-    ])
+        FixedPatternElement(0x04),
+    ]))
 
-    assert seq.match(b"\x01", env()) == PatternMatchResult.NEED_MORE
-    assert seq.match(b"\x02", env()) == PatternMatchResult.NEED_MORE
-    assert seq.match(b"\x03", env()) == PatternMatchResult.NEED_MORE
-    assert seq.match(b"\x04", env()) == PatternMatchResult.SUCCESS
+    assert seq.match(0x01, env()) == PatternMatchResult.NEED_MORE
+    assert seq.match(0x02, env()) == PatternMatchResult.NEED_MORE
+    assert seq.match(0x03, env()) == PatternMatchResult.NEED_MORE
+    assert seq.match(0x04, env()) == PatternMatchResult.SUCCESS
 
 def test_capture():
-    seq = SequencePatternElement([
-        FixedPatternElement(b"\x01"),
+    seq = Cursor(SequencePatternElement([
+        FixedPatternElement(0x01),
         CapturePatternElement("x", SequencePatternElement([
             WildcardPatternElement(),
             WildcardPatternElement(),
         ])),
-        FixedPatternElement(b"\x04"),
-    ])
+        FixedPatternElement(0x04),
+    ]))
 
     e = env()
-    assert seq.match(b"\x01", e) == PatternMatchResult.NEED_MORE
-    assert seq.match(b"\x02", e) == PatternMatchResult.NEED_MORE
-    assert seq.match(b"\x03", e) == PatternMatchResult.NEED_MORE
-    assert seq.match(b"\x04", e) == PatternMatchResult.SUCCESS
+    assert seq.match(0x01, e) == PatternMatchResult.NEED_MORE
+    assert seq.match(0x02, e) == PatternMatchResult.NEED_MORE
+    assert seq.match(0x03, e) == PatternMatchResult.NEED_MORE
+    assert seq.match(0x04, e) == PatternMatchResult.SUCCESS
 
-    assert e.captures == { "x": b"\x02\x03" }
+    assert e.captures == { "x": (0x02, 0x03) }
 
 def test_start_hint():
-    assert FixedPatternElement(b"\x01").start_hint() == [b"\x01"]
+    assert FixedPatternElement(0x01).start_hint() == [0x01]
     assert SequencePatternElement([
-        FixedPatternElement(b"\x01"),
-        FixedPatternElement(b"\x02"),
-    ]).start_hint() == [b"\x01"]
+        FixedPatternElement(0x01),
+        FixedPatternElement(0x02),
+    ]).start_hint() == [0x01]
     assert WildcardPatternElement().start_hint() == None
+    assert AlternationPatternElement([FixedPatternElement(0x02), FixedPatternElement(0x01)]).start_hint() == [0x01, 0x02]
+    assert AlternationPatternElement([FixedPatternElement(0x02), WildcardPatternElement()]).start_hint() == None
 
 def test_repeat():
-    seq = SequencePatternElement([
-        FixedPatternElement(b"\x01"),
-        RepeatPatternElement(FixedPatternElement(b"\x02"), 4),
-        FixedPatternElement(b"\x03"),
-    ])
-
-    assert seq.match(b"\x01", env()) == PatternMatchResult.NEED_MORE
-    assert seq.match(b"\x02", env()) == PatternMatchResult.NEED_MORE
-    assert seq.match(b"\x02", env()) == PatternMatchResult.NEED_MORE
-    assert seq.match(b"\x02", env()) == PatternMatchResult.NEED_MORE
-    assert seq.match(b"\x02", env()) == PatternMatchResult.NEED_MORE
-    assert seq.match(b"\x03", env()) == PatternMatchResult.SUCCESS
+    seq = Cursor(SequencePatternElement([
+        FixedPatternElement(0x01),
+        RepeatPatternElement(FixedPatternElement(0x02), 4),
+        FixedPatternElement(0x03),
+    ]))
+
+    assert seq.match(0x01, env()) == PatternMatchResult.NEED_MORE
+    assert seq.match(0x02, env()) == PatternMatchResult.NEED_MORE
+    assert seq.match(0x02, env()) == PatternMatchResult.NEED_MORE
+    assert seq.match(0x02, env()) == PatternMatchResult.NEED_MORE
+    assert seq.match(0x02, env()) == PatternMatchResult.NEED_MORE
+    assert seq.match(0x03, env()) == PatternMatchResult.SUCCESS
+
+def test_counted_repeat():
+    seq = Cursor(SequencePatternElement([
+        CapturePatternElement("n", WildcardPatternElement()),
+        CountedRepeatPatternElement(FixedPatternElement(0x02), "n"),
+        FixedPatternElement(0x03),
+    ]))
+
+    e = env()
+    assert seq.match(0x02, e) == PatternMatchResult.NEED_MORE
+    assert seq.match(0x02, e) == PatternMatchResult.NEED_MORE
+    assert seq.match(0x02, e) == PatternMatchResult.NEED_MORE
+    assert seq.match(0x03, e) == PatternMatchResult.SUCCESS
+
+    # A count of zero can't match
+    seq.reset()
+    assert seq.match(0x00, env()) == PatternMatchResult.NEED_MORE
+    assert seq.match(0x03, env()) == PatternMatchResult.FAILURE
+
+def test_counted_repeat_skip():
+    # Wildcards don't need matching one by one, so the state is just a count of data
+    element = CountedRepeatPatternElement(SequencePatternElement([WildcardPatternElement(), WildcardPatternElement()]), "n", offset=-1)
+    assert element.skip_length == 2
+    assert match_data(element, [0x00] * 5, PatternMatchEnvironment({ "n": (0x04,) })) == PatternMatchResult.NEED_MORE
+    assert match_data(element, [0x00] * 6, PatternMatchEnvironment({ "n": (0x04,) })) == PatternMatchResult.SUCCESS
+
+    # Multi-word counts
+    assert CountedRepeatPatternElement(WildcardPatternElement(), "n", True).count(PatternMatchEnvironment({ "n": (0x01, 0x02) })) == 0x0201
+    assert CountedRepeatPatternElement(WildcardPatternElement(), "n", False, 2, 16).count(PatternMatchEnvironment({ "n": (0x01, 0x02) })) == 0x00010004
+
+    # Anything captured has to be matched properly
+    assert CountedRepeatPatternElement(CapturePatternElement("x", WildcardPatternElement()), "n").skip_length is None
+
+def test_alternation():
+    alt = Cursor(AlternationPatternElement([
+        SequencePatternElement([FixedPatternElement(0x01), FixedPatternElement(0x02), FixedPatternElement(0x03)]),
+        SequencePatternElement([FixedPatternElement(0x01), CapturePatternElement("x", WildcardPatternElement())]),
+        SequencePatternElement([WildcardPatternElement(), FixedPatternElement(0x04)]),
+    ]))
+
+    # The first alternative to complete is chosen, with only its captures kept
+    e = env()
+    assert alt.match(0x01, e) == PatternMatchResult.NEED_MORE
+    assert len(alt.state) == 3
+    assert e.captures == {}
+    assert alt.match(0x02, e) == PatternMatchResult.SUCCESS
+    assert e.captures == { "x": (0x02,) }
+    alt.reset()
+
+    # Alternatives are only started if their start hint allows
+    e = env()
+    assert alt.match(0x05, e) == PatternMatchResult.NEED_MORE
+    assert len(alt.state) == 1
+    assert alt.match(0x04, e) == PatternMatchResult.SUCCESS
+    assert e.captures == {}
+    alt.reset()
+
+    assert alt.match(0x05, env()) == PatternMatchResult.NEED_MORE
+    assert alt.match(0x05, env()) == PatternMatchResult.FAILURE
+
+def test_match_data():
+    seq = SequencePatternElement([FixedPatternElement(0x01), WildcardPatternElement()])
+    assert match_data(seq, [0x01, 0x02], env()) == PatternMatchResult.SUCCESS
+    assert match_data(seq, [0x01], env()) == PatternMatchResult.NEED_MORE
+    assert match_data(seq, [0x02, 0x02], env()) == PatternMatchResult.FAILURE
 
 def env() -> PatternMatchEnvironment:
     return PatternMatchEnvironment()
+
+class Cursor:
+    """Steps a pattern through data, holding its match state."""
+
+    def __init__(self, element):
+        self.element = element
+        self.state = None
+
+    def match(self, datum, env):
+        result, self.state = self.element.match(datum, self.state, env)
+        return result
+
+    def reset(self):
+        self.state = None
+
+def test_literal_prefix():
+    assert SequencePatternElement([
+        FixedPatternElement(0x01),
+        RepeatPatternElement(FixedPatternElement(0x02), 2),
+        CapturePatternElement("x", FixedPatternElement(0x03)),
+    ]).literal_prefix() == ([0x01, 0x02, 0x02, 0x03], True)
+    assert SequencePatternElement([
+        FixedPatternElement(0x01),
+        WildcardPatternElement(),
+        FixedPatternElement(0x02),
+    ]).literal_prefix() == ([0x01], False)
+    assert WildcardPatternElement().literal_prefix() == ([], False)
+
+def test_length_bounds():
+    assert SequencePatternElement([
+        FixedPatternElement(0x01),
+        RepeatPatternElement(SequencePatternElement([WildcardPatternElement(), FixedPatternElement(0x02)]), 3),
+        CapturePatternElement("x", WildcardPatternElement()),
+    ]).length_bounds() == (8, 8)
+    assert RepeatPatternElement(WildcardPatternElement(), 0).length_bounds() == (0, 0)
+    assert CountedRepeatPatternElement(WildcardPatternElement(), "n", offset=2).length_bounds() == (2, UNBOUNDED_LENGTH)
+
+    # The most a count can be depends on how long its capture can be
+    pair = SequencePatternElement([WildcardPatternElement(), WildcardPatternElement()])
+    assert CountedRepeatPatternElement(pair, "n", offset=-2, count_length=1).length_bounds() == (2, 253 * 2)
+    assert CountedRepeatPatternElement(WildcardPatternElement(), "n", count_length=2).length_bounds() == (1, 0xFFFF)
+    assert CountedRepeatPatternElement(WildcardPatternElement(), "n", word_width=32, count_length=2).length_bounds() == (1, UNBOUNDED_LENGTH)
+
+def test_results_compare_across_reloads():
+    # Reloading the module defines a new class, but results from before must still compare equal
+    reloaded = type("PatternMatchResult", (int,), {})
+    assert PatternMatchResult.SUCCESS == reloaded(0)
+    assert PatternMatchResult.NEED_MORE != reloaded(0)
+
+def test_class():
+    element = ClassPatternElement(((0x00, 0x1F), (0x7F, 0x7F)))
+    assert element.match(0x10, None, env()) == (PatternMatchResult.SUCCESS, None)
+    assert element.match(0x7F, None, env()) == (PatternMatchResult.SUCCESS, None)
+    assert element.match(0x20, None, env()) == (PatternMatchResult.FAILURE, None)
+    assert element.start_hint() == list(range(0x20)) + [0x7F]
+
+    # Huge classes are checked by range, and can't be hinted
+    huge = ClassPatternElement(((0x100, 0xFFFFFF),))
+    assert huge.members is None
+    assert huge.match(0x12345, None, env()) == (PatternMatchResult.SUCCESS, None)
+    assert huge.match(0x10, None, env()) == (PatternMatchResult.FAILURE, None)
+    assert huge.start_hint() is None
@@ -0,0 +1,287 @@
+# type: ignore
+
+import pytest
+import random
+from ..lib.pattern_matcher import *
+from ..lib.pattern_parser import Parser
+from ..lib.pattern_tokenizer import Tokenizer
+
+def test_named_match():
+    assert run("\"A {x}\" = x01 x:. x03", [0, 1, 2, 3, 4]) == [(1, 3, "A {x}", { "x": (0x02,) })]
+
+def test_earliest_start_wins():
+    assert run("\"short\" = x02 x03; \"long\" = x01 x02 x03", [1, 2, 3]) == [(0, 2, "long", {})]
+
+def test_tie_prefers_hinted_pattern():
+    assert run("\"wild\" = . x02; \"fixed\" = x01 x02", [1, 2]) == [(0, 1, "fixed", {})]
+
+def test_match_discards_in_flight():
+    # The second pattern would have completed on the last datum, but overlaps the first match
+    assert run("\"a\" = x01 x02; \"b\" = x02 x03 x04", [1, 2, 3, 4]) == [(0, 1, "a", {})]
+
+def test_interpreter_fallback():
+    # Too long to unroll into the automaton
+    matcher = compile("\"big\" = x01 d200*(d10*.) x02")
+    assert matcher.automaton_indices == []
+    assert feed(matcher, [1] + [0] * 2000 + [2]) == [(0, 2001, "big", {})]
+
+def test_automaton_matches_interpreter():
+    source = """
+        "a {x}" = xAA x:. x01;
+        "b" = xAA .. x02;
+        "c {y:s}" = . y:(d3*.) xBB;
+        "d" = xBB xBB;
+        xAA xAA;
+    """
+    rng = random.Random(1234)
+    data = [rng.choice([0xAA, 0xBB, 0x01, 0x02, 0x03]) for _ in range(5000)]
+
+    assert feed(compile(source), data) == feed(compile(source, use_automaton=False), data)
+
+def test_automaton_cache_flush():
+    matcher = compile("\"a\" = . . . x01; \"b\" = . x02 . x03", max_automaton_states=4)
+    reference = compile("\"a\" = . . . x01; \"b\" = . x02 . x03", use_automaton=False)
+
+    rng = random.Random(42)
+    data = [rng.randrange(0, 5) for _ in range(2000)]
+
+    assert feed(matcher, data) == feed(reference, data)
+    assert matcher.automaton.cache_flushes > 0
+
+def compile(source, **kwargs):
+    return PatternMatcher(Parser(Tokenizer(source).tokenize()).parse(), **kwargs)
+
+def run(source, data):
+    return feed(compile(source), data)
+
+def feed(matcher, data, start=0):
+    results = []
+    for i, datum in enumerate(data, start):
+        match = matcher.feed(datum, i, i)
+        if match is not None:
+            results.append(describe(match))
+    return results
+
+def feed_all(matcher, data, start=0, flush=True):
+    results = []
+    for i, datum in enumerate(data, start):
+        results += [describe(match) for match in matcher.feed_all(datum, i, i)]
+    if flush:
+        results += [describe(match) for match in matcher.flush()]
+    return results
+
+def describe(match):
+    return (match.start_time, match.end_time, getattr(match.pattern, "name", None), match.captures)
+
+def test_literal_prefix_spawning():
+    matcher = compile("\"a {x}\" = xAA x55 x:. ; \"b\" = xAA x55 x01 x02", use_automaton=False)
+
+    # Nothing is in flight until the whole prefix has been seen
+    matcher.feed(0xAA, 0, 0)
+    assert matcher.interpreter.candidates == []
+
+    # Matches are still back-dated to the start of the prefix
+    assert feed(matcher, [0x55, 0x07], start=1) == [(0, 2, "a {x}", { "x": (0x07,) })]
+
+def test_shared_header_is_one_candidate():
+    source = "".join(f"\"cmd {i}\" = xAA len:. x{i:02X} ;" for i in range(40))
+    matcher = compile(source, use_automaton=False)
+
+    feed(matcher, [0xAA, 0x05])
+    assert len(matcher.interpreter.candidates) == 1
+
+    assert feed(matcher, [0x21], start=2) == [(0, 2, "cmd 33", { "len": (0x05,) })]
+
+def test_doomed_candidates_pruned():
+    # Once "a" has seen xAA it is certain to complete, so any later start of "w" can't be chosen
+    source = "\"a\" = xAA . . . ; \"w\" = . . . . . xCC"
+    matcher = compile(source, use_automaton=False)
+
+    feed(matcher, [0x01, 0xAA, 0x02])
+    assert matcher.interpreter.pruned > 0
+    assert sorted(c.start_index for c in matcher.interpreter.candidates) == [0, 1, 1]
+
+    data = [0x01, 0xAA, 0x02, 0x03, 0x04, 0xCC, 0xAA, 0x00, 0x00, 0x00]
+    assert feed(compile(source, use_automaton=False), data) == reference(source, data)
+
+def test_class_leading_pattern_is_hinted():
+    matcher = compile("\"ctl {c}\" = c:[x00-x1F] x:. ; \"hi\" = ![x00-x7F] xFF", use_automaton=False)
+
+    # Only data in the class start a candidate
+    feed(matcher, [0x41, 0x42])
+    assert matcher.interpreter.candidates == []
+
+    assert feed(matcher, [0x05, 0x41, 0x80, 0xFF], start=2) == [(2, 3, "ctl {c}", { "c": (0x05,), "x": (0x41,) }), (4, 5, "hi", {})]
+
+def test_candidate_cap():
+    matcher = compile("\"w\" = . . . . . . . . xCC", use_automaton=False, max_candidates=3)
+
+    feed(matcher, [0x00] * 20)
+    assert len(matcher.interpreter.candidates) == 3
+    assert matcher.interpreter.evictions == 11
+
+    # The earliest-starting candidates are the ones kept
+    assert feed(matcher, [0x00] * 4 + [0xCC], start=20) == [(16, 24, "w", {})]
+
+def test_captures_survive_history_trimming():
+    matcher = compile("\"c {x:L}\" = x01 x:(d100*(d100*.)) x02")
+    captured = [i % 251 for i in range(10000)]
+
+    assert feed(matcher, [0] * 5000 + [1] + captured + [2]) == [(5000, 15001, "c {x:L}", { "x": tuple(captured) })]
+
+    # Only the data an in-flight capture still needs is kept
+    feed(matcher, [0] * 20000, start=15002)
+    assert len(matcher.history) < 2 * HISTORY_TRIM_LENGTH
+
+def test_wide_words():
+    source = "\"a {x:s}\" = x1234 x:. ; \"b\" = xBEEF xBEEF . x0001"
+    patterns = Parser(Tokenizer(source).tokenize(), 16).parse()
+    data = [0x0000, 0xBEEF, 0xBEEF, 0x1234, 0x0001, 0x1234, 0xFFFF]
+
+    for use_automaton in [True, False]:
+        matcher = PatternMatcher(patterns, use_automaton=use_automaton, word_width=16)
+        assert feed(matcher, data) == [(1, 4, "b", {}), (5, 6, "a {x:s}", { "x": (0xFFFF,) })]
+
+def test_counted_repeat():
+    source = "\"msg {payload:s}\" = xAA len:. payload:(len*.) crc:. ; \"ack\" = xAA x00 xAA"
+    data = [0xAA, 0x02, 0x10, 0x20, 0x99, 0xAA, 0x00, 0xAA, 0xAA, 0x01, 0xAA, 0x05]
+    expected = [(0, 4, "msg {payload:s}", { "len": (0x02,), "payload": (0x10, 0x20), "crc": (0x99,) }), (5, 7, "ack", {}), (8, 11, "msg {payload:s}", { "len": (0x01,), "payload": (0xAA,), "crc": (0x05,) })]
+
+    assert feed(compile(source), data) == expected
+    assert reference(source, data) == expected
+
+    rng = random.Random(7)
+    data = [rng.choice([0xAA, 0x00, 0x01, 0x02, 0x03]) for _ in range(2000)]
+    assert feed(compile(source), data) == reference(source, data)
+
+def test_alternation_is_one_candidate():
+    source = "\"cmd {op} {arg}\" = xAA op:(" + " | ".join(f"x{i:02X}" + " ." * (i % 3) for i in range(60)) + ") arg:. ; \"x\" = . xCC"
+    matcher = compile(source, use_automaton=False)
+
+    feed(matcher, [0xAA, 0x05])
+    assert len(matcher.interpreter.candidates) == 2
+
+    assert feed(matcher, [0x10, 0x20, 0x30], start=2) == [(0, 4, "cmd {op} {arg}", { "op": (0x05, 0x10, 0x20), "arg": (0x30,) })]
+
+def test_random_patterns_match_reference():
+    rng = random.Random(99)
+    for _ in range(30):
+        source = random_pattern_source(rng)
+        data = [rng.choice([0xAA, 0x55, 0x01, 0x02]) for _ in range(400)]
+
+        expected = reference(source, data)
+        assert feed(compile(source), data) == expected, source
+        assert feed(compile(source, use_automaton=False), data) == expected, source
+
+def test_leftmost_longest():
+    source = "\"short\" = x01 x02; \"long\" = x01 x02 . x03; \"other\" = x02 x03"
+    data = [1, 2, 7, 3, 1, 2, 7, 4, 2, 3]
+
+    assert run(source, data) == [(0, 1, "short", {}), (4, 5, "short", {}), (8, 9, "other", {})]
+    for use_automaton in [True, False]:
+        matcher = compile(source, use_automaton=use_automaton, max_latency=100)
+        assert feed_all(matcher, data) == [(0, 3, "long", {}), (4, 5, "short", {}), (8, 9, "other", {})]
+
+        with pytest.raises(ValueError):
+            matcher.feed(0, 0, 0)
+
+def test_longest_latency_bound():
+    source = "\"short\" = x01; \"long\" = x01 d20*. x02"
+    matcher = compile(source, max_latency=5)
+
+    # The long pattern is still in flight, but the short match can only be held for 5 data
+    emitted = [len(matcher.feed_all(0x01 if i == 0 else 0x00, i, i)) for i in range(10)]
+    assert emitted == [0, 0, 0, 0, 0, 1, 0, 0, 0, 0]
+
+    # With no latency, matches are chosen just as `feed` would
+    data = [0x01] + [0x00] * 20 + [0x02, 0x01]
+    assert feed_all(compile(source, max_latency=0), data) == run(source, data)
+
+def test_boundary():
+    source = "\"short\" = x01 x02; \"long\" = x01 x02 . x03"
+    for max_latency in [None, 100]:
+        matcher = compile(source, max_latency=max_latency)
+
+        # Nothing continues past a boundary...
+        assert feed_all(matcher, [1], flush=False) == []
+        assert matcher.boundary() == []
+        assert feed_all(matcher, [2, 7, 3], start=1, flush=False) == []
+
+        # ...and the short match is emitted at one, rather than waiting for the long one
+        found = feed_all(matcher, [1, 2, 7], start=4, flush=False)
+        found += [describe(match) for match in matcher.boundary()]
+        assert found == [(4, 5, "short", {})]
+        assert feed_all(matcher, [3], start=7) == []
+
+def test_random_patterns_match_longest_reference():
+    rng = random.Random(2024)
+    for _ in range(30):
+        source = random_pattern_source(rng)
+        data = [rng.choice([0xAA, 0x55, 0x01, 0x02]) for _ in range(300)]
+
+        expected = reference(source, data, longest=True)
+        assert feed_all(compile(source, max_latency=len(data)), data) == expected, source
+        assert feed_all(compile(source, use_automaton=False, max_latency=len(data)), data) == expected, source
+
+def random_pattern_source(rng):
+    def element(depth):
+        kind = rng.choice(["fixed", "fixed", "wild", "class", "capture", "repeat", "group", "alternation"] if depth < 2 else ["fixed", "wild", "class"])
+        if kind == "fixed":
+            return rng.choice(["xAA", "x55", "x01", "x02"])
+        elif kind == "class":
+            return rng.choice(["[x01-x02]", "[xAA x55]", "![xAA]", "![x01-x55]"])
+        elif kind == "wild":
+            return "."
+        elif kind == "capture":
+            return f"c{rng.randrange(3)}:{element(depth + 1)}"
+        elif kind == "repeat":
+            return f"d{rng.randrange(1, 4)}*{element(depth + 1)}"
+        elif kind == "alternation":
+            return "(" + " | ".join(element(depth + 1) + rng.choice(["", " ."]) for _ in range(rng.randrange(2, 4))) + ")"
+        else:
+            return "(" + " ".join(element(depth + 1) for _ in range(rng.randrange(1, 3))) + ")"
+
+    headers = ["xAA x55", "xAA .", ". x01"]
+    statements = []
+    for i in range(rng.randrange(1, 8)):
+        body = " ".join(element(0) for _ in range(rng.randrange(1, 4)))
+        if rng.random() < 0.5:
+            body = rng.choice(headers) + " " + body
+        statements.append(f"\"p{i}\" = {body} ;")
+    return "\n".join(statements)
+
+def reference(source, data, longest=False):
+    """A deliberately naive implementation of the analyzer's matching rules."""
+
+    patterns = Parser(Tokenizer(source).tokenize()).parse()
+    ranks = pattern_ranks(patterns)
+
+    # Find where every pattern would end from every start
+    matches = []
+    for start in range(len(data)):
+        for i, pattern in enumerate(patterns):
+            env = PatternMatchEnvironment()
+            state = None
+            for end in range(start, len(data)):
+                result, state = pattern.match(data[end], state, env)
+                if result == PatternMatchResult.SUCCESS:
+                    matches.append((start, end, ranks[i], patterns[i].name, env.captures))
+                if result != PatternMatchResult.NEED_MORE:
+                    break
+
+    # Choose the earliest-starting match which doesn't overlap the previous one - either the first
+    # to finish, or the longest
+    if longest:
+        key = lambda m: (m[0], -m[1], m[2])
+    else:
+        key = lambda m: (m[1], m[0], m[2])
+
+    results = []
+    last_end = -1
+    while True:
+        viable = [m for m in matches if m[0] > last_end]
+        if not viable:
+            return results
+        start, end, _, name, captures = min(viable, key=key)
+        results.append((start, end, name, captures))
+        last_end = end
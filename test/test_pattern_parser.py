@@ -2,87 +2,87 @@
 
 from ..lib.pattern_parser import *
 from ..lib.pattern_element import *
-from ..lib.errors import InvalidDatumError
+from ..lib.errors import InvalidDatumError, InvalidNameError
 import pytest
 
 def test_parse_sequence():
     assert parse("xAB xCD") == [
         SequencePatternElement([
-            FixedPatternElement(b"\xAB"),
-            FixedPatternElement(b"\xCD"),
+            FixedPatternElement(0xAB),
+            FixedPatternElement(0xCD),
         ]),
     ]
 
 def test_parse_named():
     assert parse("\"foo\" = xAB xCD") == [
         NamePatternElement("foo", SequencePatternElement([
-            FixedPatternElement(b"\xAB"),
-            FixedPatternElement(b"\xCD"),
+            FixedPatternElement(0xAB),
+            FixedPatternElement(0xCD),
         ])),
     ]
 
 def test_parse_multiple():
     assert parse("\"foo\" = xAB xCD ; \"bar\" = xDE x12;") == [
         NamePatternElement("foo", SequencePatternElement([
-            FixedPatternElement(b"\xAB"),
-            FixedPatternElement(b"\xCD"),
+            FixedPatternElement(0xAB),
+            FixedPatternElement(0xCD),
         ])),
         NamePatternElement("bar", SequencePatternElement([
-            FixedPatternElement(b"\xDE"),
-            FixedPatternElement(b"\x12"),
+            FixedPatternElement(0xDE),
+            FixedPatternElement(0x12),
         ])),
     ]
 
 def test_parse_wildcard():
     assert parse("xAB .. xCD") == [
         SequencePatternElement([
-            FixedPatternElement(b"\xAB"),
+            FixedPatternElement(0xAB),
             WildcardPatternElement(),
             WildcardPatternElement(),
-            FixedPatternElement(b"\xCD"),
+            FixedPatternElement(0xCD),
         ]),
     ]
 
 def test_parse_capture():
     assert parse("xAB x:. y:. xCD") == [
         SequencePatternElement([
-            FixedPatternElement(b"\xAB"),
+            FixedPatternElement(0xAB),
             CapturePatternElement("x", WildcardPatternElement()),
             CapturePatternElement("y", WildcardPatternElement()),
-            FixedPatternElement(b"\xCD"),
+            FixedPatternElement(0xCD),
         ]),
     ]
 
 def test_parse_subpattern():
     assert parse("xAB x:(..) xCD") == [
         SequencePatternElement([
-            FixedPatternElement(b"\xAB"),
+            FixedPatternElement(0xAB),
             CapturePatternElement("x", SequencePatternElement([
                 WildcardPatternElement(),
                 WildcardPatternElement(),
             ])),
-            FixedPatternElement(b"\xCD"),
+            FixedPatternElement(0xCD),
         ]),
     ]
 
 def test_parse_number_styles():
     # Hex
-    assert parse("xAB")  == [SequencePatternElement([FixedPatternElement(b"\xAB")])]
-    assert parse("0xAB") == [SequencePatternElement([FixedPatternElement(b"\xAB")])]
-    assert parse("ABx")  == [SequencePatternElement([FixedPatternElement(b"\xAB")])]
+    assert parse("xAB")  == [SequencePatternElement([FixedPatternElement(0xAB)])]
+    assert parse("0xAB") == [SequencePatternElement([FixedPatternElement(0xAB)])]
+    assert parse("ABx")  == [SequencePatternElement([FixedPatternElement(0xAB)])]
 
     # Decimal
-    assert parse("d16")  == [SequencePatternElement([FixedPatternElement(b"\x10")])]
-    assert parse("0d16") == [SequencePatternElement([FixedPatternElement(b"\x10")])]
-    assert parse("16d")  == [SequencePatternElement([FixedPatternElement(b"\x10")])]
+    assert parse("d16")  == [SequencePatternElement([FixedPatternElement(0x10)])]
+    assert parse("0d16") == [SequencePatternElement([FixedPatternElement(0x10)])]
+    assert parse("16d")  == [SequencePatternElement([FixedPatternElement(0x10)])]
 
     # Binary
-    assert parse("b100")  == [SequencePatternElement([FixedPatternElement(b"\x04")])]
-    assert parse("0b100") == [SequencePatternElement([FixedPatternElement(b"\x04")])]
-    assert parse("100b")  == [SequencePatternElement([FixedPatternElement(b"\x04")])]
+    assert parse("b100")  == [SequencePatternElement([FixedPatternElement(0x04)])]
+    assert parse("0b100") == [SequencePatternElement([FixedPatternElement(0x04)])]
+    assert parse("100b")  == [SequencePatternElement([FixedPatternElement(0x04)])]
 
     # Special case - zero doesn't need a base
-    assert parse("0") == [SequencePatternElement([FixedPatternElement(b"\0")])]
+    assert parse("0") == [SequencePatternElement([FixedPatternElement(0)])]
 
     # But other numbers do
     with pytest.raises(InvalidDatumError):
@@ -92,7 +92,7 @@ def test_parse_repeat():
     assert parse("d10*xAA") == [
         SequencePatternElement([
             RepeatPatternElement(
-                pattern_element=FixedPatternElement(b"\xAA"),
+                pattern_element=FixedPatternElement(0xAA),
                 quantity=10,
             )
         ])
@@ -101,14 +101,128 @@ def test_parse_repeat():
         SequencePatternElement([
             RepeatPatternElement(
                 pattern_element=SequencePatternElement([
-                    FixedPatternElement(b"\xAA"),
-                    FixedPatternElement(b"\xBB"),
-                    FixedPatternElement(b"\xCC"),
+                    FixedPatternElement(0xAA),
+                    FixedPatternElement(0xBB),
+                    FixedPatternElement(0xCC),
                 ]),
                 quantity=0x12,
             )
         ])
     ]
 
-def parse(input: str):
-    return Parser(Tokenizer(input).tokenize()).parse()
+def test_parse_counted_repeat():
+    assert parse("n:. n*.") == [
+        SequencePatternElement([
+            CapturePatternElement("n", WildcardPatternElement()),
+            CountedRepeatPatternElement(WildcardPatternElement(), "n", count_length=1),
+        ])
+    ]
+    assert parse("len:(..) len:L-d2*(xAA .)") == [
+        SequencePatternElement([
+            CapturePatternElement("len", SequencePatternElement([WildcardPatternElement(), WildcardPatternElement()])),
+            CountedRepeatPatternElement(SequencePatternElement([FixedPatternElement(0xAA), WildcardPatternElement()]), "len", True, -2, count_length=2),
+        ])
+    ]
+
+    # Captures named like data values don't make their constant repeats into counted ones
+    assert parse("x04:. x04*. x01") == parse("x04:. 4d*. x01") == [
+        SequencePatternElement([
+            CapturePatternElement("x04", WildcardPatternElement()),
+            RepeatPatternElement(WildcardPatternElement(), quantity=4),
+            FixedPatternElement(0x01),
+        ])
+    ]
+    assert parse("d2:. d2*. x01") == parse("d2:. 2d*. x01")
+
+    # Only captures made earlier in the same pattern can be counts
+    with pytest.raises(InvalidDatumError):
+        parse("n:. ; n*.")
+    with pytest.raises(InvalidDatumError):
+        parse("n*. n:.")
+
+def test_parse_alternation():
+    assert parse("xAA (x01 | x02 .)") == [
+        SequencePatternElement([
+            FixedPatternElement(0xAA),
+            AlternationPatternElement([
+                SequencePatternElement([FixedPatternElement(0x01)]),
+                SequencePatternElement([FixedPatternElement(0x02), WildcardPatternElement()]),
+            ]),
+        ])
+    ]
+    assert parse("\"a\" = x01 | x02") == [
+        NamePatternElement("a", AlternationPatternElement([
+            SequencePatternElement([FixedPatternElement(0x01)]),
+            SequencePatternElement([FixedPatternElement(0x02)]),
+        ])),
+    ]
+
+    with pytest.raises(UnexpectedTokenError):
+        parse("(x01 | | x02)")
+    with pytest.raises(UnexpectedTokenError):
+        parse("(x01 |)")
+    with pytest.raises(UnexpectedEndError):
+        parse("x01 |")
+
+    # Names can only use captures which every alternative makes
+    assert parse("\"{x}\" = (x:x01 | x02 x:.)")
+    with pytest.raises(InvalidNameError) as e:
+        parse("\"{x}\" = (x:x01 | x02)")
+    assert "only some alternatives" in e.value.explain()
+
+def test_identical_subpatterns_shared():
+    a, b = parse("\"a\" = xAA crc:(..) d8*. ; \"b\" = xBB crc:(..) d8*. ;")
+    a_body, b_body = a.pattern_element.pattern_elements, b.pattern_element.pattern_elements
+
+    assert a_body[0] is not b_body[0]
+    assert a_body[1] is b_body[1]
+    assert a_body[2] is b_body[2]
+
+    # Names are part of an element's structure
+    c, d = parse("x:. ; y:. ;")
+    assert c.pattern_elements[0] is not d.pattern_elements[0]
+
+def test_invalid_names():
+    with pytest.raises(InvalidNameError) as e:
+        parse("x01 ; \"Bad {x:Q}\" = x:. ;")
+    assert e.value.position == range(6, 17)
+
+    with pytest.raises(InvalidNameError) as e:
+        parse("\"Missing {y}\" = x:. ;")
+    assert "`y`" in e.value.explain()
+
+def test_word_width():
+    assert parse("x1234 d65535", word_width=16) == [SequencePatternElement([FixedPatternElement(0x1234), FixedPatternElement(0xFFFF)])]
+
+    with pytest.raises(InvalidDatumError):
+        parse("x100")
+    with pytest.raises(InvalidDatumError):
+        parse("x10000", word_width=16)
+
+    # Repeats are still limited, however wide words are
+    with pytest.raises(InvalidDatumError):
+        parse("x100*.", word_width=16)
+
+def test_parse_class():
+    assert parse("[x00-x1F x7F x10]") == [SequencePatternElement([ClassPatternElement(((0x00, 0x1F), (0x7F, 0x7F)))])]
+    assert parse("![xAA]") == [SequencePatternElement([ClassPatternElement(((0x00, 0xA9), (0xAB, 0xFF)))])]
+
+    # Negation covers every word of the configured width
+    assert parse("![x0000-x00FF]", word_width=16) == [SequencePatternElement([ClassPatternElement(((0x100, 0xFFFF),))])]
+
+def test_invalid_classes():
+    with pytest.raises(InvalidDatumError):
+        parse("[x1F-x00]")
+    with pytest.raises(InvalidDatumError):
+        parse("[]")
+    with pytest.raises(InvalidDatumError):
+        parse("![x00-xFF]")
+    with pytest.raises(UnexpectedTokenError):
+        parse("[x00 .]")
+    with pytest.raises(UnexpectedTokenError):
+        parse("!x00")
+    with pytest.raises(UnexpectedEndError):
+        parse("[x00")
+
+def parse(input: str, word_width: int = 8):
+    return Parser(Tokenizer(input).tokenize(), word_width).parse()
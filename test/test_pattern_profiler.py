@@ -0,0 +1,100 @@
+# type: ignore
+
+import io
+import json
+import random
+from ..lib.pattern_matcher import PatternMatcher
+from ..lib.pattern_profiler import *
+from ..lib import pattern_profiler
+from ..lib.pattern_parser import Parser
+from ..lib.pattern_tokenizer import Tokenizer
+
+def parse(source):
+    return Parser(Tokenizer(source).tokenize()).parse()
+
+def feed(matcher, data):
+    results = []
+    for i, datum in enumerate(data):
+        match = matcher.feed(datum, i, i)
+        if match is not None:
+            results.append((match.start_time, match.end_time, match.pattern, match.captures))
+    return results
+
+def test_same_matches_as_matcher():
+    source = """
+        "a {x}" = xAA x:. x01;
+        "b" = xAA .. x02;
+        "c {y:s}" = . y:(d3*.) xBB;
+        "d" = xBB xBB;
+        xAA xAA;
+    """
+    rng = random.Random(4321)
+    data = [rng.choice([0xAA, 0xBB, 0x01, 0x02]) for _ in range(2000)]
+
+    assert feed(ProfilingPatternMatcher(parse(source)), data) == feed(PatternMatcher(parse(source)), data)
+
+def test_candidate_cap():
+    # With a single pattern, the cap works just as it does in `PatternMatcher`
+    source = "\"w\" = n:. (n*.) xCC"
+    data = [0x10] * 20 + [0xCC]
+    matcher = ProfilingPatternMatcher(parse(source), max_candidates=3)
+    assert feed(matcher, data) == feed(PatternMatcher(parse(source), max_candidates=3), data)
+    assert matcher.interpreters[0].evictions > 0
+
+def test_counters():
+    matcher = ProfilingPatternMatcher(parse("\"a\" = x01 x02 x03 x04; \"b\" = x02 . x04 x05 x06"), survival_length=3)
+    feed(matcher, [1, 2, 3, 4, 5, 6])
+
+    a, b = matcher.profiles
+    assert (a.index, a.name) == (1, "a")
+    assert (a.spawned, a.survived, a.matched, a.discarded) == (1, 1, 1, 0)
+
+    # "b" was still in flight when "a" matched
+    assert (b.spawned, b.survived, b.matched, b.discarded) == (1, 1, 0, 1)
+
+def test_discarded_completion():
+    matcher = ProfilingPatternMatcher(parse("\"short\" = x02 x03; \"long\" = x01 x02 x03"))
+    feed(matcher, [1, 2, 3])
+
+    short, long = matcher.profiles
+    assert (short.matched, short.discarded) == (0, 1)
+    assert (long.matched, long.discarded) == (1, 0)
+
+def test_longest_discards_held_match():
+    matcher = ProfilingPatternMatcher(parse("\"short\" = x01 x02; \"long\" = x01 x02 x03"), max_latency=10)
+    matches = [match for i, datum in enumerate([1, 2, 3]) for match in matcher.feed_all(datum, i, i)]
+    assert [match.pattern.name for match in matches + matcher.flush()] == ["long"]
+
+    short, long = matcher.profiles
+    assert (short.matched, short.discarded) == (0, 1)
+    assert (long.matched, long.discarded) == (1, 0)
+
+def test_write_profiles():
+    profiles = [PatternProfile(1, "a", spawned=3, matched=1), PatternProfile(2, "")]
+
+    f = io.StringIO()
+    write_profiles(profiles, f, "json")
+    assert json.loads(f.getvalue())[0] == {
+        "index": 1, "name": "a", "spawned": 3, "survived": 0, "matched": 1, "discarded": 0, "seconds": 0.0,
+    }
+
+    f = io.StringIO()
+    write_profiles(profiles, f, "csv")
+    assert f.getvalue().splitlines() == [
+        "index,name,spawned,survived,matched,discarded,seconds",
+        "1,a,3,0,1,0,0.0",
+        "2,,0,0,0,0,0.0",
+    ]
+
+def test_only_latest_writer_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(pattern_profiler, "_live_writers", {})
+    path = str(tmp_path / "profile.json")
+
+    # Logic2 re-creates the analyzer, and so its profile writer, for the same report
+    stale = ProfileWriter([PatternProfile(1, "stale")], path, interval=0)
+    ProfileWriter([PatternProfile(1, "latest")], path, interval=0)
+    write_live_profiles()
+    stale.tick()
+
+    with open(path) as f:
+        assert [profile["name"] for profile in json.load(f)] == ["latest"]
@@ -35,3 +35,56 @@ def test_comments():
         DatumToken(contents="ab", position=range(0, 2)),
         DatumToken(contents="cd", position=range(27, 29)),
     ]
+
+def test_errors():
+    with pytest.raises(UnexpectedCharacterError) as e:
+        Tokenizer("ab ?").tokenize()
+    assert (e.value.char, e.value.position) == ("?", range(3, 3))
+
+    with pytest.raises(UnexpectedCharacterError) as e:
+        Tokenizer("ab /x").tokenize()
+    assert (e.value.char, e.value.position) == ("x", range(3, 4))
+
+    with pytest.raises(UnexpectedEndError):
+        Tokenizer("ab /").tokenize()
+
+def test_all_tokens():
+    assert Tokenizer("\"N {x}\"=a_1:(2*.);//c\n\t0").tokenize() == [
+        QuotedStringToken(contents="N {x}", position=range(0, 7)),
+        EqualsToken(                        position=range(7, 8)),
+        DatumToken(contents="a_1",          position=range(8, 11)),
+        ColonToken(                         position=range(11, 12)),
+        LParenToken(                        position=range(12, 13)),
+        DatumToken(contents="2",            position=range(13, 14)),
+        StarToken(                          position=range(14, 15)),
+        DotToken(                           position=range(15, 16)),
+        RParenToken(                        position=range(16, 17)),
+        SemicolonToken(                     position=range(17, 18)),
+        DatumToken(contents="0",            position=range(23, 24)),
+    ]
+
+def test_identifier_cannot_start_with_underscore():
+    with pytest.raises(UnexpectedCharacterError) as e:
+        Tokenizer("_a").tokenize()
+    assert e.value.char == "_"
+
+def test_class_tokens():
+    assert Tokenizer("![a-b]").tokenize() == [
+        BangToken(                  position=range(0, 1)),
+        LBracketToken(              position=range(1, 2)),
+        DatumToken(contents="a",    position=range(2, 3)),
+        DashToken(                  position=range(3, 4)),
+        DatumToken(contents="b",    position=range(4, 5)),
+        RBracketToken(              position=range(5, 6)),
+    ]
+
+def test_operator_tokens():
+    assert Tokenizer("(a|n+b)").tokenize() == [
+        LParenToken(                position=range(0, 1)),
+        DatumToken(contents="a",    position=range(1, 2)),
+        PipeToken(                  position=range(2, 3)),
+        DatumToken(contents="n",    position=range(3, 4)),
+        PlusToken(                  position=range(4, 5)),
+        DatumToken(contents="b",    position=range(5, 6)),
+        RParenToken(                position=range(6, 7)),
+    ]
@@ -0,0 +1,48 @@
+# type: ignore
+
+from ..lib.prefix_index import *
+
+def test_overlapping_prefixes():
+    index = PrefixIndex()
+    index.add([0xAA, 0x55, 0x01], 1)
+    index.add([0x55, 0x01], 2)
+    index.add([0xAA], 3)
+    index.build()
+
+    assert run(index, [0xAA, 0x55, 0x01, 0xAA, 0xAA]) == [
+        [(3, 1)],
+        [],
+        [(1, 3), (2, 2)],
+        [(3, 1)],
+        [(3, 1)],
+    ]
+
+def test_failure_links():
+    index = PrefixIndex()
+    index.add([0x01, 0x01, 0x02], 1)
+    index.build()
+
+    # After a mismatch on the third datum, the second can still start a match
+    assert run(index, [0x01, 0x01, 0x01, 0x02]) == [[], [], [], [(1, 3)]]
+
+def test_unfinished():
+    index = PrefixIndex()
+    index.add([0x01, 0x02, 0x03], 1)
+    index.add([0x02], 2)
+    index.build()
+
+    # Nodes with nowhere to go next fall back to the unfinished prefixes on their suffix chain
+    nodes = [index.step(PrefixIndex.ROOT, 0x01)]
+    nodes.append(index.step(nodes[-1], 0x02))
+    nodes.append(index.step(nodes[-1], 0x03))
+    assert [index.unfinished[node] for node in nodes] == [1, 2, 0]
+
+    assert index.unfinished[index.step(PrefixIndex.ROOT, 0x02)] == 0
+
+def run(index, data):
+    node = PrefixIndex.ROOT
+    results = []
+    for datum in data:
+        node = index.step(node, datum)
+        results.append(index.outputs[node])
+    return results
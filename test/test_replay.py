@@ -0,0 +1,123 @@
+# type: ignore
+
+import io
+import pytest
+from ..lib.replay import *
+from ..lib.pattern_source import load_patterns
+from ..lib.datum_log import DatumLogWriter
+from ..lib.data_extractor import DATA_BOUNDARY
+
+SERIAL_EXPORT = """name,type,start_time,duration,data
+Async Serial,data,0.0,0.001,0x01
+Async Serial,data,0.002,0.001,0x02
+Async Serial,data,0.004,0.001,0x7F
+Async Serial,data,0.006,0.001,0x03
+"""
+
+SPI_EXPORT = """name,type,start_time,duration,mosi,miso
+SPI,enable,0.0,0.0,,
+SPI,result,0.1,0.1,0x01,0xFF
+SPI,result,0.2,0.1,0x02,0xFF
+SPI,disable,0.3,0.0,,
+"""
+
+I2C_EXPORT = """name,type,start_time,duration,ack,address,read,data
+I2C,start,0.0,0.0,,,,
+I2C,address,0.1,0.1,true,0x50,false,
+I2C,data,0.2,0.1,true,,,0x01
+I2C,stop,0.3,0.0,,,,
+I2C,start,0.4,0.0,,,,
+I2C,address,0.5,0.1,true,0x50,true,
+I2C,data,0.6,0.1,true,,,0x02
+I2C,data,0.7,0.1,true,,,0x01
+I2C,data,0.8,0.1,true,,,0x02
+I2C,stop,0.9,0.0,,,,
+"""
+
+def test_parse_exported_value():
+    assert parse_exported_value("0x41") == b"\x41"
+    assert parse_exported_value("0b1000001") == b"\x41"
+    assert parse_exported_value("65") == b"\x41"
+    assert parse_exported_value("A") == b"\x41"
+    assert parse_exported_value("\\n") == b"\n"
+    assert parse_exported_value("0x0102") == b"\x01\x02"
+
+    with pytest.raises(ValueError):
+        parse_exported_value("nonsense")
+
+def test_read_serial_export():
+    frames = list(read_csv_export(io.StringIO(SERIAL_EXPORT)))
+    assert frames[1] == ReplayFrame("data", 0.002, 0.003, { "data": b"\x02" })
+
+def test_replay_serial():
+    patterns = load_patterns("Text", "\"Got {x:B}\" = x01 x02 x:.")
+    frames = list(replay(read_csv_export(io.StringIO(SERIAL_EXPORT)), "Async Serial", patterns))
+    assert frames == [ReplayFrame("named", 0.0, 0.005, { "text": "Got 127" })]
+
+def test_replay_spi():
+    patterns = load_patterns("Text", "x01 x02")
+    frames = list(replay(read_csv_export(io.StringIO(SPI_EXPORT)), "SPI (use MOSI)", patterns))
+    assert [(f.type, f.start_time) for f in frames] == [("unnamed", 0.1)]
+
+def test_replay_i2c():
+    # The first 0x01 and 0x02 are in different transfers
+    patterns = load_patterns("Text", "x01 x02")
+    frames = list(replay(read_csv_export(io.StringIO(I2C_EXPORT)), "I2C", patterns))
+    assert [(f.type, f.start_time) for f in frames] == [("unnamed", 0.7)]
+
+def test_i2c_datum_log(tmp_path, capsys):
+    # Record the data of an I2C export as the analyzer would, boundaries and all
+    log = tmp_path / "capture.cdlog"
+    with DatumLogWriter(str(log)) as writer:
+        for datum, start_time, end_time in extract_data(read_csv_export(io.StringIO(I2C_EXPORT)), "I2C"):
+            if datum == DATA_BOUNDARY:
+                writer.append_boundary()
+            else:
+                writer.append(datum, start_time, end_time)
+
+    export = tmp_path / "export.csv"
+    export.write_text(I2C_EXPORT)
+    assert main([str(export), "-t", "I2C", "-p", "x01 x02"]) == 0
+    expected = capsys.readouterr().out.splitlines()
+    assert expected == ["type,start_time,end_time,text", "unnamed,0.7,0.9,"]
+
+    # With and without the offline matcher
+    assert main([str(log), "-p", "x01 x02"]) == 0
+    assert capsys.readouterr().out.splitlines() == expected
+    assert main([str(log), "-p", "x01 x02", "--longest", "0"]) == 0
+    assert capsys.readouterr().out.splitlines() == expected
+
+def test_replay_longest():
+    patterns = load_patterns("Text", "\"A\" = x01; \"B\" = x01 x02 .")
+    frames = replay(read_csv_export(io.StringIO(SERIAL_EXPORT)), "Async Serial", patterns, PatternMatcher(patterns, max_latency=16))
+    assert [(f.data["text"], f.start_time, f.end_time) for f in frames] == [("B", 0.0, 0.005)]
+
+def test_main(tmp_path, capsys):
+    export = tmp_path / "export.csv"
+    export.write_text(SERIAL_EXPORT)
+
+    assert main([str(export), "-p", "\"A\" = x7F"]) == 0
+    assert capsys.readouterr().out.splitlines() == [
+        "type,start_time,end_time,text",
+        "named,0.004,0.005,A",
+    ]
+
+    assert main([str(export), "-p", "?"]) == 1
+
+def test_main_datum_log(tmp_path, capsys):
+    log = tmp_path / "capture.cdlog"
+    with DatumLogWriter(str(log)) as writer:
+        for i, datum in enumerate([0x01, 0x7F, 0x02, 0x7F]):
+            writer.append(datum, i * 0.25, i * 0.25 + 0.125)
+
+    expected = [
+        "type,start_time,end_time,text",
+        "named,0.25,0.375,A",
+        "named,0.75,0.875,A",
+    ]
+    assert main([str(log), "-p", "\"A\" = x7F"]) == 0
+    assert capsys.readouterr().out.splitlines() == expected
+
+    # Without the offline matcher
+    assert main([str(log), "-p", "\"A\" = x7F", "--longest", "0"]) == 0
+    assert capsys.readouterr().out.splitlines() == expected
@@ -1,3 +1,7 @@
+class GraphTimeDelta:
+    def __float__(self) -> float: ...
+
 class SaleaeTime:
+    def __sub__(self, other: SaleaeTime) -> GraphTimeDelta: ...
     def __lt__(self, other: SaleaeTime) -> bool: ... 
     def __gt__(self, other: SaleaeTime) -> bool: ... 